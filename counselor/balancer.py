@@ -0,0 +1,163 @@
+import itertools
+import logging
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from threading import Event, Lock
+from typing import Callable, Dict, List, Sequence, Tuple
+
+from counselor.client import ConsulClient
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.health_watcher import HealthyInstanceCache
+from counselor.watcher import Task
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Strategy:
+    """Interface to select an instance for the next call."""
+
+    def select(self, instances: Sequence[ServiceDefinition], outstanding: Dict[str, int]) -> ServiceDefinition:
+        """Return one of the instances. The instances are never empty. Outstanding holds the number of calls in
+        progress per instance key, for the instances that have any."""
+        pass
+
+
+class RoundRobinStrategy(Strategy):
+    """Select the instances one after the other."""
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def select(self, instances: Sequence[ServiceDefinition], outstanding: Dict[str, int]) -> ServiceDefinition:
+        return instances[next(self._counter) % len(instances)]
+
+
+class RandomTwoChoicesStrategy(Strategy):
+    """Select two random instances and take the one with fewer outstanding calls."""
+
+    def select(self, instances: Sequence[ServiceDefinition], outstanding: Dict[str, int]) -> ServiceDefinition:
+        if len(instances) == 1:
+            return instances[0]
+
+        first, second = random.sample(instances, 2)
+        if outstanding.get(second.key, 0) < outstanding.get(first.key, 0):
+            return second
+        return first
+
+
+class LeastOutstandingStrategy(Strategy):
+    """Select the instance with the fewest outstanding calls. Ties are broken by a random start position."""
+
+    def select(self, instances: Sequence[ServiceDefinition], outstanding: Dict[str, int]) -> ServiceDefinition:
+        start = random.randrange(len(instances))
+        selected = instances[start]
+        selected_outstanding = outstanding.get(selected.key, 0)
+        for i in range(1, len(instances)):
+            instance = instances[(start + i) % len(instances)]
+            instance_outstanding = outstanding.get(instance.key, 0)
+            if instance_outstanding < selected_outstanding:
+                selected = instance
+                selected_outstanding = instance_outstanding
+
+        return selected
+
+
+class InstanceRefresherTask(Task):
+    """Periodically searches the services registered with the agent and keeps the result in memory.
+    """
+
+    def __init__(self, consul_client: ConsulClient, query: List[tuple], interval: timedelta, stop_event: Event,
+                 log_interval_seconds=3 * 60 * 60):
+        super().__init__("instance-refresher", interval, stop_event, log_interval_seconds)
+        self.consul_client = consul_client
+        self.query = query
+        self.instances: Tuple[ServiceDefinition, ...] = ()
+
+    def get_instances(self) -> Tuple[ServiceDefinition, ...]:
+        return self.instances
+
+    def check(self):
+        self.log_with_interval("Refreshing instances for {}".format(self.query))
+
+        try:
+            response, services = self.consul_client.service.search(self.query)
+        except Exception as exc:
+            LOGGER.error("Could not refresh instances: {}".format(exc))
+            return
+
+        if not response.successful:
+            LOGGER.error("Failed request to refresh instances: {}".format(response.as_string()))
+            return
+
+        self.instances = tuple(services)
+
+
+class LoadBalancer:
+    """Client side load balancer that selects an instance per call from a set of instances that is refreshed in the
+    background. The instances are read with get_instances on every call, so it should only read from memory, like
+    HealthyInstanceCache.get_healthy_instances or InstanceRefresherTask.get_instances.
+    Use acquire for calls, so that the strategies can take the outstanding calls per instance into account.
+    """
+
+    def __init__(self, get_instances: Callable[[], Sequence[ServiceDefinition]], strategy: Strategy = None,
+                 refresher: Task = None):
+        if strategy is None:
+            strategy = RoundRobinStrategy()
+
+        self.get_instances = get_instances
+        self.strategy = strategy
+        self.refresher = refresher
+        self._outstanding: Dict[str, int] = {}
+        self._lock = Lock()
+
+    @staticmethod
+    def new_with_healthy_instances(cache: HealthyInstanceCache, service_name: str,
+                                   strategy: Strategy = None) -> 'LoadBalancer':
+        cache.watch(service_name)
+        return LoadBalancer(lambda: cache.get_healthy_instances(service_name), strategy)
+
+    @staticmethod
+    def new_with_service_search(consul_client: ConsulClient, query: List[tuple], strategy: Strategy = None,
+                                interval: timedelta = timedelta(seconds=10)) -> 'LoadBalancer':
+        refresher = InstanceRefresherTask(consul_client, query, interval, Event())
+        refresher.check()
+        refresher.start()
+        return LoadBalancer(refresher.get_instances, strategy, refresher)
+
+    def pick(self) -> ServiceDefinition:
+        """Return the instance for the next call, or None if there is no instance.
+        """
+        instances = self.get_instances()
+        if not instances:
+            return None
+        return self.strategy.select(instances, self._outstanding)
+
+    @contextmanager
+    def acquire(self):
+        """Pick an instance and count it as outstanding until the block is left.
+        """
+        instance = self.pick()
+        if instance is None:
+            yield None
+            return
+
+        key = instance.key
+        with self._lock:
+            self._outstanding[key] = self._outstanding.get(key, 0) + 1
+        try:
+            yield instance
+        finally:
+            with self._lock:
+                remaining = self._outstanding.get(key, 1) - 1
+                if remaining > 0:
+                    self._outstanding[key] = remaining
+                else:
+                    self._outstanding.pop(key, None)
+
+    def get_outstanding(self, key: str) -> int:
+        return self._outstanding.get(key, 0)
+
+    def stop(self):
+        if self.refresher is not None:
+            self.refresher.stop()
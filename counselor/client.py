@@ -1,16 +1,24 @@
+from counselor.endpoint.health_endpoint import HealthEndpoint
 from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.endpoint.kv_cache import KVCache
 from counselor.endpoint.kv_endpoint import KVEndpoint
 from counselor.endpoint.service_endpoint import ServiceEndpoint
+from counselor.endpoint.session_endpoint import SessionEndpoint
+from counselor.endpoint.txn_endpoint import TxnEndpoint
 
 
 class ConsulClient(object):
     """Client to use the API.
+    Pass a KVCache to serve repeated KV reads from memory.
     """
 
-    def __init__(self, config=EndpointConfig()):
+    def __init__(self, config=EndpointConfig(), kv_cache: KVCache = None):
         self.config = config
         self._service = ServiceEndpoint(endpoint_config=config, url_parts=["agent"])
-        self._kv = KVEndpoint(endpoint_config=config, url_parts=["kv"])
+        self._kv = KVEndpoint(endpoint_config=config, url_parts=["kv"], cache=kv_cache)
+        self._txn = TxnEndpoint(endpoint_config=config, url_parts=["txn"])
+        self._health = HealthEndpoint(endpoint_config=config, url_parts=["health"])
+        self._session = SessionEndpoint(endpoint_config=config, url_parts=["session"])
 
     @property
     def service(self) -> ServiceEndpoint:
@@ -23,3 +31,21 @@ class ConsulClient(object):
         """Get the key value service instance.
         """
         return self._kv
+
+    @property
+    def txn(self) -> TxnEndpoint:
+        """Get the transaction instance.
+        """
+        return self._txn
+
+    @property
+    def health(self) -> HealthEndpoint:
+        """Get the health instance.
+        """
+        return self._health
+
+    @property
+    def session(self) -> SessionEndpoint:
+        """Get the session instance.
+        """
+        return self._session
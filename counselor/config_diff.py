@@ -0,0 +1,49 @@
+from typing import Dict, Tuple
+
+
+class ConfigDiff:
+    """Key level difference between two configs. Nested dicts are compared recursively, so the keys are tuples with
+    the path to the value, for example ("pool", "size"). A value that changes from or to a dict is a single change.
+    added: key -> new value
+    removed: key -> old value
+    changed: key -> (old value, new value)
+    """
+
+    def __init__(self, added: Dict[Tuple, object] = None, removed: Dict[Tuple, object] = None,
+                 changed: Dict[Tuple, Tuple[object, object]] = None):
+        self.added = added if added is not None else {}
+        self.removed = removed if removed is not None else {}
+        self.changed = changed if changed is not None else {}
+
+    @staticmethod
+    def compute(old_config: dict, new_config: dict) -> 'ConfigDiff':
+        diff = ConfigDiff()
+        diff._compare((), old_config or {}, new_config or {})
+        return diff
+
+    def _compare(self, path: Tuple, old_config: dict, new_config: dict):
+        for key, new_value in new_config.items():
+            key_path = path + (key,)
+            if key not in old_config:
+                self.added[key_path] = new_value
+                continue
+
+            old_value = old_config[key]
+            if isinstance(old_value, dict) and isinstance(new_value, dict):
+                self._compare(key_path, old_value, new_value)
+            elif old_value != new_value or type(old_value) != type(new_value):
+                self.changed[key_path] = (old_value, new_value)
+
+        for key, old_value in old_config.items():
+            if key not in new_config:
+                self.removed[path + (key,)] = old_value
+
+    def is_empty(self) -> bool:
+        return not self.added and not self.removed and not self.changed
+
+    def affected_top_level_keys(self) -> set:
+        """Return the top level keys of the config that have a change below them."""
+        return {key[0] for key in list(self.added) + list(self.removed) + list(self.changed)}
+
+    def as_string(self) -> str:
+        return "added: {} \nremoved: {} \nchanged: {}".format(self.added, self.removed, self.changed)
@@ -0,0 +1,150 @@
+import logging
+import time
+from datetime import timedelta
+from threading import Condition, Lock, Thread
+from typing import Callable
+
+from counselor.kv_watcher import ConfigUpdateListener, DeferredConfigUpdateListener, notify_listener, remember_config
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DebouncedConfigUpdateListener(DeferredConfigUpdateListener):
+    """Wraps a ConfigUpdateListener and coalesces bursts of updates, so that only the latest config is delivered
+    once the burst settles. An update is delivered when no further update arrived for the quiet period, but at the
+    latest max_delay after the first update of the burst. The initial config is delivered right away.
+    A DiffConfigUpdateListener gets the diff between the last delivered config and the latest one.
+
+    The watcher sees every update as accepted, the applied callback tells it when the wrapped listener actually
+    applied a config. If the wrapped listener fails, the config is retried after the quiet period, unless a newer
+    config arrived in the meantime.
+    """
+
+    def __init__(self, listener: ConfigUpdateListener, quiet_period: timedelta = timedelta(seconds=1),
+                 max_delay: timedelta = timedelta(seconds=10)):
+        if max_delay < quiet_period:
+            raise ValueError("max_delay {} is shorter than quiet_period {}".format(max_delay, quiet_period))
+
+        self.listener = listener
+        self.quiet_period = quiet_period.total_seconds()
+        self.max_delay = max_delay.total_seconds()
+        self.last_config = None
+        self._applied_callback = None
+        self._condition = Condition()
+        self._deliver_lock = Lock()
+        self._pending = None
+        self._has_pending = False
+        self._first_update_at = 0.0
+        self._last_update_at = 0.0
+        self._stopped = False
+        self._thread = None
+
+    def get_path(self) -> str:
+        return self.listener.get_path()
+
+    def set_applied_callback(self, callback: Callable[[dict], None]):
+        self._applied_callback = callback
+
+    def on_init(self, config: dict) -> bool:
+        with self._condition:
+            self._has_pending = False
+            self._pending = None
+        return self._deliver(True, config)
+
+    def on_update(self, new_config: dict) -> bool:
+        with self._condition:
+            if self._stopped:
+                return False
+
+            now = time.monotonic()
+            if not self._has_pending:
+                self._first_update_at = now
+            self._pending = new_config
+            self._has_pending = True
+            self._last_update_at = now
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="debounce-" + self.get_path(), daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+        return True
+
+    def has_pending(self) -> bool:
+        return self._has_pending
+
+    def flush(self) -> bool:
+        """Deliver the pending config right away. Return False if the delivery failed."""
+        config = self._take_pending()
+        if config is None:
+            return True
+        return self._deliver_or_retry(config)
+
+    def stop(self, flush=True):
+        """Stop the delivery thread. If flush is set, the pending config is delivered before."""
+        if flush:
+            self.flush()
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_pending(self):
+        with self._condition:
+            if not self._has_pending:
+                return None
+            config = self._pending
+            self._pending = None
+            self._has_pending = False
+            return config
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and not self._has_pending:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                due = min(self._last_update_at + self.quiet_period, self._first_update_at + self.max_delay)
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+
+                config = self._pending
+                self._pending = None
+                self._has_pending = False
+
+            self._deliver_or_retry(config)
+
+    def _deliver_or_retry(self, config: dict) -> bool:
+        if self._deliver(False, config):
+            return True
+
+        LOGGER.error("Reconfiguration of {} was not successful, retrying".format(self.get_path()))
+        with self._condition:
+            if not self._has_pending and not self._stopped:
+                now = time.monotonic()
+                self._pending = config
+                self._has_pending = True
+                self._first_update_at = now
+                self._last_update_at = now
+                self._condition.notify()
+        return False
+
+    def _deliver(self, initial: bool, config: dict) -> bool:
+        with self._deliver_lock:
+            try:
+                successful = notify_listener(self.listener, initial, config, self.last_config)
+            except Exception as exc:
+                LOGGER.error("Listener of {} failed: {}".format(self.get_path(), exc))
+                successful = False
+
+            if successful:
+                self.last_config = remember_config(self.listener, config)
+                if self._applied_callback is not None:
+                    self._applied_callback(config)
+            return successful
@@ -1,16 +1,23 @@
 import logging
 from datetime import timedelta
 from threading import Event
-from typing import List
+from typing import List, Iterator
 
+from counselor.balancer import LoadBalancer, Strategy
 from counselor.client import ConsulClient
+from counselor.dispatcher import ListenerDispatcher
 from counselor.endpoint.common import Response
-from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.entity import ServiceDefinition, KVOperation, KVOperationResult
 from counselor.endpoint.http_endpoint import EndpointConfig
 from counselor.endpoint.kv_endpoint import KVPath
 from counselor.filter import KeyValuePair, Filter, Operators
+from counselor.health_watcher import HealthyInstanceCache
 from counselor.kv_updater import KVUpdater
-from counselor.kv_watcher import KVWatcherTask, ConfigUpdateListener
+from counselor.kv_watcher import KVWatcherTask, ConfigUpdateListener, KVPrefixWatcherTask
+from counselor.lock import ConsulLock, LeaderElectionTask, LeaderListener
+from counselor.scheduler import Scheduler
+from counselor.session_renewer import SessionRenewer
+from counselor.snapshot import ConfigSnapshotStore
 from counselor.trigger import Trigger
 
 LOGGER = logging.getLogger(__name__)
@@ -50,9 +57,13 @@ class ServiceDiscovery:
     fetches the config from Consul KV store. If there is a change in the configuration, the service is notified to reconfigure itself.
     """
 
-    def __init__(self, consul_client: ConsulClient):
+    def __init__(self, consul_client: ConsulClient, scheduler: Scheduler = None,
+                 dispatcher: ListenerDispatcher = None, snapshot_store: ConfigSnapshotStore = None):
         self._consul_client = consul_client
-        self._trigger = Trigger()
+        self._trigger = Trigger(scheduler=scheduler)
+        self._dispatcher = dispatcher
+        self._snapshot_store = snapshot_store
+        self._session_renewer = None
 
     @staticmethod
     def new_service_discovery_with_defaults() -> 'ServiceDiscovery':
@@ -63,8 +74,10 @@ class ServiceDiscovery:
         return ServiceDiscovery.new_service_discovery_with_consul_client(ConsulClient(config))
 
     @staticmethod
-    def new_service_discovery_with_consul_client(client: ConsulClient) -> 'ServiceDiscovery':
-        return ServiceDiscovery(client)
+    def new_service_discovery_with_consul_client(client: ConsulClient, scheduler: Scheduler = None,
+                                                 dispatcher: ListenerDispatcher = None,
+                                                 snapshot_store: ConfigSnapshotStore = None) -> 'ServiceDiscovery':
+        return ServiceDiscovery(client, scheduler=scheduler, dispatcher=dispatcher, snapshot_store=snapshot_store)
 
     @staticmethod
     def new_service_discovery_with_config_details(consul_ip: str = "127.0.0.1",
@@ -100,11 +113,32 @@ class ServiceDiscovery:
 
         return response, result_list
 
+    def iter_config_recursively(self, path: str) -> (Response, Iterator[dict]):
+        """Like fetch_config_recursively, but the configs are streamed one by one instead of loaded into a list.
+        """
+        response, kv_iterator = self._consul_client.kv.get_recursive_stream(path)
+        if not response.successful or kv_iterator is None:
+            return response, iter([])
+
+        return response, (e.value for e in kv_iterator)
+
     def store_config(self, path: str, config: dict) -> Response:
         """Store the config in Consul.
         """
         return self._consul_client.kv.set(path, config)
 
+    def store_configs(self, configs: dict) -> (Response, List[KVOperationResult]):
+        """Store many configs at once, given as dict of path to config. The configs are written in transactions
+        of up to 64 configs, instead of one request per config. There is a result for every config.
+        """
+        operations = [KVOperation.new_set(path, config) for path, config in configs.items()]
+        return self.write_config_batch(operations)
+
+    def write_config_batch(self, operations: List[KVOperation]) -> (Response, List[KVOperationResult]):
+        """Execute a list of set, cas and delete operations with as few transactions as possible.
+        """
+        return self._consul_client.kv.write_batch(operations)
+
     def update_config(self, path: str, config: dict) -> Response:
         """Update the config in Consul.
         """
@@ -144,6 +178,18 @@ class ServiceDiscovery:
 
         return self.store_config(service.compose_config_path(), service.current_config)
 
+    def register_services_and_store_configs(self, services: List[ReconfigurableService]) -> (
+            Response, List[KVOperationResult]):
+        """Register all the services and store their configs in batches. The agent has no bulk registration, so
+        the services are still registered one by one.
+        """
+        for service in services:
+            register_response = self.register_service(service.to_service_definition())
+            if not register_response.successful:
+                return register_response, []
+
+        return self.store_configs({s.compose_config_path(): s.current_config for s in services})
+
     def _update_service_definition(self, service_definition: ServiceDefinition) -> Response:
         return self._consul_client.service.register(service_definition)
 
@@ -170,6 +216,10 @@ class ServiceDiscovery:
         """Search for active ServiceDefinitions.
         """
 
+        return self._consul_client.service.search(self._create_filter_query(tags, meta))
+
+    @staticmethod
+    def _create_filter_query(tags: List[str] = None, meta: List[KeyValuePair] = None) -> List[tuple]:
         if tags is None:
             tags = []
 
@@ -188,32 +238,71 @@ class ServiceDiscovery:
             query_tuple = ('filter', filter_expression)
             filter_tuples.append(query_tuple)
 
-        return self._consul_client.service.search(filter_tuples)
+        return filter_tuples
+
+    def create_load_balancer(self, tags: List[str] = None, meta: List[KeyValuePair] = None,
+                             strategy: Strategy = None,
+                             refresh_interval: timedelta = timedelta(seconds=10)) -> LoadBalancer:
+        """Create a load balancer over the services that match the tags and meta, like search_for_services.
+        The services are searched again every refresh_interval in the background. Stop the balancer when done.
+        """
+        return LoadBalancer.new_with_service_search(self._consul_client, self._create_filter_query(tags, meta),
+                                                    strategy=strategy, interval=refresh_interval)
 
     def add_multiple_config_watches(self, listeners: List[ConfigUpdateListener], check_interval: timedelta,
-                                    stop_event=Event()):
-        """Add a list of config watchers
+                                    stop_event=Event(), blocking_wait: timedelta = None, prefix: str = None):
+        """Add a list of config watchers.
+        If a prefix is given, that all the paths share, for example KVPath.compose_env_prefix(), a single watcher
+        fetches the prefix recursively instead of one watcher per listener.
         """
 
         if listeners is None or len(listeners) == 0:
             return
 
+        if prefix is not None:
+            self.add_prefix_config_watch(prefix, listeners, check_interval=check_interval, stop_event=stop_event,
+                                         blocking_wait=blocking_wait)
+            return
+
         for listener in listeners:
             if listener is None:
                 continue
 
-            self.add_config_watch(listener, check_interval=check_interval, stop_event=stop_event)
+            self.add_config_watch(listener, check_interval=check_interval, stop_event=stop_event,
+                                  blocking_wait=blocking_wait)
 
     def add_config_watch(self, listener: ConfigUpdateListener, check_interval: timedelta,
-                         stop_event=Event()):
+                         stop_event=Event(), blocking_wait: timedelta = None):
         """Create a watcher that periodically checks for config changes.
+        If blocking_wait is set, the watcher uses blocking queries instead of polling every check_interval.
+        If the ServiceDiscovery has a snapshot store, the listener is initialized from it right away.
         """
 
         if listener is None:
             return
 
         LOGGER.info("Adding config watch for {}".format(listener.get_path()))
-        watcher_task = KVWatcherTask(listener, self._consul_client, check_interval, stop_event)
+        watcher_task = KVWatcherTask(listener, self._consul_client, check_interval, stop_event,
+                                     blocking_wait=blocking_wait, dispatcher=self._dispatcher,
+                                     snapshot_store=self._snapshot_store)
+        watcher_task.warm_start()
+        self._trigger.add_task(watcher_task)
+
+    def add_prefix_config_watch(self, prefix: str, listeners: List[ConfigUpdateListener], check_interval: timedelta,
+                                stop_event=Event(), blocking_wait: timedelta = None):
+        """Create a single watcher that checks all the configs below the prefix and notifies the listeners
+        whose config changed.
+        """
+
+        listeners = [listener for listener in listeners if listener is not None]
+        if len(listeners) == 0:
+            return
+
+        LOGGER.info("Adding prefix config watch for {} with {} listeners".format(prefix, len(listeners)))
+        watcher_task = KVPrefixWatcherTask(prefix, listeners, self._consul_client, check_interval, stop_event,
+                                           blocking_wait=blocking_wait, dispatcher=self._dispatcher,
+                                           snapshot_store=self._snapshot_store)
+        watcher_task.warm_start()
         self._trigger.add_task(watcher_task)
 
     def clear_watchers(self):
@@ -248,3 +337,37 @@ class ServiceDiscovery:
 
     def create_kv_updater_for_path(self, config_path: str) -> KVUpdater:
         return KVUpdater(config_path, self._consul_client)
+
+    def create_healthy_instance_cache(self, service_names: List[str] = None,
+                                      blocking_wait: timedelta = timedelta(minutes=1)) -> HealthyInstanceCache:
+        """Create a cache with the healthy instances of the services, that is refreshed in the background.
+        """
+        cache = HealthyInstanceCache(self._consul_client, blocking_wait=blocking_wait)
+        for service_name in service_names or []:
+            cache.watch(service_name)
+        return cache
+
+    def _get_session_renewer(self) -> SessionRenewer:
+        if self._session_renewer is None:
+            self._session_renewer = SessionRenewer(self._consul_client.session)
+        return self._session_renewer
+
+    def create_lock(self, key: str, ttl: timedelta = timedelta(seconds=15),
+                    lock_delay: timedelta = timedelta(seconds=15)) -> ConsulLock:
+        """Create a lock on the key. The sessions of all the locks are renewed on one shared thread.
+        Close the lock when done.
+        """
+        return ConsulLock(self._consul_client, key, ttl=ttl, lock_delay=lock_delay,
+                          renewer=self._get_session_renewer())
+
+    def add_leader_election(self, key: str, listener: LeaderListener, check_interval: timedelta,
+                            stop_event=Event(), blocking_wait: timedelta = timedelta(minutes=1),
+                            ttl: timedelta = timedelta(seconds=15)) -> LeaderElectionTask:
+        """Create a task that campaigns for the leadership of the key and notifies the listener, it is started
+        with the config watches. check_interval is the back off after errors.
+        """
+        LOGGER.info("Adding leader election for {}".format(key))
+        task = LeaderElectionTask(key, listener, self._consul_client, check_interval, stop_event,
+                                  blocking_wait=blocking_wait, ttl=ttl, renewer=self._get_session_renewer())
+        self._trigger.add_task(task)
+        return task
@@ -0,0 +1,172 @@
+import logging
+import time
+from collections import deque
+from threading import Condition, Thread
+from typing import Callable, Dict, Hashable, List
+
+LOGGER = logging.getLogger(__name__)
+
+
+class DispatchStats:
+    """Counters and callback durations of the notifications for one listener."""
+
+    def __init__(self, dispatched: int = 0, coalesced: int = 0, delivered: int = 0, failed: int = 0,
+                 total_seconds: float = 0.0, max_seconds: float = 0.0, max_queued_seconds: float = 0.0):
+        self.dispatched = dispatched
+        self.coalesced = coalesced
+        self.delivered = delivered
+        self.failed = failed
+        self.total_seconds = total_seconds
+        self.max_seconds = max_seconds
+        self.max_queued_seconds = max_queued_seconds
+
+    def copy(self) -> 'DispatchStats':
+        return DispatchStats(self.dispatched, self.coalesced, self.delivered, self.failed, self.total_seconds,
+                             self.max_seconds, self.max_queued_seconds)
+
+    def average_seconds(self) -> float:
+        calls = self.delivered + self.failed
+        return self.total_seconds / calls if calls > 0 else 0.0
+
+    def as_string(self) -> str:
+        return "dispatched: {} \ncoalesced: {} \ndelivered: {} \nfailed: {} \naverage seconds: {} \nmax seconds: {}" \
+            .format(self.dispatched, self.coalesced, self.delivered, self.failed, self.average_seconds(),
+                    self.max_seconds)
+
+
+class _Notification:
+    __slots__ = ("name", "deliver", "initial", "value", "queued_at")
+
+    def __init__(self, name: str, deliver: Callable[[bool, object], bool], initial: bool, value):
+        self.name = name
+        self.deliver = deliver
+        self.initial = initial
+        self.value = value
+        self.queued_at = time.monotonic()
+
+
+class ListenerDispatcher:
+    """Calls the listeners of the watchers on a fixed number of worker threads, so a slow listener does not stall
+    the polling of its watcher or of the other tasks of a shared Scheduler.
+    The notifications of a listener are delivered one after the other, never in parallel. Only the latest
+    notification of a listener is kept while it waits, older ones are dropped. An initial notification stays
+    initial, even if an update replaces its value, so on_init is never skipped. That way the queue holds at most
+    one notification per listener.
+    A failed listener is logged and counted in the stats, the dispatcher does not retry it. deliver reports the
+    failure back to the watcher instead, which delivers the config again on its next check.
+    """
+
+    def __init__(self, workers: int = 4):
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+
+        self.workers = workers
+        self._condition = Condition()
+        self._pending: Dict[Hashable, _Notification] = {}
+        self._ready = deque()
+        self._running = set()
+        self._stats: Dict[str, DispatchStats] = {}
+        self._threads: List[Thread] = []
+        self._stopped = False
+
+    def dispatch(self, key: Hashable, name: str, deliver: Callable[[bool, object], bool], initial: bool, value):
+        """Queue the notification for the listener identified by key. deliver is called with initial and value on
+        a worker thread and returns whether the listener applied the value. The stats are collected by name.
+        """
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Dispatcher is stopped")
+
+            stats = self._stats_for(name)
+            stats.dispatched += 1
+
+            pending = self._pending.get(key)
+            if pending is not None:
+                stats.coalesced += 1
+                pending.deliver = deliver
+                pending.initial = pending.initial or initial
+                pending.value = value
+                return
+
+            self._pending[key] = _Notification(name, deliver, initial, value)
+            if key not in self._running:
+                self._ready.append(key)
+                self._condition.notify()
+
+            if not self._threads:
+                self._start()
+
+    def get_queue_depth(self) -> int:
+        """Return the number of notifications that wait for a worker."""
+        return len(self._pending)
+
+    def get_stats(self) -> Dict[str, DispatchStats]:
+        with self._condition:
+            return {name: stats.copy() for name, stats in self._stats.items()}
+
+    def stop(self):
+        """Deliver the queued notifications and stop the workers."""
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            self._condition.notify_all()
+
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    def _stats_for(self, name: str) -> DispatchStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = DispatchStats()
+            self._stats[name] = stats
+        return stats
+
+    def _start(self):
+        for i in range(self.workers):
+            t = Thread(target=self._work, name="dispatcher-worker-{}".format(i), daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._ready:
+                    if self._stopped and not self._running:
+                        return
+                    self._condition.wait()
+
+                key = self._ready.popleft()
+                notification = self._pending.pop(key)
+                self._running.add(key)
+
+            started_at = time.monotonic()
+            try:
+                successful = notification.deliver(notification.initial, notification.value)
+            except Exception as exc:
+                LOGGER.error("Listener {} failed: {}".format(notification.name, exc))
+                successful = False
+            finished_at = time.monotonic()
+
+            if not successful:
+                LOGGER.error("Reconfiguration of {} was not successful".format(notification.name))
+
+            with self._condition:
+                self._running.discard(key)
+                if key in self._pending:
+                    self._ready.append(key)
+                self._record(notification, successful, started_at, finished_at)
+                self._condition.notify_all()
+
+    def _record(self, notification: _Notification, successful: bool, started_at: float, finished_at: float):
+        stats = self._stats_for(notification.name)
+        if successful:
+            stats.delivered += 1
+        else:
+            stats.failed += 1
+
+        duration = finished_at - started_at
+        stats.total_seconds += duration
+        stats.max_seconds = max(stats.max_seconds, duration)
+        stats.max_queued_seconds = max(stats.max_queued_seconds, started_at - notification.queued_at)
@@ -0,0 +1,220 @@
+import logging
+import time
+from datetime import timedelta
+from threading import Event, Lock, Thread
+from typing import List, Optional, Tuple
+
+from counselor.endpoint.http_client import HttpResponse, HttpStreamResponse
+
+LOGGER = logging.getLogger(__name__)
+
+PROBE_PATH = '/status/leader'
+
+
+class Agent:
+    """State of one Consul agent in the AgentPool, with a base URI like http://10.0.0.1:8500/v1. The latency and
+    the error rate are exponentially weighted moving averages, so recent requests count more than old ones.
+    """
+
+    def __init__(self, base_uri: str):
+        self.base_uri = base_uri
+        self.latency_seconds = 0.0
+        self.error_rate = 0.0
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def is_ejected(self, now: float = None) -> bool:
+        return self.ejected_until > (now if now is not None else time.monotonic())
+
+    def score(self) -> float:
+        """Lower is better. Errors make an agent look slower than it is, so a flaky agent loses against a stable
+        one with a similar latency."""
+        return self.latency_seconds * (1 + 10 * self.error_rate)
+
+    def as_string(self) -> str:
+        return "{}: latency {:.1f} ms, error rate {:.2f}, ejected {}".format(
+            self.base_uri, self.latency_seconds * 1000, self.error_rate, self.is_ejected())
+
+
+class AgentPool:
+    """Tracks the latency and errors of several Consul agents and orders them for the next request.
+    An agent is ejected after max_failures consecutive failures. The ejection lasts ejection_backoff, doubled with
+    every further ejection up to max_ejection_backoff. A background prober checks the ejected agents once their
+    backoff is over and reinstates them if they answer. It also measures the latency of the healthy agents, so the
+    fastest one is known even if it does not get any requests.
+    """
+
+    def __init__(self, base_uris: List[str], max_failures: int = 3,
+                 ejection_backoff: timedelta = timedelta(seconds=1),
+                 max_ejection_backoff: timedelta = timedelta(minutes=1),
+                 probe_interval: timedelta = timedelta(seconds=5), smoothing: float = 0.3):
+        if not base_uris:
+            raise ValueError("At least one agent address is required")
+
+        self.agents = [Agent(base_uri) for base_uri in base_uris]
+        self.max_failures = max_failures
+        self.ejection_backoff = ejection_backoff.total_seconds()
+        self.max_ejection_backoff = max_ejection_backoff.total_seconds()
+        self.probe_interval = probe_interval.total_seconds()
+        self.smoothing = smoothing
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._prober: Optional[Thread] = None
+
+    def get_candidates(self) -> List[Agent]:
+        """Return the healthy agents, fastest first. If all of them are ejected, the agent whose ejection ends
+        first is returned, so requests are never rejected locally."""
+        now = time.monotonic()
+        with self._lock:
+            healthy = [agent for agent in self.agents if not agent.is_ejected(now)]
+            if not healthy:
+                return [min(self.agents, key=lambda agent: agent.ejected_until)]
+            return sorted(healthy, key=Agent.score)
+
+    def record_success(self, agent: Agent, latency_seconds: float = None):
+        with self._lock:
+            if latency_seconds is not None:
+                agent.latency_seconds = self._smooth(agent.latency_seconds, latency_seconds)
+            agent.error_rate = self._smooth(agent.error_rate, 0.0)
+            agent.consecutive_failures = 0
+            if agent.ejections > 0 and not agent.is_ejected():
+                agent.ejections = 0
+                LOGGER.info("Agent {} is healthy again".format(agent.base_uri))
+
+    def record_failure(self, agent: Agent):
+        with self._lock:
+            agent.error_rate = self._smooth(agent.error_rate, 1.0)
+            agent.consecutive_failures += 1
+            if agent.consecutive_failures < self.max_failures or agent.is_ejected():
+                return
+
+            backoff = min(self.ejection_backoff * 2 ** agent.ejections, self.max_ejection_backoff)
+            agent.ejections += 1
+            agent.ejected_until = time.monotonic() + backoff
+            LOGGER.warning("Ejected agent {} for {}s".format(agent.base_uri, backoff))
+
+    def _smooth(self, average: float, value: float) -> float:
+        if average == 0.0:
+            return value
+        return (1 - self.smoothing) * average + self.smoothing * value
+
+    def start_prober(self, transport):
+        """Start the background prober with the transport to send the probes, unless it is already running."""
+        with self._lock:
+            if self._prober is not None or self.probe_interval <= 0:
+                return
+            self._prober = Thread(target=self._probe_loop, args=(transport,), name="agent-prober", daemon=True)
+            self._prober.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._prober is not None and self._prober.is_alive():
+            self._prober.join()
+
+    def probe(self, transport):
+        """Probe every agent that is not ejected or whose ejection is over."""
+        now = time.monotonic()
+        for agent in list(self.agents):
+            if agent.is_ejected(now):
+                continue
+
+            started_at = time.perf_counter()
+            try:
+                response = transport.get(agent.base_uri + PROBE_PATH)
+            except Exception as exc:
+                LOGGER.debug("Probe of {} failed: {}".format(agent.base_uri, exc))
+                self.record_failure(agent)
+                continue
+
+            if response.status_code >= 500:
+                self.record_failure(agent)
+            else:
+                self.record_success(agent, time.perf_counter() - started_at)
+
+    def _probe_loop(self, transport):
+        while not self._stop_event.wait(self.probe_interval):
+            try:
+                self.probe(transport)
+            except Exception as exc:
+                LOGGER.error("Probing the agents failed: {}".format(exc))
+
+
+class FailoverTransport:
+    """Transport that sends the requests to the agents of an AgentPool. The base URI the endpoints build the URIs
+    with, by default the one of the first agent, is replaced with the base URI of the selected agent.
+    Reads are retried on the next agent, if an agent does not answer or answers with a server error. Writes are
+    sent to the best agent without retry, because they are not idempotent, and services registered with an agent
+    belong to that agent.
+    The latency of blocking queries is not recorded, because it depends on the wait time.
+    """
+
+    def __init__(self, transport, pool: AgentPool, base_uri: str = None):
+        self.transport = transport
+        self.pool = pool
+        self._base_uri = base_uri if base_uri is not None else pool.agents[0].base_uri
+
+    def _rewrite(self, uri: str, agent: Agent) -> str:
+        if uri.startswith(self._base_uri):
+            return agent.base_uri + uri[len(self._base_uri):]
+        return uri
+
+    def _read(self, uri: str, send, record_latency=True):
+        self.pool.start_prober(self.transport)
+        candidates = self.pool.get_candidates()
+        last_error: Tuple[Optional[HttpResponse], Optional[Exception]] = (None, None)
+        for agent in candidates:
+            started_at = time.perf_counter()
+            try:
+                response = send(self._rewrite(uri, agent))
+            except Exception as exc:
+                LOGGER.warning("Request to {} failed: {}".format(agent.base_uri, exc))
+                self.pool.record_failure(agent)
+                last_error = (None, exc)
+                continue
+
+            if response.status_code >= 500:
+                self.pool.record_failure(agent)
+                last_error = (response, None)
+                continue
+
+            self.pool.record_success(agent, time.perf_counter() - started_at if record_latency else None)
+            return response
+
+        response, exc = last_error
+        if exc is not None:
+            raise exc
+        return response
+
+    def _write(self, uri: str, send):
+        self.pool.start_prober(self.transport)
+        agent = self.pool.get_candidates()[0]
+        started_at = time.perf_counter()
+        try:
+            response = send(self._rewrite(uri, agent))
+        except Exception:
+            self.pool.record_failure(agent)
+            raise
+
+        if response.status_code >= 500:
+            self.pool.record_failure(agent)
+        else:
+            self.pool.record_success(agent, time.perf_counter() - started_at)
+        return response
+
+    def get(self, uri, wait: timedelta = None) -> HttpResponse:
+        if wait is None:
+            return self._read(uri, lambda agent_uri: self.transport.get(agent_uri))
+        return self._read(uri, lambda agent_uri: self.transport.get(agent_uri, wait=wait), record_latency=False)
+
+    def get_stream(self, uri) -> HttpStreamResponse:
+        return self._read(uri, lambda agent_uri: self.transport.get_stream(agent_uri))
+
+    def post(self, uri, data=None, headers=None) -> HttpResponse:
+        return self._write(uri, lambda agent_uri: self.transport.post(agent_uri, data, headers))
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        return self._write(uri, lambda agent_uri: self.transport.put(agent_uri, data, headers))
+
+    def delete(self, uri) -> HttpResponse:
+        return self._write(uri, lambda agent_uri: self.transport.delete(agent_uri))
@@ -6,11 +6,15 @@ class Response:
     """StatusResponse is used as a standard response to indicate whether a request to Consul was successful or not.
     """
 
-    def __init__(self, successful=True, kind="", message="", exception: Exception = None):
+    def __init__(self, successful=True, kind="", message="", exception: Exception = None, index=0,
+                 last_contact=None, known_leader=None):
         self.successful = successful
         self.kind = kind
         self.message = message
         self.exception = exception
+        self.index = index
+        self.last_contact = last_contact
+        self.known_leader = known_leader
 
     @staticmethod
     def create_successful_result():
@@ -31,9 +35,12 @@ class Response:
     @staticmethod
     def create_from_http_response(response: HttpResponse):
         if response.is_successful():
-            return Response(kind=response.status_code)
+            return Response(kind=response.status_code, index=response.get_consul_index(),
+                            last_contact=response.get_last_contact_ms(), known_leader=response.get_known_leader())
         else:
-            return Response.create_error_result(kind=response.status_code, message=response.payload)
+            return Response(successful=False, kind=response.status_code, message=response.payload,
+                            index=response.get_consul_index(), last_contact=response.get_last_contact_ms(),
+                            known_leader=response.get_known_leader())
 
     def update_by_decode_result(self, decoder: Decoder):
         if not decoder.successful:
@@ -48,3 +55,5 @@ class Response:
 
     class ErrorTypes:
         NotDefined = "NotDefined"
+        CASConflict = "CASConflict"
+        LockConflict = "LockConflict"
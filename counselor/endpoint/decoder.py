@@ -1,10 +1,10 @@
-import base64
+import codecs
 import json
 import logging
-from typing import List
+from typing import List, Iterator, Iterable
 
 from counselor.endpoint.encoder import Encoder
-from counselor.endpoint.entity import ConsulKeyValue, ServiceDefinition
+from counselor.endpoint.entity import ConsulKeyValue, ServiceDefinition, ConsulSession
 
 LOGGER = logging.getLogger(__name__)
 
@@ -61,10 +61,13 @@ class JsonDecoder(Decoder):
 class ConsulKVDecoder(JsonDecoder):
 
     def create_kv_from_json(self, parsed_json):
+        """Create the ConsulKeyValue. The base64 encoded json value is decoded lazily on first access.
+        """
         value = parsed_json.get('Value', {})
+        encoded_value = None
         if isinstance(value, str) or isinstance(value, bytes):
-            decoded_value = base64.b64decode(value)
-            value = json.loads(decoded_value)
+            encoded_value = value
+            value = None
         flags = parsed_json.get('Flags', 0)
         if isinstance(flags, int):
             flags = []
@@ -75,7 +78,9 @@ class ConsulKVDecoder(JsonDecoder):
             flags=flags,
             lock_index=parsed_json.get('LockIndex', 0),
             create_index=parsed_json.get('CreateIndex', 0),
-            modify_index=parsed_json.get('ModifyIndex', 0)
+            modify_index=parsed_json.get('ModifyIndex', 0),
+            encoded_value=encoded_value,
+            session=parsed_json.get('Session')
         )
 
     def decode(self, payload) -> ConsulKeyValue:
@@ -102,6 +107,142 @@ class ConsulKVListDecoder(ConsulKVDecoder):
         return result_list
 
 
+class JsonArrayStreamDecoder(Decoder):
+    """Parse a json array incrementally and yield the items one by one, so that only the current item has to be kept
+    in memory instead of the whole payload. Since the items can not be returned with an error, a ValueError is raised
+    if the payload is not a valid json array.
+    """
+
+    EXPECT_ARRAY = 0
+    EXPECT_ITEM = 1
+    EXPECT_SEPARATOR = 2
+    FINISHED = 3
+
+    def __init__(self):
+        super().__init__()
+        self._json_decoder = json.JSONDecoder()
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        self._state = self.EXPECT_ARRAY
+        self._first_item = True
+
+    def decode_stream(self, chunks: Iterable[bytes]) -> Iterator:
+        for chunk in chunks:
+            for item in self.feed(chunk):
+                yield item
+
+        for item in self.finish():
+            yield item
+
+    def feed(self, chunk: bytes) -> List:
+        """Add the next chunk and return the items that are complete.
+        """
+        self._buffer += self._text_decoder.decode(chunk)
+        return self._parse(final=False)
+
+    def finish(self) -> List:
+        """Return the remaining items and check that the array was complete.
+        """
+        self._buffer += self._text_decoder.decode(b'', final=True)
+        items = self._parse(final=True)
+        if self._state != self.FINISHED or self._buffer.strip():
+            self.set_error_message("Incomplete json array")
+            raise ValueError(self.error_message)
+        return items
+
+    def _fail(self, message: str):
+        self.set_error_message(message)
+        raise ValueError(message)
+
+    def _parse(self, final: bool) -> List:
+        items = []
+        buffer = self._buffer
+        position = 0
+
+        while True:
+            while position < len(buffer) and buffer[position].isspace():
+                position += 1
+            if position >= len(buffer):
+                break
+
+            character = buffer[position]
+            if self._state == self.EXPECT_ARRAY:
+                if character != '[':
+                    self._fail("Expected a json array, got {!r}".format(character))
+                self._state = self.EXPECT_ITEM
+                position += 1
+            elif self._state == self.EXPECT_SEPARATOR:
+                if character == ',':
+                    self._state = self.EXPECT_ITEM
+                elif character == ']':
+                    self._state = self.FINISHED
+                else:
+                    self._fail("Expected , or ] in json array, got {!r}".format(character))
+                position += 1
+            elif self._state == self.EXPECT_ITEM:
+                if character == ']' and self._first_item:
+                    self._state = self.FINISHED
+                    position += 1
+                    continue
+
+                try:
+                    item, end = self._json_decoder.raw_decode(buffer, position)
+                except json.JSONDecodeError as exc:
+                    if final:
+                        self._fail("Could not decode json array item: {}".format(exc))
+                    break
+
+                # A number is only complete, if it is followed by a delimiter, otherwise it might continue in the
+                # next chunk. For example "1." is parsed as 1, but could be the start of "1.5".
+                if not final and not isinstance(item, (dict, list, str)) and (
+                        end == len(buffer) or buffer[end] not in ' \t\r\n,]'):
+                    break
+
+                items.append(item)
+                self._first_item = False
+                self._state = self.EXPECT_SEPARATOR
+                position = end
+            else:
+                self._fail("Unexpected data after json array")
+
+        self._buffer = buffer[position:]
+        return items
+
+
+class ConsulKVStreamDecoder(JsonArrayStreamDecoder):
+    """Decode a recursive KV response incrementally into ConsulKeyValues.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._kv_decoder = ConsulKVDecoder()
+
+    def decode_stream(self, chunks: Iterable[bytes]) -> Iterator[ConsulKeyValue]:
+        for item in super().decode_stream(chunks):
+            yield self._kv_decoder.create_kv_from_json(item)
+
+
+class TxnResultDecoder(ConsulKVDecoder):
+    """Decode the result of a transaction into a list of ConsulKeyValues and a list of (OpIndex, What) errors.
+    """
+
+    def decode(self, payload) -> (List[ConsulKeyValue], List[tuple]):
+        parsed_json = self._parse_json(payload)
+        if not isinstance(parsed_json, dict):
+            return [], []
+
+        result_list = []
+        for e in parsed_json.get('Results') or []:
+            if 'KV' in e:
+                result_list.append(self.create_kv_from_json(e['KV']))
+
+        error_list = []
+        for e in parsed_json.get('Errors') or []:
+            error_list.append((e.get('OpIndex', 0), e.get('What', '')))
+
+        return result_list, error_list
+
+
 class ServiceDefinitionDecoder(JsonDecoder):
     """Decode a single ServiceDefinition.
     """
@@ -128,3 +269,35 @@ class ServiceDefinitionListDecoder(JsonDecoder):
                 result_list.append(Encoder.consul_dict_to_service_definition(e))
 
         return result_list
+
+
+class HealthServiceListDecoder(JsonDecoder):
+    """Decode the instances of a health service query into ServiceDefinitions.
+    """
+
+    def decode(self, payload) -> List[ServiceDefinition]:
+        result_list: List[ServiceDefinition] = []
+        entry_list = self._parse_json(payload)
+        if not isinstance(entry_list, list):
+            return result_list
+
+        for e in entry_list:
+            result_list.append(Encoder.consul_health_dict_to_service_definition(e))
+
+        return result_list
+
+
+class SessionListDecoder(JsonDecoder):
+    """Decode the list of sessions that the session endpoints return, also for a single session.
+    """
+
+    def decode(self, payload) -> List[ConsulSession]:
+        result_list: List[ConsulSession] = []
+        session_list = self._parse_json(payload)
+        if not isinstance(session_list, list):
+            return result_list
+
+        for e in session_list:
+            result_list.append(Encoder.consul_dict_to_session(e))
+
+        return result_list
@@ -1,6 +1,9 @@
+import base64
+import hashlib
+import json
 import logging
 
-from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.entity import ServiceDefinition, KVOperation, ConsulSession
 
 LOGGER = logging.getLogger(__name__)
 
@@ -41,3 +44,62 @@ class Encoder(object):
             consul_response.get('Meta', ''),
             consul_response.get("ContentHash", '')
         )
+
+    @staticmethod
+    def service_definition_hash(service_definition: ServiceDefinition) -> str:
+        """Return a hash of the canonical json encoding of the ServiceDefinition, without its content hash.
+        """
+        consul_dict = Encoder.service_definition_to_consul_dict(service_definition)
+        consul_dict.pop('ContentHash', None)
+        canonical_json = json.dumps(consul_dict, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical_json.encode()).hexdigest()
+
+    @staticmethod
+    def consul_health_dict_to_service_definition(consul_response: dict) -> ServiceDefinition:
+        """Create the ServiceDefinition of a health entry. If the service has no address, the node address is used.
+        """
+        service_definition = Encoder.consul_dict_to_service_definition(consul_response.get('Service') or {})
+        if not service_definition.address:
+            service_definition.address = (consul_response.get('Node') or {}).get('Address', '')
+        return service_definition
+
+    @staticmethod
+    def consul_dict_to_session(consul_response: dict) -> ConsulSession:
+        lock_delay = consul_response.get('LockDelay', '')
+        if isinstance(lock_delay, int):
+            # Consul returns the lock delay in nanoseconds
+            lock_delay = "{}ms".format(lock_delay // 1000000)
+
+        return ConsulSession(
+            consul_response.get('ID', ''),
+            name=consul_response.get('Name', ''),
+            node=consul_response.get('Node', ''),
+            ttl=consul_response.get('TTL', ''),
+            behavior=consul_response.get('Behavior', ConsulSession.RELEASE),
+            lock_delay=lock_delay,
+            create_index=consul_response.get('CreateIndex', 0),
+            modify_index=consul_response.get('ModifyIndex', 0)
+        )
+
+    @staticmethod
+    def kv_operation_to_consul_dict(operation: KVOperation) -> dict:
+        kv = {
+            'Verb': operation.verb,
+            'Key': operation.key.lstrip('/'),
+        }
+
+        if operation.value is not None:
+            value = operation.value
+            if isinstance(value, str):
+                value = value.encode()
+            elif not isinstance(value, bytes):
+                value = json.dumps(value).encode()
+            kv['Value'] = base64.b64encode(value).decode()
+
+        if operation.index is not None:
+            kv['Index'] = operation.index
+
+        if operation.flags is not None:
+            kv['Flags'] = operation.flags
+
+        return {'KV': kv}
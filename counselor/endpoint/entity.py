@@ -1,11 +1,15 @@
+import base64
 import json
 from typing import List
 
 
 class ServiceDefinition:
     """This class holds an internal representation of the Consul structure for a service.
+    It uses slots to keep the memory footprint small, if there are many services.
     """
 
+    __slots__ = ('key', 'address', 'port', 'tags', 'meta', 'content_hash', 'check', 'interval', 'ttl', 'http_check')
+
     def __init__(self, key: str, address=None, port=0, tags=None, meta=None, content_hash=None):
         self.key = key
         self.address = address
@@ -50,25 +54,140 @@ class ServiceDefinition:
         if (self.check or self.http_check) and not self.interval:
             raise ValueError('An interval is required for check scripts and http checks.')
 
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
     def as_json(self) -> str:
-        return json.dumps(self.__dict__)
+        return json.dumps(self.as_dict())
 
 
 class ConsulKeyValue:
     """Key value entry in Consul. The value might be base64 encoded json.
     [{"LockIndex":0,"Key":"test","Flags":0,"Value":"ewogICJmb28iOiAzLjE0MTUKfQ==","CreateIndex":5331,"ModifyIndex":5331}]
+    If the entry is created with the encoded value, it is only decoded on the first access of value, because often
+    only the indices are needed, for example to check whether the entry changed.
+    It uses slots to keep the memory footprint small, if there are many entries.
     """
 
+    __slots__ = ('key', '_value', '_encoded_value', 'flags', 'lock_index', 'create_index', 'modify_index', 'session')
+
     def __init__(self, key: str = "", value: dict = None, flags: List[str] = None, lock_index=0, create_index=0,
-                 modify_index=0):
+                 modify_index=0, encoded_value=None, session: str = None):
         if value is None:
             value = {}
         if flags is None:
             flags = []
 
         self.key = key
-        self.value = value
+        self._value = value
+        self._encoded_value = encoded_value
         self.flags = flags
         self.lock_index = lock_index
         self.create_index = create_index
         self.modify_index = modify_index
+        self.session = session
+
+    @property
+    def value(self) -> dict:
+        encoded_value = self._encoded_value
+        if encoded_value is not None:
+            self._value = json.loads(base64.b64decode(encoded_value))
+            self._encoded_value = None
+        return self._value
+
+    @value.setter
+    def value(self, value: dict):
+        self._value = value
+        self._encoded_value = None
+
+    def is_decoded(self) -> bool:
+        return self._encoded_value is None
+
+
+class ConsulSession:
+    """Session in Consul. A session with a TTL is invalidated, if it is not renewed in time. On invalidation, the locks
+    of the session are released, or the keys are deleted if the behavior is delete.
+    The TTL and the lock delay are kept as the duration strings of Consul, like 15s.
+    """
+
+    __slots__ = ('id', 'name', 'node', 'ttl', 'behavior', 'lock_delay', 'create_index', 'modify_index')
+
+    RELEASE = "release"
+    DELETE = "delete"
+
+    def __init__(self, session_id: str, name: str = "", node: str = "", ttl: str = "", behavior: str = RELEASE,
+                 lock_delay: str = "", create_index=0, modify_index=0):
+        self.id = session_id
+        self.name = name
+        self.node = node
+        self.ttl = ttl
+        self.behavior = behavior
+        self.lock_delay = lock_delay
+        self.create_index = create_index
+        self.modify_index = modify_index
+
+
+class KVOperation:
+    """Single KV operation of a transaction. The verbs that write a value need a value, the cas verbs need the
+    modify index the key must still have for the operation to succeed.
+    """
+
+    SET = "set"
+    CAS = "cas"
+    GET = "get"
+    DELETE = "delete"
+    DELETE_CAS = "delete-cas"
+    DELETE_TREE = "delete-tree"
+
+    def __init__(self, verb: str, key: str, value=None, index: int = None, flags: int = None):
+        self.verb = verb
+        self.key = key
+        self.value = value
+        self.index = index
+        self.flags = flags
+
+    @staticmethod
+    def new_set(key: str, value, flags: int = None) -> 'KVOperation':
+        return KVOperation(KVOperation.SET, key, value=value, flags=flags)
+
+    @staticmethod
+    def new_cas(key: str, value, index: int, flags: int = None) -> 'KVOperation':
+        return KVOperation(KVOperation.CAS, key, value=value, index=index, flags=flags)
+
+    @staticmethod
+    def new_get(key: str) -> 'KVOperation':
+        return KVOperation(KVOperation.GET, key)
+
+    @staticmethod
+    def new_delete(key: str) -> 'KVOperation':
+        return KVOperation(KVOperation.DELETE, key)
+
+    @staticmethod
+    def new_delete_cas(key: str, index: int) -> 'KVOperation':
+        return KVOperation(KVOperation.DELETE_CAS, key, index=index)
+
+    @staticmethod
+    def new_delete_tree(key: str) -> 'KVOperation':
+        return KVOperation(KVOperation.DELETE_TREE, key)
+
+    def has_result(self) -> bool:
+        """Consul only returns a result entry for operations that are not a delete."""
+        return self.verb not in (KVOperation.DELETE, KVOperation.DELETE_CAS, KVOperation.DELETE_TREE)
+
+    def validate(self):
+        if not self.key:
+            raise ValueError('Key can not be empty')
+        if self.verb in (KVOperation.CAS, KVOperation.DELETE_CAS) and self.index is None:
+            raise ValueError('An index is required for {}'.format(self.verb))
+
+
+class KVOperationResult:
+    """Result of a single KVOperation of a transaction.
+    The kv entry is only set for successful operations that are not a delete.
+    """
+
+    def __init__(self, operation: KVOperation, successful=True, error: str = "", kv: ConsulKeyValue = None):
+        self.operation = operation
+        self.successful = successful
+        self.error = error
+        self.kv = kv
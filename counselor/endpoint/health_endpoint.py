@@ -0,0 +1,55 @@
+import logging
+from datetime import timedelta
+from typing import List
+
+from counselor.endpoint.common import Response
+from counselor.endpoint.decoder import HealthServiceListDecoder
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig
+
+LOGGER = logging.getLogger(__name__)
+
+
+class HealthEndpoint(HttpEndpoint):
+    """
+        Health endpoint for Consul. In contrast to the agent service endpoint, it returns the instances of a service
+        in the whole datacenter, together with the state of their checks.
+    """
+
+    supports_consistency_modes = True
+
+    def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str] = None):
+        if url_parts is None:
+            url_parts = ["health"]
+        super().__init__(endpoint_config, url_parts)
+
+    def uri_template(self, url_parts: List[str]) -> str:
+        return self._template_prefix(url_parts[:1] + ['{service}'] if len(url_parts) > 1 else url_parts)
+
+    def service(self, service_name: str, passing=True, tag: str = None, index=0, wait: timedelta = None,
+                consistency: str = None, max_staleness: timedelta = None) -> (Response, List[ServiceDefinition]):
+        """Return the instances of the service. With passing, only the instances whose checks are all passing.
+        If an index is given, it is a blocking query, see KVEndpoint.get, also for the consistency.
+        """
+        query_params = {}
+        if passing:
+            query_params['passing'] = True
+        if tag is not None:
+            query_params['tag'] = tag
+        query_params = self.add_blocking_query_params(query_params, index, wait)
+
+        response = self.get_response(url_parts=['service', service_name], query=query_params,
+                                     wait=wait if index else None, consistency=consistency,
+                                     max_staleness=max_staleness)
+
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = HealthServiceListDecoder()
+        instances = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        return endpoint_response, instances
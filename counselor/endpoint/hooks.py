@@ -0,0 +1,57 @@
+import logging
+import time
+
+LOGGER = logging.getLogger(__name__)
+
+
+class RequestContext:
+    """Details of a single request to Consul, passed to the TransportHooks.
+    uri is the request URI without the ACL token. uri_template is the API path with the keys and service ids elided,
+    like /v1/kv/{key}, so it can be used to group requests. The timing and the response details are filled once the
+    request is done. attributes is free for the hooks, for example to keep a tracing span from before_send to
+    after_receive.
+    """
+
+    def __init__(self, method: str, uri: str, uri_template: str, endpoint: str, request_size: int = 0):
+        self.method = method
+        self.uri = uri
+        self.uri_template = uri_template
+        self.endpoint = endpoint
+        self.request_size = request_size
+        self.start_time = time.time()
+        self.duration_seconds = None
+        self.status_code = None
+        self.response_size = None
+        self.retries = 0
+        self.error = None
+        self.attributes = {}
+
+    def as_string(self) -> str:
+        return "{} {}: {} in {}s, {} retries".format(self.method, self.uri_template, self.status_code,
+                                                       self.duration_seconds, self.retries)
+
+
+class TransportHooks:
+    """Interface to follow the requests to Consul, for example to create tracing spans. Add the hooks to the
+    EndpointConfig. Exceptions raised by the hooks are logged and ignored.
+    """
+
+    def before_send(self, context: RequestContext):
+        """Called before the request is passed to the transport."""
+        pass
+
+    def after_receive(self, context: RequestContext):
+        """Called after a response was received, successful or not."""
+        pass
+
+    def on_error(self, context: RequestContext, error: Exception):
+        """Called if the transport raised an error instead of returning a response."""
+        pass
+
+
+def run_hooks(hooks, method_name: str, *args):
+    for hook in hooks:
+        try:
+            getattr(hook, method_name)(*args)
+        except Exception as exc:
+            LOGGER.error("Hook {}.{} failed: {}".format(type(hook).__name__, method_name, exc))
@@ -1,15 +1,42 @@
 import logging
+from datetime import timedelta
+from typing import Iterator, Callable
 
 from requests import Response, Session
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 LOGGER = logging.getLogger(__name__)
 
 HEADER_KEY_CONTENT_TYPE = 'Content-Type'
 HEADER_KEY_CONSUL_TOKEN = 'X-Consul-Token'
+HEADER_KEY_CONSUL_INDEX = 'X-Consul-Index'
+HEADER_KEY_CONSUL_CONTENT_HASH = 'X-Consul-ContentHash'
+HEADER_KEY_CONSUL_LAST_CONTACT = 'X-Consul-LastContact'
+HEADER_KEY_CONSUL_KNOWN_LEADER = 'X-Consul-KnownLeader'
 
 HEADER_VALUE_CONTENT_FORM = 'application/x-www-form-urlencoded; charset=utf-8'
 HEADER_VALUE_CONTENT_JSON = 'application/json; charset=utf-8'
 
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD'])
+
+
+def _request_body_size(response: Response) -> int:
+    """Return the size of the body that was sent, after the transport encoded it."""
+    request = getattr(response, 'request', None)
+    body = getattr(request, 'body', None)
+    if isinstance(body, (bytes, bytearray, str)):
+        return len(body)
+    return 0
+
+
+def _number_of_retries(response: Response) -> int:
+    """Return how often urllib3 retried the request, before this response was received."""
+    retries = getattr(getattr(response, 'raw', None), 'retries', None)
+    history = getattr(retries, 'history', None)
+    return len(history) if history else 0
+
 
 class HttpResponse(object):
     """Used to process and wrap the responses from Consul.
@@ -17,6 +44,8 @@ class HttpResponse(object):
     status_code = None
     payload = None
     headers = None
+    request_size = None
+    retries = 0
 
     def __init__(self, status_code, body, headers):
         self.status_code = status_code
@@ -25,34 +54,136 @@ class HttpResponse(object):
 
     @staticmethod
     def from_http_response(response: Response) -> 'HttpResponse':
-        return HttpResponse(response.status_code, response.content, response.headers)
+        http_response = HttpResponse(response.status_code, response.content, response.headers)
+        http_response.request_size = _request_body_size(response)
+        http_response.retries = _number_of_retries(response)
+        return http_response
 
     def is_successful(self) -> bool:
         return 200 <= self.status_code < 400
 
+    def get_header(self, key: str, default=None):
+        if self.headers is None:
+            return default
+        return self.headers.get(key, default)
+
+    def get_consul_index(self) -> int:
+        """Return the X-Consul-Index header, which is used for blocking queries, or 0 if it is missing.
+        """
+        try:
+            return int(self.get_header(HEADER_KEY_CONSUL_INDEX, 0))
+        except (TypeError, ValueError):
+            return 0
+
+    def get_last_contact_ms(self):
+        """Return the X-Consul-LastContact header, the milliseconds since the answering server was last in contact
+        with the leader, or None if it is missing. It is 0 if the leader answered.
+        """
+        try:
+            return int(self.get_header(HEADER_KEY_CONSUL_LAST_CONTACT))
+        except (TypeError, ValueError):
+            return None
+
+    def get_known_leader(self):
+        """Return the X-Consul-KnownLeader header as bool, or None if it is missing.
+        """
+        known_leader = self.get_header(HEADER_KEY_CONSUL_KNOWN_LEADER)
+        if known_leader is None:
+            return None
+        return str(known_leader).lower() == 'true'
+
     def as_string(self) -> str:
         return "{}: {}".format(self.status_code, self.payload)
 
 
+class HttpStreamResponse(HttpResponse):
+    """Response whose body is read incrementally in chunks. The body of an unsuccessful response is read completely
+    into the payload. The connection is released, once all the chunks are consumed or close is called.
+    """
+
+    def __init__(self, status_code, headers, chunks: Iterator[bytes], close: Callable = None):
+        super().__init__(status_code, None, headers)
+        self._chunks = chunks
+        self._close = close
+        if not self.is_successful():
+            self.payload = b''.join(chunks)
+            self.close()
+
+    @staticmethod
+    def from_streamed_http_response(response: Response, chunk_size: int) -> 'HttpStreamResponse':
+        stream_response = HttpStreamResponse(response.status_code, response.headers,
+                                             response.iter_content(chunk_size), response.close)
+        stream_response.retries = _number_of_retries(response)
+        return stream_response
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        try:
+            for chunk in self._chunks:
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        if self._close is not None:
+            self._close()
+            self._close = None
+
+
 class HttpRequest(object):
-    """The Request adapter class"""
+    """The Request adapter class.
+    The connection pool holds pool_maxsize connections per host, which should be at least the number of threads that
+    share the transport. Idempotent requests are retried max_retries times with an exponential back off on connection
+    errors and on temporary server errors. The timeouts are split into connect, read and write timeouts. Blocking
+    queries get their own read timeout of the wait time plus the jitter Consul adds, plus the read timeout.
+    If only timeout is given, it is used for all of them.
+    """
 
-    def __init__(self, token=None, timeout=None):
+    def __init__(self, token=None, timeout=None, pool_connections=10, pool_maxsize=10, max_retries=0,
+                 retry_backoff_factor=0.1, connect_timeout=None, read_timeout=None, write_timeout=None):
         self.session = Session()
         if token is not None:
             self.session.headers.setdefault(HEADER_KEY_CONSUL_TOKEN, token)
         self.timeout = timeout
+        self.connect_timeout = connect_timeout if connect_timeout is not None else timeout
+        self.read_timeout = read_timeout if read_timeout is not None else timeout
+        self.write_timeout = write_timeout if write_timeout is not None else self.read_timeout
+
+        retry = Retry(total=max_retries, connect=max_retries, read=max_retries, status=max_retries,
+                      backoff_factor=retry_backoff_factor, status_forcelist=RETRY_STATUS_CODES,
+                      allowed_methods=IDEMPOTENT_METHODS, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
 
     def __del__(self):
         self.session.close()
 
-    def get(self, uri) -> HttpResponse:
+    def _read_timeouts(self, wait: timedelta = None):
+        if wait is None or self.read_timeout is None:
+            return self.connect_timeout, self.read_timeout
+
+        # Consul adds a random jitter of up to wait / 16 to blocking queries
+        wait_seconds = wait.total_seconds()
+        return self.connect_timeout, wait_seconds + wait_seconds / 16 + self.read_timeout
+
+    def _write_timeouts(self):
+        return self.connect_timeout, self.write_timeout
+
+    def get(self, uri, wait: timedelta = None) -> HttpResponse:
         """Send a HTTP get request.
+        If it is a blocking query, pass the wait time to extend the read timeout.
         """
         LOGGER.debug("GET %s", uri)
-        http_response = self.session.get(uri, timeout=self.timeout)
+        http_response = self.session.get(uri, timeout=self._read_timeouts(wait))
         return HttpResponse.from_http_response(http_response)
 
+    def get_stream(self, uri, chunk_size=64 * 1024) -> HttpStreamResponse:
+        """Send a HTTP get request and return the body as stream of chunks.
+        """
+        LOGGER.debug("GET %s (stream)", uri)
+        http_response = self.session.get(uri, timeout=self._read_timeouts(), stream=True)
+        return HttpStreamResponse.from_streamed_http_response(http_response, chunk_size)
+
     def post(self, uri, data=None, headers=None) -> HttpResponse:
         """Send a HTTP post request.
         """
@@ -60,7 +191,8 @@ class HttpRequest(object):
         if headers is None:
             headers = {HEADER_KEY_CONTENT_TYPE: HEADER_VALUE_CONTENT_JSON}
 
-        http_response = self.session.post(uri, data=None, headers=headers, timeout=self.timeout, json=data)
+        http_response = self.session.post(uri, data=None, headers=headers, timeout=self._write_timeouts(),
+                                          json=data)
         return HttpResponse.from_http_response(http_response)
 
     def put(self, uri, data=None, headers=None) -> HttpResponse:
@@ -72,9 +204,11 @@ class HttpRequest(object):
 
         data_type = type(data)
         if data_type == str:
-            http_response = self.session.put(uri, data=data, headers=headers, timeout=self.timeout, json=None)
+            http_response = self.session.put(uri, data=data, headers=headers, timeout=self._write_timeouts(),
+                                             json=None)
         else:
-            http_response = self.session.put(uri, data=None, headers=headers, timeout=self.timeout, json=data)
+            http_response = self.session.put(uri, data=None, headers=headers, timeout=self._write_timeouts(),
+                                             json=data)
 
         return HttpResponse.from_http_response(http_response)
 
@@ -82,5 +216,5 @@ class HttpRequest(object):
         """Send a HTTP delete request.
         """
         LOGGER.debug("DELETE %s", uri)
-        http_response = self.session.delete(uri, timeout=self.timeout)
+        http_response = self.session.delete(uri, timeout=self._write_timeouts())
         return HttpResponse.from_http_response(http_response)
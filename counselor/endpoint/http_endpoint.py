@@ -1,16 +1,43 @@
 import logging
+import time
+from datetime import timedelta
 from typing import List
-from urllib.parse import urlencode
+from urllib.parse import urlencode, parse_qsl
 
+from counselor.endpoint.agent_pool import AgentPool, FailoverTransport
 from counselor.endpoint.common import Response
 from counselor.endpoint.decoder import Decoder
-from counselor.endpoint.http_client import HttpRequest, HttpResponse
+from counselor.endpoint.hooks import RequestContext, TransportHooks, run_hooks
+from counselor.endpoint.http_client import HttpRequest, HttpResponse, HttpStreamResponse
+from counselor.metrics import MetricsRegistry, HttpMetrics
 
 LOGGER = logging.getLogger(__name__)
 
 
+class ConsistencyMode:
+    """Consistency modes of the reads, see https://developer.hashicorp.com/consul/api-docs/features/consistency
+    DEFAULT is answered by the leader, but can be stale in rare cases during a leader election.
+    STALE can be answered by any server, which spreads the reads over the followers, but can be outdated.
+    CONSISTENT is always up to date, for the price of an additional round trip between the servers.
+    """
+    DEFAULT = "default"
+    STALE = "stale"
+    CONSISTENT = "consistent"
+
+
 class EndpointConfig:
     """Config to connect to Consul.
+    If no transport is given, a HttpRequest is created with the pool, retry and timeout settings, see HttpRequest.
+    If a MetricsRegistry is given, the endpoints record the latency, status codes, payload sizes and decode time of
+    their requests in it, see HttpMetrics.
+    The hooks are called around every request, see TransportHooks.
+    If a list of addresses like ["10.0.0.1:8500", "10.0.0.2"] is given, the requests are routed to the fastest
+    healthy agent and reads fail over to the other agents, see AgentPool and FailoverTransport. host and port are
+    then taken from the first address. An AgentPool can also be passed directly, the URIs built with host and port
+    are then routed to its agents. Set a connect_timeout, so that an unreachable agent fails fast.
+    The consistency is the default ConsistencyMode of the KV and health reads. With max_staleness, a stale read
+    whose server was out of contact with the leader for longer, or that does not know a leader, is sent again in
+    the default mode.
     """
 
     def __init__(self,
@@ -20,36 +47,88 @@ class EndpointConfig:
                  datacenter=None,
                  token=None,
                  scheme='http',
-                 transport=None):
+                 transport=None,
+                 pool_connections=10,
+                 pool_maxsize=10,
+                 max_retries=0,
+                 retry_backoff_factor=0.1,
+                 connect_timeout=None,
+                 read_timeout=None,
+                 write_timeout=None,
+                 metrics: MetricsRegistry = None,
+                 hooks: List[TransportHooks] = None,
+                 addresses: List[str] = None,
+                 agent_pool: AgentPool = None,
+                 consistency: str = ConsistencyMode.DEFAULT,
+                 max_staleness: timedelta = None):
+        default_port = port
+        if addresses:
+            host, port = self.parse_address(addresses[0], default_port)
         self.host = host
         self.port = port
         self.version = version
         self.datacenter = datacenter
         self.token = token
         self.scheme = scheme
+        self.consistency = consistency
+        self.max_staleness = max_staleness
         if transport is None:
-            transport = HttpRequest(token=token)
+            transport = HttpRequest(token=token,
+                                    pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize,
+                                    max_retries=max_retries,
+                                    retry_backoff_factor=retry_backoff_factor,
+                                    connect_timeout=connect_timeout,
+                                    read_timeout=read_timeout,
+                                    write_timeout=write_timeout)
+        if addresses and agent_pool is None:
+            agent_pool = AgentPool([self.compose_base_uri(*self.parse_address(address, default_port))
+                                    for address in addresses])
+        if agent_pool is not None:
+            transport = FailoverTransport(transport, agent_pool, self.compose_base_uri())
+        self.agent_pool = agent_pool
         self.transport = transport
+        self.metrics = metrics
+        self.http_metrics = HttpMetrics(metrics) if metrics is not None else None
+        self.hooks = tuple(hooks) if hooks else ()
+
+    @staticmethod
+    def parse_address(address: str, default_port=8500) -> (str, int):
+        """Split an address like 10.0.0.1:8500 into host and port. Without a port, the default port is used.
+        """
+        host, separator, port = address.rpartition(':')
+        if not separator or not port.isdigit():
+            return address, default_port
+        return host, int(port)
 
-    def compose_base_uri(self) -> str:
-        """Return the base URI for API requests.
+    def compose_base_uri(self, host: str = None, port: int = None) -> str:
+        """Return the base URI for API requests, by default for the configured host and port.
         """
+        if host is None:
+            host = self.host
+            port = self.port
 
-        if self.port:
-            return '{0}://{1}:{2}/{3}'.format(self.scheme, self.host, self.port, self.version)
-        return '{0}://{1}/{2}'.format(self.scheme, self.host, self.version)
+        if port:
+            return '{0}://{1}:{2}/{3}'.format(self.scheme, host, port, self.version)
+        return '{0}://{1}/{2}'.format(self.scheme, host, self.version)
 
 
 class HttpEndpoint(object):
     """Base class for API endpoints"""
 
+    # Whether the endpoint is answered by the servers and supports the consistency modes, in contrast to the agent
+    # endpoints, which are answered by the local agent.
+    supports_consistency_modes = False
+
     def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str]):
         """Create a new instance of the Endpoint class
         """
         self._endpoint_config = endpoint_config
         self._base_uri = endpoint_config.compose_base_uri()
+        self._endpoint_name = ''
         if url_parts is not None and len(url_parts) > 0:
-            self._base_uri = '{0}/{1}'.format(self._base_uri, '/'.join(url_parts))
+            self._endpoint_name = '/'.join(url_parts)
+            self._base_uri = '{0}/{1}'.format(self._base_uri, self._endpoint_name)
 
     def build_uri(self, params, query_params=None):
         """Build the request URI
@@ -61,35 +140,198 @@ class HttpEndpoint(object):
         if self._endpoint_config.token:
             query_params['token'] = self._endpoint_config.token
         path = '/'.join(params)
+        uri = '{0}/{1}'.format(self._base_uri, path) if path else self._base_uri
         if query_params:
-            return '{0}/{1}?{2}'.format(self._base_uri, path,
-                                        urlencode(query_params))
-        return '{0}/{1}'.format(self._base_uri, path)
+            return '{0}?{1}'.format(uri, urlencode(query_params))
+        return uri
+
+    @staticmethod
+    def add_blocking_query_params(query_params: dict, index=0, wait: timedelta = None) -> dict:
+        """Add the parameters of a blocking query. Consul holds the request until the X-Consul-Index of the
+        result is greater than the given index, or the wait time is over.
+        """
+        if query_params is None:
+            query_params = {}
+        if index is not None and index > 0:
+            query_params['index'] = index
+            if wait is not None:
+                query_params['wait'] = '{}s'.format(max(1, int(wait.total_seconds())))
+        return query_params
 
-    def get_response(self, url_parts=None, query=None) -> HttpResponse:
+    def get_response(self, url_parts=None, query=None, wait: timedelta = None, consistency: str = None,
+                     max_staleness: timedelta = None) -> HttpResponse:
+        """Send a get request. The wait time of a blocking query is passed to the transport, to extend the read
+        timeout accordingly. The consistency and max_staleness override the ones of the EndpointConfig.
+        A too stale read is retried with the leader without blocking, so a blocking query that returned after its
+        wait time does not wait a second time.
+        """
         if url_parts is None:
             url_parts = []
 
-        uri = self.build_uri(url_parts, query)
-        return self._endpoint_config.transport.get(uri)
+        transport = self._endpoint_config.transport
+        consistency, max_staleness = self._consistency(consistency, max_staleness)
+        uri = self.build_uri(url_parts, self._add_consistency_param(query, consistency))
+        if wait is None:
+            response = self._send('GET', url_parts, uri, lambda: transport.get(uri))
+        else:
+            response = self._send('GET', url_parts, uri, lambda: transport.get(uri, wait=wait))
+
+        if not self._is_too_stale(response, consistency, max_staleness):
+            return response
+
+        uri = self.build_uri(url_parts, self._add_consistency_param(self._without_blocking_params(query),
+                                                                    ConsistencyMode.DEFAULT))
+        return self._send('GET', url_parts, uri, lambda: transport.get(uri))
+
+    def get_stream_response(self, url_parts=None, query=None, consistency: str = None,
+                            max_staleness: timedelta = None) -> HttpStreamResponse:
+        """Send a get request and read the body incrementally. The metrics only cover the time until the headers
+        are received.
+        """
+        if url_parts is None:
+            url_parts = []
+
+        transport = self._endpoint_config.transport
+        consistency, max_staleness = self._consistency(consistency, max_staleness)
+        uri = self.build_uri(url_parts, self._add_consistency_param(query, consistency))
+        response = self._send('GET', url_parts, uri, lambda: transport.get_stream(uri))
+        if not self._is_too_stale(response, consistency, max_staleness):
+            return response
+
+        response.close()
+        uri = self.build_uri(url_parts, self._add_consistency_param(query, ConsistencyMode.DEFAULT))
+        return self._send('GET', url_parts, uri, lambda: transport.get_stream(uri))
+
+    def _consistency(self, consistency: str, max_staleness: timedelta) -> (str, timedelta):
+        if not self.supports_consistency_modes:
+            return ConsistencyMode.DEFAULT, None
+        if consistency is None:
+            consistency = self._endpoint_config.consistency
+        if max_staleness is None:
+            max_staleness = self._endpoint_config.max_staleness
+        return consistency, max_staleness
+
+    @staticmethod
+    def _add_consistency_param(query, consistency: str):
+        if consistency is None or consistency == ConsistencyMode.DEFAULT:
+            return query
+        if consistency not in (ConsistencyMode.STALE, ConsistencyMode.CONSISTENT):
+            raise ValueError("Unknown consistency mode {}".format(consistency))
+
+        query = dict(query) if query else {}
+        query[consistency] = ''
+        return query
+
+    @staticmethod
+    def _without_blocking_params(query):
+        if not query:
+            return query
+        return {key: value for key, value in query.items() if key not in ('index', 'wait')}
+
+    @staticmethod
+    def _is_too_stale(response: HttpResponse, consistency: str, max_staleness: timedelta) -> bool:
+        if consistency != ConsistencyMode.STALE or max_staleness is None or response.status_code >= 500:
+            return False
+
+        if response.get_known_leader() is False:
+            LOGGER.info("Stale read without a known leader, retrying with the leader")
+            return True
+
+        last_contact_ms = response.get_last_contact_ms()
+        if last_contact_ms is not None and last_contact_ms > max_staleness.total_seconds() * 1000:
+            LOGGER.info("Stale read is {} ms old, retrying with the leader".format(last_contact_ms))
+            return True
+        return False
 
     def post_response(self, url_parts, query=None, payload=None) -> HttpResponse:
         if url_parts is None:
             url_parts = []
 
-        return self._endpoint_config.transport.post(self.build_uri(url_parts, query), payload)
+        uri = self.build_uri(url_parts, query)
+        transport = self._endpoint_config.transport
+        return self._send('POST', url_parts, uri, lambda: transport.post(uri, payload), payload)
 
     def put_response(self, url_parts, query=None, payload=None) -> HttpResponse:
         if url_parts is None:
             url_parts = []
 
-        return self._endpoint_config.transport.put(self.build_uri(url_parts, query), payload)
+        uri = self.build_uri(url_parts, query)
+        transport = self._endpoint_config.transport
+        return self._send('PUT', url_parts, uri, lambda: transport.put(uri, payload), payload)
 
     def delete_response(self, url_parts, query=None) -> HttpResponse:
         if url_parts is None:
             url_parts = []
 
-        return self._endpoint_config.transport.delete(self.build_uri(url_parts, query))
+        uri = self.build_uri(url_parts, query)
+        return self._send('DELETE', url_parts, uri, lambda: self._endpoint_config.transport.delete(uri))
+
+    def _send(self, method: str, url_parts: List[str], uri: str, send, payload=None) -> HttpResponse:
+        """Call the transport, record the metrics of the request and run the hooks, if enabled.
+        """
+        http_metrics = self._endpoint_config.http_metrics
+        hooks = self._endpoint_config.hooks
+        if http_metrics is None and not hooks:
+            return send()
+
+        context = None
+        if hooks:
+            context = RequestContext(method, _without_token(uri), self.uri_template(url_parts), self._endpoint_name,
+                                     _payload_size(payload))
+            run_hooks(hooks, 'before_send', context)
+
+        started_at = time.perf_counter()
+        try:
+            response = send()
+        except Exception as exc:
+            duration = time.perf_counter() - started_at
+            if http_metrics is not None:
+                http_metrics.observe_error(self._endpoint_name, method, duration)
+            if context is not None:
+                context.duration_seconds = duration
+                context.error = exc
+                run_hooks(hooks, 'on_error', context, exc)
+            raise
+
+        duration = time.perf_counter() - started_at
+        sent_bytes = response.request_size
+        if sent_bytes is None:
+            sent_bytes = _payload_size(payload)
+        received_bytes = _payload_size(response.payload)
+        if http_metrics is not None:
+            http_metrics.observe_response(self._endpoint_name, method, response.status_code, duration, sent_bytes,
+                                          received_bytes)
+        if context is not None:
+            context.duration_seconds = duration
+            context.status_code = response.status_code
+            context.request_size = sent_bytes
+            context.response_size = received_bytes
+            context.retries = response.retries
+            run_hooks(hooks, 'after_receive', context)
+        return response
+
+    def uri_template(self, url_parts: List[str]) -> str:
+        """Return the path of the request with the keys elided, to group the requests in traces. Endpoints whose
+        url parts contain keys or ids override this.
+        """
+        return self._template_prefix(url_parts)
+
+    def _template_prefix(self, url_parts: List[str]) -> str:
+        parts = [self._endpoint_config.version, self._endpoint_name] + list(url_parts)
+        return '/' + '/'.join(part for part in parts if part)
+
+    def _decode(self, decoder: Decoder, payload):
+        """Decode the payload and record the decode time, if metrics are enabled.
+        """
+        http_metrics = self._endpoint_config.http_metrics
+        if http_metrics is None:
+            return decoder.decode(payload)
+
+        started_at = time.perf_counter()
+        try:
+            return decoder.decode(payload)
+        finally:
+            http_metrics.observe_decode(self._endpoint_name, type(decoder).__name__, time.perf_counter() - started_at)
 
     @staticmethod
     def decode_response(response: HttpResponse, decoder: Decoder):
@@ -102,3 +344,20 @@ class HttpEndpoint(object):
             endpoint_response.update_by_decode_result(decoder)
 
         return endpoint_response, result
+
+
+def _payload_size(payload) -> int:
+    """Return the size of a payload that is sent or received as is. Encoded payloads are counted by the transport,
+    see HttpResponse.request_size."""
+    if isinstance(payload, (bytes, bytearray, str)):
+        return len(payload)
+    return 0
+
+
+def _without_token(uri: str) -> str:
+    """Remove the ACL token from the query of the URI, so it is not passed to the hooks."""
+    base, separator, query = uri.partition('?')
+    if not separator or 'token=' not in query:
+        return uri
+    params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True) if key != 'token']
+    return '{0}?{1}'.format(base, urlencode(params)) if params else base
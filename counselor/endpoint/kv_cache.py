@@ -0,0 +1,101 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from threading import Lock
+
+LOGGER = logging.getLogger(__name__)
+
+
+class KVCache:
+    """In-process read-through cache for the KVEndpoint.
+    The entries expire after the ttl and the least recently used entry is evicted, once max_entries is reached.
+    The KVEndpoint invalidates the entries of a path when it is changed through the same client. Changes by other
+    clients are visible after the ttl at the latest. By default the cached values are copied when they are returned,
+    so that callers can modify them without changing the cache.
+    """
+
+    RAW = "raw"
+    KV = "kv"
+
+    def __init__(self, max_entries: int = 1024, ttl: timedelta = timedelta(seconds=10), copy_values=True):
+        if max_entries < 1:
+            raise ValueError("Max entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl.total_seconds()
+        self.copy_values = copy_values
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return path.strip('/')
+
+    def get(self, kind: str, path: str):
+        """Return a tuple (found, response, value) for the path.
+        """
+        key = (kind, self._normalize(path))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None, None
+
+            expires_at, response, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return False, None, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        if self.copy_values:
+            return True, copy.copy(response), copy.deepcopy(value)
+        return True, response, value
+
+    def put(self, kind: str, path: str, response, value):
+        if self.copy_values:
+            value = copy.deepcopy(value)
+
+        key = (kind, self._normalize(path))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, path: str):
+        """Remove the cached entries of the path.
+        """
+        path = self._normalize(path)
+        with self._lock:
+            self._entries.pop((self.RAW, path), None)
+            self._entries.pop((self.KV, path), None)
+
+    def invalidate_prefix(self, prefix: str):
+        """Remove the cached entries of all paths that start with the prefix.
+        """
+        prefix = self._normalize(prefix)
+        with self._lock:
+            for key in [k for k in self._entries.keys() if k[1].startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def size(self) -> int:
+        return len(self._entries)
+
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return self.hits / total
@@ -1,11 +1,18 @@
 import logging
-from typing import List
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Iterator
 
 from counselor.endpoint.common import Response
-from counselor.endpoint.decoder import JsonDecoder, ConsulKVDecoder, ConsulKVListDecoder
-from counselor.endpoint.entity import ConsulKeyValue
+from counselor.endpoint.decoder import JsonDecoder, ConsulKVDecoder, ConsulKVListDecoder, ConsulKVStreamDecoder
+from counselor.endpoint.entity import ConsulKeyValue, KVOperation, KVOperationResult
 from counselor.endpoint.http_client import HttpResponse
-from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig
+from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig, ConsistencyMode
+from counselor.endpoint.kv_cache import KVCache
+from counselor.endpoint.txn_endpoint import TxnEndpoint, MAX_OPERATIONS_PER_TRANSACTION
 
 LOGGER = logging.getLogger(__name__)
 
@@ -33,70 +40,263 @@ class KVPath:
     def compose_path(self) -> str:
         return "{}/{}/{}/{}/{}".format(self.project, self.env, self.domain, self.service, self.detail)
 
+    def compose_env_prefix(self) -> str:
+        """Return the prefix that all the paths of the same project and env share.
+        """
+        return "{}/{}/".format(self.project, self.env)
+
 
 class KVEndpoint(HttpEndpoint):
     """Key value store interface to consul. This class is meant to store dicts as values.
+    If a KVCache is given, get and get_raw are served from the cache, unless it is a blocking query or cached is
+    set to False. Every successful read refreshes the cache and every write through this endpoint invalidates it.
 
         TODO: use StatusResponse as returned value
     """
 
-    def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str]):
+    supports_consistency_modes = True
+
+    def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str], cache: KVCache = None):
         if url_parts is None:
             url_parts = ["kv"]
         super().__init__(endpoint_config, url_parts)
+        self.cache = cache
+        self._txn = TxnEndpoint(endpoint_config)
+
+    def uri_template(self, url_parts: List[str]) -> str:
+        if url_parts:
+            return self._template_prefix(['{key}'])
+        return self._template_prefix([])
+
+    def _get_cached(self, kind: str, path: str, index: int, cached: bool):
+        if self.cache is None or not cached or index or not path:
+            return False, None, None
+        return self.cache.get(kind, path)
+
+    def _uses_cache(self, consistency: str, max_staleness: timedelta) -> bool:
+        """The cache does not know how old its entries are in Consul, so it is neither read nor filled, if the read
+        asks for a consistency mode or a staleness bound."""
+        consistency, max_staleness = self._consistency(consistency, max_staleness)
+        return consistency == ConsistencyMode.DEFAULT and max_staleness is None
+
+    def _put_cached(self, kind: str, path: str, response: Response, value):
+        if self.cache is not None and response.successful:
+            self.cache.put(kind, path, response, value)
+
+    def _invalidate_cached(self, path: str, recurse=False):
+        if self.cache is None:
+            return
+        if recurse:
+            self.cache.invalidate_prefix(path)
+        else:
+            self.cache.invalidate(path)
+
+    def get_raw(self, path, index=0, wait: timedelta = None, cached=True, consistency: str = None,
+                max_staleness: timedelta = None) -> (Response, dict):
+        """Return the raw config as dict, without the Consul specific fields.
+        If an index is given, it is a blocking query, see get.
+        """
+        uses_cache = self._uses_cache(consistency, max_staleness)
+        found, cached_response, cached_config = self._get_cached(KVCache.RAW, path, index, cached and uses_cache)
+        if found:
+            return cached_response, cached_config
 
-    def get_raw(self, path) -> (Response, dict):
-        """Return the raw config as dict, without the Consul specific fields."""
-        query_params = {'raw': True}
+        query_params = self.add_blocking_query_params({'raw': True}, index, wait)
 
-        response = self._get(path=path, query_params=query_params)
+        response = self._get(path=path, query_params=query_params, wait=wait, consistency=consistency,
+                             max_staleness=max_staleness)
 
         endpoint_response = Response.create_from_http_response(response)
         if not endpoint_response.successful:
             return endpoint_response, None
 
         decoder = JsonDecoder()
-        result = decoder.decode(response.payload)
+        result = self._decode(decoder, response.payload)
         if not decoder.successful:
             endpoint_response.update_by_decode_result(decoder)
+        elif uses_cache:
+            self._put_cached(KVCache.RAW, path, endpoint_response, result)
 
         return endpoint_response, result
 
-    def get(self, path) -> (Response, ConsulKeyValue):
+    def get(self, path, index=0, wait: timedelta = None, cached=True, consistency: str = None,
+            max_staleness: timedelta = None) -> (Response, ConsulKeyValue):
         """Get a value.
         Raw means without the Consul metadata like CreateIndex and ModifyIndex.
+        If an index greater than 0 is given, it is a blocking query that returns as soon as the X-Consul-Index
+        is greater than the index, or the wait time is over. The X-Consul-Index is returned as Response.index.
+        The consistency is one of the ConsistencyModes, by default the one of the EndpointConfig. A stale read
+        whose server lost contact with the leader for longer than max_staleness is sent again to the leader.
         """
-        response = self._get(path=path)
+        uses_cache = self._uses_cache(consistency, max_staleness)
+        found, cached_response, cached_kv = self._get_cached(KVCache.KV, path, index, cached and uses_cache)
+        if found:
+            return cached_response, cached_kv
+
+        response = self._get(path=path, query_params=self.add_blocking_query_params({}, index, wait), wait=wait,
+                             consistency=consistency, max_staleness=max_staleness)
 
         endpoint_response = Response.create_from_http_response(response)
         if not endpoint_response.successful:
             return endpoint_response, None
 
         decoder = ConsulKVDecoder()
-        consul_kv = decoder.decode(response.payload)
+        consul_kv = self._decode(decoder, response.payload)
         if not decoder.successful:
             endpoint_response.update_by_decode_result(decoder)
+        elif uses_cache:
+            self._put_cached(KVCache.KV, path, endpoint_response, consul_kv)
 
         return endpoint_response, consul_kv
 
-    def get_recursive(self, path) -> (Response, List[ConsulKeyValue]):
-        """Return an array of all the entries from the path downwards"""
-        query_params = {'recurse': True}
+    def get_recursive(self, path, index=0, wait: timedelta = None, consistency: str = None,
+                      max_staleness: timedelta = None) -> (Response, List[ConsulKeyValue]):
+        """Return an array of all the entries from the path downwards.
+        If an index is given, it is a blocking query, see get.
+        """
+        query_params = self.add_blocking_query_params({'recurse': True}, index, wait)
 
-        response = self._get(path=path, query_params=query_params)
+        response = self._get(path=path, query_params=query_params, wait=wait, consistency=consistency,
+                             max_staleness=max_staleness)
 
         endpoint_response = Response.create_from_http_response(response)
         if not endpoint_response.successful:
             return endpoint_response, None
 
         decoder = ConsulKVListDecoder()
-        result_list = decoder.decode(response.payload)
+        result_list = self._decode(decoder, response.payload)
         if not decoder.successful:
             endpoint_response.update_by_decode_result(decoder)
 
         return endpoint_response, result_list
 
-    def _get(self, path: str, query_params=None) -> HttpResponse:
+    def get_recursive_stream(self, path, consistency: str = None,
+                             max_staleness: timedelta = None) -> (Response, Iterator[ConsulKeyValue]):
+        """Return an iterator over all the entries from the path downwards. The response body is read and decoded
+        incrementally, so the memory does not grow with the number of entries. The iterator raises a ValueError if
+        the response can not be decoded. Consume the iterator completely or close it to release the connection.
+        """
+        if path is None or path == "":
+            return Response.create_error_result(kind=500, message="Path can not be empty"), None
+
+        response = self.get_stream_response(url_parts=[path.lstrip('/')], query={'recurse': True},
+                                            consistency=consistency, max_staleness=max_staleness)
+
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = ConsulKVStreamDecoder()
+        return endpoint_response, decoder.decode_stream(response.iter_chunks())
+
+    def get_keys(self, path: str, separator: str = None, consistency: str = None,
+                 max_staleness: timedelta = None) -> (Response, List[str]):
+        """Return the keys from the path downwards, without the values.
+        With a separator, only the keys up to the next separator are returned, for example with "/" the direct
+        children of a folder. Sub folders are returned with the trailing separator.
+        """
+        query_params = {'keys': True}
+        if separator is not None:
+            query_params['separator'] = separator
+
+        response = self._get(path=path, query_params=query_params, consistency=consistency,
+                             max_staleness=max_staleness)
+
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = JsonDecoder()
+        keys = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        return endpoint_response, keys
+
+    def get_many(self, keys: List[str]) -> (Response, List[ConsulKeyValue]):
+        """Fetch the entries of up to 64 keys with a single transaction. Keys that do not exist are skipped.
+        """
+        response, results = self._txn.execute([KVOperation.new_get(key) for key in keys])
+        if response.successful:
+            return response, [r.kv for r in results]
+
+        # A transaction fails completely, if a single key was deleted in the meantime
+        LOGGER.debug("Could not fetch keys with a transaction, fetching them one by one: {}".format(response.message))
+        entries = []
+        for key in keys:
+            response, entry = self.get(key, cached=False)
+            if response.successful:
+                entries.append(entry)
+            elif response.kind != 404:
+                return response, None
+
+        return Response.create_successful_result(), entries
+
+    def walk(self, path: str, separator: str = "/", batch_size: int = MAX_OPERATIONS_PER_TRANSACTION,
+             max_workers: int = 4) -> (Response, Iterator[ConsulKeyValue]):
+        """Return an iterator over all the entries from the path downwards, for namespaces that are too big for
+        get_recursive. The tree is listed folder by folder without the values, and the values are fetched in
+        batches of batch_size keys by max_workers threads in parallel. At most two batches per worker are in flight,
+        so the memory is bounded by the batch size and the size of a single folder listing.
+        The first listing is done right away. If a later request fails, the iterator raises a RuntimeError.
+        """
+        if not 0 < batch_size <= MAX_OPERATIONS_PER_TRANSACTION:
+            raise ValueError("Batch size has to be between 1 and {}".format(MAX_OPERATIONS_PER_TRANSACTION))
+
+        response, keys = self.get_keys(path, separator)
+        if not response.successful:
+            return response, None
+
+        return response, self._walk(path.lstrip('/'), keys, separator, batch_size, max_workers)
+
+    def _walk(self, folder: str, keys: List[str], separator: str, batch_size: int,
+              max_workers: int) -> Iterator[ConsulKeyValue]:
+        pending_folders = []
+        batch = []
+        futures = deque()
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        def fetch_completed(limit: int):
+            while len(futures) > limit:
+                response, entries = futures.popleft().result()
+                if not response.successful:
+                    raise RuntimeError("Could not fetch entries: {}".format(response.as_string()))
+                for e in entries:
+                    yield e
+
+        try:
+            while True:
+                for key in keys:
+                    # The listing of a folder contains the folder itself, if there is a key with that name
+                    if key.endswith(separator) and key != folder:
+                        pending_folders.append(key)
+                        continue
+
+                    batch.append(key)
+                    if len(batch) == batch_size:
+                        futures.append(executor.submit(self.get_many, batch))
+                        batch = []
+                        yield from fetch_completed(2 * max_workers)
+
+                if not pending_folders:
+                    break
+
+                folder = pending_folders.pop()
+                response, keys = self.get_keys(folder, separator)
+                if response.kind == 404:
+                    keys = []
+                elif not response.successful:
+                    raise RuntimeError("Could not list keys of {}: {}".format(folder, response.as_string()))
+
+            if batch:
+                futures.append(executor.submit(self.get_many, batch))
+            yield from fetch_completed(0)
+        finally:
+            executor.shutdown(wait=True)
+
+    def _get(self, path: str, query_params=None, wait: timedelta = None, consistency: str = None,
+             max_staleness: timedelta = None) -> HttpResponse:
         if path is None or path == "":
             return HttpResponse(status_code=500, body="Path can not be empty", headers=None)
 
@@ -104,35 +304,129 @@ class KVEndpoint(HttpEndpoint):
             query_params = {}
 
         path = path.lstrip('/')
-        return self.get_response(url_parts=[path], query=query_params)
+        if 'index' not in query_params:
+            wait = None
+        return self.get_response(url_parts=[path], query=query_params, wait=wait, consistency=consistency,
+                                 max_staleness=max_staleness)
 
-    def set(self, path: str, value, flags=None) -> Response:
+    def set(self, path: str, value, flags=None, cas: int = None) -> Response:
         """Set a value.
+        If cas is given, the value is only set if the modify index of the key is still cas. With cas 0 the value is
+        only set if the key does not exist yet. Otherwise the response is not successful with kind CASConflict.
         """
 
         path = path.rstrip('/')
         query_params = {}
         if flags is not None:
             query_params['flags'] = flags
+        if cas is not None:
+            query_params['cas'] = cas
 
         response = self.put_response(url_parts=[path], query=query_params, payload=value)
-        return Response.create_from_http_response(response)
+        self._invalidate_cached(path)
+        endpoint_response = Response.create_from_http_response(response)
+        if cas is None or not endpoint_response.successful:
+            return endpoint_response
+
+        decoder = JsonDecoder()
+        if self._decode(decoder, response.payload) is not True:
+            return Response.create_error_result(kind=Response.ErrorTypes.CASConflict,
+                                                message="Modify index of {} is not {}".format(path, cas))
+
+        return endpoint_response
 
     def merge(self, path: str, updates: dict) -> Response:
         """Try to fetch an existing config. If successful, overwrite the values with the updates.
-        Otherwise assume that there is no config yet and try to store it."""
+        Otherwise assume that there is no config yet and try to store it.
+        The config is written with check-and-set, so concurrent updates are not lost, see merge_cas."""
+
+        response, _ = self.merge_cas(path, updates)
+        return response
+
+    def merge_cas(self, path: str, updates: dict, current: ConsulKeyValue = None, max_attempts: int = 5,
+                  backoff: timedelta = timedelta(milliseconds=50)) -> (Response, ConsulKeyValue):
+        """Merge the updates into the config, only if the config was not changed in the meantime.
+        The current config is fetched with its modify index and written back with check-and-set. If another client
+        changed the config in between, the merge is retried with the new config after an exponential back off.
+        If the caller already has the current entry, for example from the last merge, it can be passed to skip the
+        read, so that the merge takes only one round trip unless the config was changed by someone else.
+        Return the stored entry with the new modify index.
+        """
 
-        response, config = self.get_raw(path)
-        if not response.successful:
-            return self.set(path, updates)
+        response = Response.create_error_result(kind=Response.ErrorTypes.CASConflict,
+                                                message="Could not merge {}".format(path))
+        for attempt in range(max_attempts):
+            if attempt > 0:
+                time.sleep(backoff.total_seconds() * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+
+            if current is None:
+                response, current = self.get(path, cached=False)
+                if not response.successful and response.kind != 404:
+                    return response, None
+
+            config = {}
+            modify_index = 0
+            if current is not None:
+                try:
+                    current_config = current.value
+                except Exception as exc:
+                    return Response(successful=False, kind="DecodeError",
+                                    message="Could not decode the config of {}".format(path), exception=exc), None
+                if not isinstance(current_config, dict):
+                    return Response.create_error_result_with_message_only("Current config is not a dict"), None
+                config = dict(current_config)
+                modify_index = current.modify_index
+
+            for key in updates.keys():
+                config[key] = updates[key]
+
+            response, results = self.write_batch([KVOperation.new_cas(path, config, modify_index)])
+            if response.successful:
+                stored = results[0].kv
+                return response, ConsulKeyValue(key=stored.key, value=config, flags=stored.flags,
+                                                lock_index=stored.lock_index, create_index=stored.create_index,
+                                                modify_index=stored.modify_index)
+
+            if response.kind != 409:
+                return response, None
+
+            LOGGER.debug("Config {} was changed concurrently, retrying merge".format(path))
+            response = Response.create_error_result(kind=Response.ErrorTypes.CASConflict,
+                                                    message=results[0].error)
+            current = None
+
+        return response, None
+
+    def write_batch(self, operations: List[KVOperation],
+                    max_operations: int = MAX_OPERATIONS_PER_TRANSACTION) -> (Response, List[KVOperationResult]):
+        """Execute many operations with as few transactions as possible, instead of one request per key.
+        The operations are split into chunks of max_operations, and each chunk is applied atomically. If an operation
+        fails, the other operations of its chunk are rolled back, but the other chunks are not affected.
+        The response is only successful if all the operations were successful. The results are in the same order
+        as the operations. All the operations are validated before the first chunk is sent, so an invalid operation
+        raises a ValueError without writing anything.
+        """
 
-        if not isinstance(config, dict):
-            return Response.create_error_result_with_message_only("Current config is not a dict")
+        if not 0 < max_operations <= MAX_OPERATIONS_PER_TRANSACTION:
+            raise ValueError("Max operations has to be between 1 and {}".format(MAX_OPERATIONS_PER_TRANSACTION))
 
-        for key in updates.keys():
-            config[key] = updates[key]
+        for operation in operations:
+            operation.validate()
 
-        return self.set(path, config)
+        endpoint_response = Response.create_successful_result()
+        results = []
+        for start in range(0, len(operations), max_operations):
+            chunk = operations[start:start + max_operations]
+            chunk_response, chunk_results = self._txn.execute(chunk)
+            if not chunk_response.successful and endpoint_response.successful:
+                endpoint_response = chunk_response
+            results.extend(chunk_results)
+
+            for operation in chunk:
+                if operation.verb != KVOperation.GET:
+                    self._invalidate_cached(operation.key, recurse=operation.verb == KVOperation.DELETE_TREE)
+
+        return endpoint_response, results
 
     def delete(self, path, recurse=False) -> Response:
         """Remove an item.
@@ -140,17 +434,35 @@ class KVEndpoint(HttpEndpoint):
 
         query_params = {'recurse': True} if recurse else {}
         response = self.delete_response(url_parts=[path], query=query_params)
+        self._invalidate_cached(path, recurse=recurse)
         return Response.create_from_http_response(response)
 
-    def acquire_lock(self, path, session) -> Response:
-        """Set a lock.
+    def acquire_lock(self, path, session: str, value=None) -> Response:
+        """Acquire the lock on the key for the session and set the value, if given.
+        If another session holds the lock, or the lock delay of an invalidated session is not over yet, the response
+        is not successful with kind LockConflict.
         """
 
-        response = self.put_response(url_parts=[path], query=None, payload={'acquire': session})
-        return Response.create_from_http_response(response)
+        return self._lock(path, {'acquire': session}, value)
 
-    def release_lock(self, path, session) -> Response:
-        """Release a lock.
+    def release_lock(self, path, session: str, value=None) -> Response:
+        """Release the lock of the session on the key and set the value, if given.
+        If the session does not hold the lock, the response is not successful with kind LockConflict.
         """
-        response = self.put_response(url_parts=[path], query=None, payload={'release': session})
-        return Response.create_from_http_response(response)
+
+        return self._lock(path, {'release': session}, value)
+
+    def _lock(self, path: str, query_params: dict, value) -> Response:
+        path = path.lstrip('/')
+        response = self.put_response(url_parts=[path], query=query_params, payload=value)
+        self._invalidate_cached(path)
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response
+
+        decoder = JsonDecoder()
+        if self._decode(decoder, response.payload) is not True:
+            return Response.create_error_result(kind=Response.ErrorTypes.LockConflict,
+                                                message="Lock on {} is held by another session".format(path))
+
+        return endpoint_response
@@ -1,10 +1,12 @@
 import logging
+from datetime import timedelta
 from typing import List
 
 from counselor.endpoint.common import Response
 from counselor.endpoint.decoder import ServiceDefinitionDecoder, ServiceDefinitionListDecoder
 from counselor.endpoint.encoder import Encoder
 from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.http_client import HEADER_KEY_CONSUL_CONTENT_HASH
 from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig
 
 LOGGER = logging.getLogger(__name__)
@@ -21,6 +23,11 @@ class ServiceEndpoint(HttpEndpoint):
             url_parts = ["agent"]
         super().__init__(endpoint_config, url_parts)
 
+    def uri_template(self, url_parts: List[str]) -> str:
+        if len(url_parts) > 1 and url_parts[0] == 'service' and url_parts[-1] != 'register':
+            return self._template_prefix(url_parts[:-1] + ['{service_id}'])
+        return self._template_prefix(url_parts)
+
     def search(self, query: List[tuple] = None) -> (Response, List[ServiceDefinition]):
         """Return all the services that are registered with the local agent.
         """
@@ -32,7 +39,7 @@ class ServiceEndpoint(HttpEndpoint):
             return endpoint_response, None
 
         decoder = ServiceDefinitionListDecoder()
-        found_services = decoder.decode(response.payload)
+        found_services = self._decode(decoder, response.payload)
 
         if not decoder.successful:
             return endpoint_response.update_by_decode_result(found_services), None
@@ -49,19 +56,34 @@ class ServiceEndpoint(HttpEndpoint):
         response = self.put_response(url_parts=['service', 'register'], query=None, payload=payload)
         return Response.create_from_http_response(response)
 
-    def get_details(self, service_key) -> (Response, ServiceDefinition):
+    def get_details(self, service_key, content_hash: str = None, wait: timedelta = None) -> (
+            Response, ServiceDefinition):
         """Get the details of the service.
+        If a content hash is given, it is a blocking query, that returns as soon as the hash of the service
+        definition is different, or the wait time is over. The hash of the definition is returned as content_hash.
         """
 
-        response = self.get_response(url_parts=['service', service_key])
+        query_params = {}
+        if content_hash:
+            query_params['hash'] = content_hash
+            if wait is not None:
+                query_params['wait'] = '{}s'.format(max(1, int(wait.total_seconds())))
+        else:
+            wait = None
+
+        response = self.get_response(url_parts=['service', service_key], query=query_params, wait=wait)
         endpoint_response = Response.create_from_http_response(response)
         if not endpoint_response.successful:
             return endpoint_response, None
 
         decoder = ServiceDefinitionDecoder()
-        service_definition = decoder.decode(response.payload)
+        service_definition = self._decode(decoder, response.payload)
         if not decoder.successful:
-            endpoint_response.update_by_decode_result(decoder), None
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        if not service_definition.content_hash:
+            service_definition.content_hash = response.get_header(HEADER_KEY_CONSUL_CONTENT_HASH, '')
 
         return endpoint_response, service_definition
 
@@ -0,0 +1,113 @@
+import logging
+from datetime import timedelta
+from typing import List
+
+from counselor.endpoint.common import Response
+from counselor.endpoint.decoder import JsonDecoder, SessionListDecoder
+from counselor.endpoint.entity import ConsulSession
+from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _duration(value: timedelta) -> str:
+    return '{}s'.format(int(value.total_seconds()))
+
+
+class SessionEndpoint(HttpEndpoint):
+    """
+        Session endpoint for Consul. Sessions hold the locks on KV entries, see KVEndpoint.acquire_lock.
+        A session with a TTL has to be renewed within the TTL, for example by the SessionRenewer, otherwise Consul
+        invalidates it and releases its locks.
+    """
+
+    def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str] = None):
+        if url_parts is None:
+            url_parts = ["session"]
+        super().__init__(endpoint_config, url_parts)
+
+    def uri_template(self, url_parts: List[str]) -> str:
+        if len(url_parts) > 1:
+            return self._template_prefix(url_parts[:1] + ['{session_id}'])
+        return self._template_prefix(url_parts)
+
+    def create(self, name: str = None, ttl: timedelta = None, behavior: str = ConsulSession.RELEASE,
+               lock_delay: timedelta = None, node_checks: List[str] = None) -> (Response, str):
+        """Create a session and return its id. Consul accepts a TTL between 10s and 24h.
+        The lock delay is the time after the invalidation of the session, in which its locks can not be acquired
+        again, Consul uses 15s by default.
+        """
+
+        payload = {'Behavior': behavior}
+        if name is not None:
+            payload['Name'] = name
+        if ttl is not None:
+            payload['TTL'] = _duration(ttl)
+        if lock_delay is not None:
+            payload['LockDelay'] = _duration(lock_delay)
+        if node_checks is not None:
+            payload['NodeChecks'] = node_checks
+
+        response = self.put_response(url_parts=['create'], payload=payload)
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = JsonDecoder()
+        created = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        return endpoint_response, created.get('ID')
+
+    def destroy(self, session_id: str) -> Response:
+        """Destroy the session, its locks are released or the locked keys deleted, depending on the behavior.
+        """
+
+        response = self.put_response(url_parts=['destroy', session_id])
+        return Response.create_from_http_response(response)
+
+    def renew(self, session_id: str) -> (Response, ConsulSession):
+        """Reset the TTL of the session. The response kind is 404, if the session was already invalidated.
+        """
+
+        response = self.put_response(url_parts=['renew', session_id])
+        return self._decode_single(response)
+
+    def info(self, session_id: str) -> (Response, ConsulSession):
+        """Return the session, or None if it does not exist.
+        """
+
+        response = self.get_response(url_parts=['info', session_id])
+        return self._decode_single(response)
+
+    def list(self) -> (Response, List[ConsulSession]):
+        """Return all the sessions of the datacenter.
+        """
+
+        response = self.get_response(url_parts=['list'])
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = SessionListDecoder()
+        sessions = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        return endpoint_response, sessions
+
+    def _decode_single(self, response) -> (Response, ConsulSession):
+        endpoint_response = Response.create_from_http_response(response)
+        if not endpoint_response.successful:
+            return endpoint_response, None
+
+        decoder = SessionListDecoder()
+        sessions = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, None
+
+        return endpoint_response, sessions[0] if sessions else None
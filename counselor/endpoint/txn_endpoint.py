@@ -0,0 +1,75 @@
+import logging
+from typing import List
+
+from counselor.endpoint.common import Response
+from counselor.endpoint.decoder import TxnResultDecoder
+from counselor.endpoint.encoder import Encoder
+from counselor.endpoint.entity import KVOperation, KVOperationResult
+from counselor.endpoint.http_endpoint import HttpEndpoint, EndpointConfig
+
+LOGGER = logging.getLogger(__name__)
+
+MAX_OPERATIONS_PER_TRANSACTION = 64
+
+
+class TxnEndpoint(HttpEndpoint):
+    """Transaction endpoint for Consul. All the operations of a transaction are applied atomically: if one of them
+    fails, none of them is applied. A transaction can have at most 64 operations.
+    """
+
+    def __init__(self, endpoint_config: EndpointConfig, url_parts: List[str] = None):
+        if url_parts is None:
+            url_parts = ["txn"]
+        super().__init__(endpoint_config, url_parts)
+
+    def execute(self, operations: List[KVOperation]) -> (Response, List[KVOperationResult]):
+        """Execute the operations as one transaction and return a result per operation.
+        """
+
+        if len(operations) > MAX_OPERATIONS_PER_TRANSACTION:
+            return Response.create_error_result_with_message_only(
+                "A transaction can have at most {} operations".format(MAX_OPERATIONS_PER_TRANSACTION)), []
+
+        for operation in operations:
+            operation.validate()
+
+        payload = [Encoder.kv_operation_to_consul_dict(operation) for operation in operations]
+        response = self.put_response(url_parts=[], payload=payload)
+        endpoint_response = Response.create_from_http_response(response)
+
+        # A rolled back transaction returns a 409 with the errors of the operations in the body
+        if not endpoint_response.successful and response.status_code != 409:
+            return endpoint_response, [KVOperationResult(operation, successful=False, error="{}".format(
+                endpoint_response.message)) for operation in operations]
+
+        decoder = TxnResultDecoder()
+        kv_list, error_list = self._decode(decoder, response.payload)
+        if not decoder.successful:
+            endpoint_response.update_by_decode_result(decoder)
+            return endpoint_response, [KVOperationResult(operation, successful=False, error=decoder.error_message)
+                                       for operation in operations]
+
+        if error_list:
+            return endpoint_response, self._create_rolled_back_results(operations, error_list)
+
+        results = []
+        kv_iterator = iter(kv_list)
+        for operation in operations:
+            kv = next(kv_iterator, None) if operation.has_result() else None
+            results.append(KVOperationResult(operation, kv=kv))
+
+        return endpoint_response, results
+
+    @staticmethod
+    def _create_rolled_back_results(operations: List[KVOperation], error_list: List[tuple]) -> List[
+            KVOperationResult]:
+        errors_by_index = {}
+        for op_index, what in error_list:
+            errors_by_index[op_index] = what
+
+        results = []
+        for i, operation in enumerate(operations):
+            error = errors_by_index.get(i, "Transaction was rolled back")
+            results.append(KVOperationResult(operation, successful=False, error=error))
+
+        return results
@@ -0,0 +1,110 @@
+import logging
+from datetime import timedelta
+from threading import Event, Lock
+from typing import Tuple, Dict
+
+from counselor.client import ConsulClient
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.watcher import BlockingTask
+
+LOGGER = logging.getLogger(__name__)
+
+
+class HealthWatcherTask(BlockingTask):
+    """Keeps the healthy instances of a service up to date in the HealthyInstanceCache, with blocking queries on the
+    health endpoint.
+    """
+
+    def __init__(self, service_name: str, cache: 'HealthyInstanceCache', consul_client: ConsulClient,
+                 interval: timedelta, stop_event: Event, log_interval_seconds=3 * 60 * 60,
+                 blocking_wait: timedelta = timedelta(minutes=1)):
+        super().__init__("health-" + service_name, interval, stop_event, log_interval_seconds, blocking_wait)
+        self.service_name = service_name
+        self.cache = cache
+        self.consul_client = consul_client
+
+    def check(self):
+        self.log_with_interval("Checking healthy instances of {}".format(self.service_name))
+        self.last_check_failed = True
+
+        try:
+            response, instances = self.consul_client.health.service(self.service_name, passing=True, index=self.index,
+                                                                    wait=self.blocking_wait)
+        except Exception as exc:
+            LOGGER.error("Could not check healthy instances of {}: {}".format(self.service_name, exc))
+            return
+
+        if not response.successful:
+            LOGGER.error("Failed request for healthy instances of {}: {}".format(self.service_name,
+                                                                                 response.as_string()))
+            return
+
+        self.last_check_failed = False
+        if response.index != self.index:
+            self.cache.set_instances(self.service_name, tuple(instances))
+        self.update_index(response.index)
+
+
+class HealthyInstanceCache:
+    """Keeps the healthy instances of the watched services in memory. Every watched service is refreshed by its own
+    HealthWatcherTask in the background, so get_healthy_instances only reads from memory. The instances are stored
+    as immutable tuples in a dict that is replaced on every update, so reads do not need a lock.
+    """
+
+    def __init__(self, consul_client: ConsulClient, interval: timedelta = timedelta(seconds=10),
+                 blocking_wait: timedelta = timedelta(minutes=1)):
+        self.consul_client = consul_client
+        self.interval = interval
+        self.blocking_wait = blocking_wait
+        self._instances: Dict[str, Tuple[ServiceDefinition, ...]] = {}
+        self._tasks: Dict[str, HealthWatcherTask] = {}
+        self._lock = Lock()
+
+    def watch(self, service_name: str, wait_for_instances=True):
+        """Start to watch the service. If wait_for_instances is set, the first fetch is done right away, so that
+        the instances are available when this method returns.
+        """
+        with self._lock:
+            if service_name in self._tasks:
+                return
+
+            task = HealthWatcherTask(service_name, self, self.consul_client, self.interval, Event(),
+                                     blocking_wait=self.blocking_wait)
+            self._tasks[service_name] = task
+
+        if wait_for_instances:
+            task.check()
+        task.start()
+        LOGGER.info("Watching healthy instances of {}".format(service_name))
+
+    def unwatch(self, service_name: str):
+        with self._lock:
+            task = self._tasks.pop(service_name, None)
+            instances = dict(self._instances)
+            instances.pop(service_name, None)
+            self._instances = instances
+
+        if task is not None:
+            task.stop()
+
+    def stop(self):
+        for service_name in list(self._tasks.keys()):
+            self.unwatch(service_name)
+
+    def get_watched_services(self) -> Tuple[str, ...]:
+        return tuple(self._tasks.keys())
+
+    def get_healthy_instances(self, service_name: str) -> Tuple[ServiceDefinition, ...]:
+        """Return the last known healthy instances of the service, or an empty tuple if it is not watched.
+        """
+        return self._instances.get(service_name, ())
+
+    def set_instances(self, service_name: str, instances: Tuple[ServiceDefinition, ...]):
+        with self._lock:
+            if service_name not in self._tasks:
+                return
+            updated_instances = dict(self._instances)
+            updated_instances[service_name] = instances
+            self._instances = updated_instances
+
+        LOGGER.info("{} has {} healthy instances".format(service_name, len(instances)))
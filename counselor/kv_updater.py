@@ -1,16 +1,23 @@
 from counselor.client import ConsulClient
 from counselor.endpoint.common import Response
+from counselor.endpoint.entity import ConsulKeyValue
 
 
 class KVUpdater:
-    """Helper class to conveniently update configs in Consul KV store."""
+    """Helper class to conveniently update configs in Consul KV store.
+    The updater remembers the entry of its last merge, so the next merge can skip the read. If the config was changed
+    by someone else in the meantime, the check-and-set fails and the merge is retried with a fresh read.
+    """
 
     def __init__(self, kv_path: str, consul_client: ConsulClient):
         self.kv_path = kv_path
         self.consul_client = consul_client
+        self.current: ConsulKeyValue = None
 
     def update(self, config: dict) -> Response:
+        self.current = None
         return self.consul_client.kv.set(self.kv_path, config)
 
     def merge(self, config: dict):
-        return self.consul_client.kv.merge(self.kv_path, config)
+        response, self.current = self.consul_client.kv.merge_cas(self.kv_path, config, current=self.current)
+        return response
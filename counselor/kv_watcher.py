@@ -1,9 +1,16 @@
+import copy
+import functools
 import logging
 from datetime import timedelta
-from threading import Event
+from threading import Event, Lock
+from typing import Callable, Dict, List, Optional
 
 from counselor.client import ConsulClient
-from counselor.watcher import Task
+from counselor.config_diff import ConfigDiff
+from counselor.dispatcher import ListenerDispatcher
+from counselor.endpoint.entity import ConsulKeyValue
+from counselor.snapshot import ConfigSnapshotStore, SnapshotEntry
+from counselor.watcher import BlockingTask
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,44 +31,439 @@ class ConfigUpdateListener:
         pass
 
 
-class KVWatcherTask(Task):
+class DiffConfigUpdateListener(ConfigUpdateListener):
+    """Listener that is notified with the changed keys instead of the whole config, so it can reconfigure only
+    what actually changed. The watchers call on_diff instead of on_update. The diff is computed against the last
+    config the listener applied successfully. If nothing changed, the listener is not called at all.
+    """
+
+    def on_init(self, config: dict) -> bool:
+        """Logic to execute when the watcher fetches the config for the first time, all keys are added"""
+        return self.on_diff(ConfigDiff.compute({}, config), config)
+
+    def on_update(self, new_config: dict) -> bool:
+        """Not used by the watchers, see on_diff"""
+        return False
+
+    def on_diff(self, diff: ConfigDiff, new_config: dict) -> bool:
+        """Logic to execute when an update is available"""
+        pass
+
+
+class DeferredConfigUpdateListener(ConfigUpdateListener):
+    """Listener that accepts an update in on_update and applies it later, so the return value of on_update only
+    tells whether the update was accepted. The watchers register a callback with set_applied_callback, which the
+    listener calls with the config once it actually applied it. Only then the config is written to the snapshot.
+    """
+
+    def set_applied_callback(self, callback: Callable[[dict], None]):
+        """Remember the callback to call with every config that was applied"""
+        pass
+
+
+def notify_listener(listener: ConfigUpdateListener, initial: bool, new_config: dict, last_config: dict) -> bool:
+    """Call on_init for the initial config and on_update for updates. A DiffConfigUpdateListener gets the diff
+    against the last applied config instead, if there is a change at all. Return whether the config was applied.
+    """
+    if initial:
+        return listener.on_init(new_config)
+
+    if isinstance(listener, DiffConfigUpdateListener):
+        diff = ConfigDiff.compute(last_config, new_config)
+        if diff.is_empty():
+            LOGGER.debug("No key of {} changed".format(listener.get_path()))
+            return True
+        return listener.on_diff(diff, new_config)
+
+    return listener.on_update(new_config)
+
+
+def decode_value(entry: ConsulKeyValue) -> (bool, dict):
+    """Decode the lazily decoded value of the entry. Return whether it was valid base64 encoded json, and the value.
+    """
+    try:
+        return True, entry.value
+    except Exception as exc:
+        LOGGER.error("Could not decode the value of {}: {}".format(entry.key, exc))
+        return False, None
+
+
+def remember_config(listener: ConfigUpdateListener, config: dict):
+    """Return a copy of the applied config to compute the next diff, only needed for a DiffConfigUpdateListener."""
+    if isinstance(listener, DiffConfigUpdateListener):
+        return copy.deepcopy(config)
+    return None
+
+
+class _SnapshotWriter:
+    """Writes the configs the listeners applied to the ConfigSnapshotStore, but only if the modify index of a path
+    changed since its last write. An update of a DeferredConfigUpdateListener is kept back until the listener
+    reports that it applied the config.
+    """
+
+    def __init__(self, snapshot_store: Optional[ConfigSnapshotStore]):
+        self.snapshot_store = snapshot_store
+        self._written_modify_indices: Dict[str, int] = {}
+        self._deferred: Dict[str, SnapshotEntry] = {}
+        self._lock = Lock()
+
+    def register(self, listener: ConfigUpdateListener, path: str):
+        if self.snapshot_store is not None and isinstance(listener, DeferredConfigUpdateListener):
+            listener.set_applied_callback(functools.partial(self._on_deferred_applied, path))
+
+    def loaded(self, path: str, modify_index: int):
+        """Remember that the snapshot already holds the modify index of the path."""
+        with self._lock:
+            self._written_modify_indices[path] = modify_index
+
+    def applied(self, listener: ConfigUpdateListener, path: str, initial: bool, modify_index: int,
+                config: dict) -> Optional[SnapshotEntry]:
+        """Return the entry to write for the config the listener accepted, or None if there is nothing to write."""
+        if self.snapshot_store is None:
+            return None
+
+        with self._lock:
+            if self._written_modify_indices.get(path) == modify_index:
+                return None
+            if not initial and isinstance(listener, DeferredConfigUpdateListener):
+                self._deferred[path] = SnapshotEntry(modify_index, config)
+                return None
+            return SnapshotEntry(modify_index, config)
+
+    def write(self, entries: Dict[str, SnapshotEntry]):
+        if not entries or not self.snapshot_store.put_all(entries):
+            return
+
+        with self._lock:
+            for path, entry in entries.items():
+                self._written_modify_indices[path] = entry.modify_index
+
+    def _on_deferred_applied(self, path: str, config: dict):
+        with self._lock:
+            entry = self._deferred.get(path)
+            if entry is None or entry.config is not config:
+                return
+            del self._deferred[path]
+        self.write({path: entry})
+
+
+class KVWatcherTask(BlockingTask):
     """Fetches the config from Consul KV store and notifies the ConfigUpdateListener if there is an update.
+    By default the config is polled every interval. If blocking_wait is set, the task uses blocking queries instead,
+    so changes arrive immediately and an idle watcher costs one request per blocking_wait.
+    If a ListenerDispatcher is given, the listener is called on its workers instead of in the check. If the listener
+    fails on the worker, the next check fetches the config again, without blocking, and delivers it once more.
+    If a ConfigSnapshotStore is given, every config the listener applied is written to it, after the listener
+    returned successfully, on the worker of the dispatcher if there is one. The listener is initialized with the
+    config of the snapshot by warm_start, or at the latest before the first fetch, so it does not depend on Consul
+    being reachable. The first fetch then only updates the listener, if the modify index changed meanwhile.
     """
 
     def __init__(self, listener: ConfigUpdateListener, consul_client: ConsulClient, interval: timedelta,
-                 stop_event: Event, log_interval_seconds=3 * 60 * 60):
-        super().__init__(listener.get_path(), interval, stop_event, log_interval_seconds)
+                 stop_event: Event, log_interval_seconds=3 * 60 * 60, blocking_wait: timedelta = None,
+                 dispatcher: ListenerDispatcher = None, snapshot_store: ConfigSnapshotStore = None):
+        super().__init__(listener.get_path(), interval, stop_event, log_interval_seconds, blocking_wait)
         self.listener = listener
         self.last_modify_index = 0
+        self.applied_modify_index = 0
+        self.last_config = None
         self.consul_client = consul_client
+        self.dispatcher = dispatcher
+        self.snapshot_store = snapshot_store
+        self.warm_started = snapshot_store is None
+        self._delivery_failed = Event()
+        self._snapshot_writer = _SnapshotWriter(snapshot_store)
+        self._snapshot_writer.register(listener, self.get_path())
 
     def get_path(self) -> str:
         return self.listener.get_path()
 
+    def warm_start(self) -> bool:
+        """Initialize the listener with the config of the snapshot store, if there is one for the path.
+        Return whether the listener applied it.
+        """
+        if self.warm_started:
+            return False
+        self.warm_started = True
+
+        entry = self.snapshot_store.get(self.get_path())
+        if entry is None:
+            return False
+
+        self._snapshot_writer.loaded(self.get_path(), entry.modify_index)
+        if not self._notify(True, entry.config, entry.modify_index):
+            LOGGER.error("Config snapshot of {} was not applied".format(self.get_path()))
+            return False
+
+        self.last_modify_index = entry.modify_index
+        LOGGER.info("Initialized {} from snapshot with modify index {}".format(self.get_path(), entry.modify_index))
+        return True
+
     def check(self):
         self.log_with_interval("Checking kv config: {}".format(self.get_path()))
+        self.warm_start()
+        self._reset_failed_delivery()
+        self.last_check_failed = True
 
         try:
-            response, new_config = self.consul_client.kv.get(self.get_path())
+            if self.is_blocking():
+                response, new_config = self.consul_client.kv.get(self.get_path(), index=self.index,
+                                                                 wait=self.blocking_wait)
+            else:
+                response, new_config = self.consul_client.kv.get(self.get_path(), cached=False)
         except Exception as exc:
             LOGGER.error("Could not check config path {}: {}".format(self.get_path(), exc))
             return
 
         if not response.successful:
+            if self.is_blocking() and response.kind == 404:
+                # A missing key still returns an index, so the next query blocks until the key is created.
+                self.update_index(response.index)
+                self.last_check_failed = False
             LOGGER.error("Failed request for path {}: {}".format(self.get_path(), response.as_string()))
             return
 
+        config = None
+        if self.last_modify_index != new_config.modify_index:
+            # The value is decoded lazily, a malformed value fails like the fetch.
+            decoded, config = decode_value(new_config)
+            if not decoded:
+                return
+
         successful = False
         if self.last_modify_index == 0:
-            successful = self.listener.on_init(new_config.value)
-        elif self.last_modify_index < new_config.modify_index:
-            successful = self.listener.on_update(new_config.value)
+            successful = self._notify(True, config, new_config.modify_index)
+        elif self.last_modify_index != new_config.modify_index:
+            # The modify index can also go backwards, if the key was deleted and recreated or the cluster was restored.
+            successful = self._notify(False, config, new_config.modify_index)
         else:
             LOGGER.debug("Config still up to date: {}".format(self.last_modify_index))
+            successful = True
+
+        if not successful:
+            # Keep the old index, so the next blocking query returns immediately and the update is retried.
+            LOGGER.error("Reconfiguration was not successful")
             return
 
-        if successful:
+        self.last_check_failed = False
+        self.update_index(response.index)
+        if self.last_modify_index != new_config.modify_index:
             self.last_modify_index = new_config.modify_index
             LOGGER.info("Successfully updated to modify index {}".format(self.last_modify_index))
-        else:
-            LOGGER.error("Reconfiguration was not successful")
+
+    def _notify(self, initial: bool, config: dict, modify_index: int) -> bool:
+        deliver = functools.partial(self._deliver, modify_index)
+        if self.dispatcher is None:
+            return deliver(initial, config)
+
+        self.dispatcher.dispatch(self.listener, self.get_path(), functools.partial(self._deliver_dispatched, deliver),
+                                 initial, config)
+        return True
+
+    def _deliver(self, modify_index: int, initial: bool, config: dict) -> bool:
+        successful = notify_listener(self.listener, initial, config, self.last_config)
+        if successful:
+            self.last_config = remember_config(self.listener, config)
+            self.applied_modify_index = modify_index
+            entry = self._snapshot_writer.applied(self.listener, self.get_path(), initial, modify_index, config)
+            if entry is not None:
+                self._snapshot_writer.write({self.get_path(): entry})
+        return successful
+
+    def _deliver_dispatched(self, deliver, initial: bool, config: dict) -> bool:
+        successful = False
+        try:
+            successful = deliver(initial, config)
+            return successful
+        finally:
+            if not successful:
+                self._delivery_failed.set()
+
+    def _reset_failed_delivery(self):
+        """Go back to the last applied modify index, if a dispatched config was not applied, so the config is
+        delivered again. The blocking index is reset too, so the next query returns immediately.
+        """
+        if not self._delivery_failed.is_set():
+            return
+
+        self._delivery_failed.clear()
+        LOGGER.warning("Delivering the config of {} again".format(self.get_path()))
+        self.last_modify_index = self.applied_modify_index
+        self.index = 0
+
+
+class KVPrefixWatcherTask(BlockingTask):
+    """Fetches all the configs below a prefix with a single recursive request and notifies every
+    ConfigUpdateListener whose key changed. The path of each listener has to start with the prefix.
+    This is much cheaper than one KVWatcherTask per listener, if many configs share the same prefix.
+    If a ListenerDispatcher is given, the listeners are called on its workers instead of in the check, a failed
+    listener gets its config again on the next check. A ConfigSnapshotStore is used like in the KVWatcherTask,
+    without a dispatcher the configs of one check are written to it at once.
+    """
+
+    def __init__(self, prefix: str, listeners: List[ConfigUpdateListener], consul_client: ConsulClient,
+                 interval: timedelta, stop_event: Event, log_interval_seconds=3 * 60 * 60,
+                 blocking_wait: timedelta = None, dispatcher: ListenerDispatcher = None,
+                 snapshot_store: ConfigSnapshotStore = None):
+        super().__init__(prefix, interval, stop_event, log_interval_seconds, blocking_wait)
+        self.prefix = prefix.lstrip('/')
+        self.listeners = listeners
+        self.consul_client = consul_client
+        self.dispatcher = dispatcher
+        self.snapshot_store = snapshot_store
+        self.warm_started = snapshot_store is None
+        self.last_modify_indices = {}
+        self.applied_modify_indices = {}
+        self.last_configs = {}
+        self._failed_paths = set()
+        self._failed_paths_lock = Lock()
+        self._snapshot_writer = _SnapshotWriter(snapshot_store)
+
+        for listener in listeners:
+            if not self._normalize(listener.get_path()).startswith(self.prefix):
+                raise ValueError("Path {} is not below prefix {}".format(listener.get_path(), self.prefix))
+            self._snapshot_writer.register(listener, self._normalize(listener.get_path()))
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return path.strip('/')
+
+    def warm_start(self) -> int:
+        """Initialize the listeners with the configs of the snapshot store. Return the number of listeners that
+        applied a config from the snapshot.
+        """
+        if self.warm_started:
+            return 0
+        self.warm_started = True
+
+        applied = 0
+        for listener in self.listeners:
+            path = self._normalize(listener.get_path())
+            entry = self.snapshot_store.get(path)
+            if entry is None:
+                continue
+
+            self._snapshot_writer.loaded(path, entry.modify_index)
+            if self._notify(listener, path, True, entry.config, entry.modify_index, None):
+                self.last_modify_indices[path] = entry.modify_index
+                applied += 1
+            else:
+                LOGGER.error("Config snapshot of {} was not applied".format(path))
+
+        LOGGER.info("Initialized {} listeners of {} from snapshot".format(applied, self.prefix))
+        return applied
+
+    def check(self):
+        self.log_with_interval("Checking kv prefix: {}".format(self.prefix))
+        self.warm_start()
+        self._reset_failed_deliveries()
+        self.last_check_failed = True
+
+        try:
+            if self.is_blocking():
+                response, kv_list = self.consul_client.kv.get_recursive(self.prefix, index=self.index,
+                                                                        wait=self.blocking_wait)
+            else:
+                response, kv_list = self.consul_client.kv.get_recursive(self.prefix)
+        except Exception as exc:
+            LOGGER.error("Could not check config prefix {}: {}".format(self.prefix, exc))
+            return
+
+        if not response.successful:
+            if self.is_blocking() and response.kind == 404:
+                # No key below the prefix yet, the next query blocks until one is created.
+                self.update_index(response.index)
+                self.last_check_failed = False
+            LOGGER.error("Failed request for prefix {}: {}".format(self.prefix, response.as_string()))
+            return
+
+        entries = {}
+        for e in kv_list:
+            entries[e.key] = e
+
+        all_successful = True
+        snapshot_entries = {}
+        for listener in self.listeners:
+            path = self._normalize(listener.get_path())
+            entry = entries.get(path)
+            if entry is None:
+                LOGGER.debug("No config for path {}".format(path))
+                continue
+
+            last_modify_index = self.last_modify_indices.get(path, 0)
+            if last_modify_index == entry.modify_index:
+                continue
+
+            decoded, config = decode_value(entry)
+            if not decoded:
+                all_successful = False
+                continue
+
+            if self._notify(listener, path, last_modify_index == 0, config, entry.modify_index, snapshot_entries):
+                self.last_modify_indices[path] = entry.modify_index
+                LOGGER.info("Successfully updated {} to modify index {}".format(path, entry.modify_index))
+            else:
+                all_successful = False
+                LOGGER.error("Reconfiguration of {} was not successful".format(path))
+
+        self._snapshot_writer.write(snapshot_entries)
+
+        if not all_successful:
+            # Keep the old index, so the next blocking query returns immediately and the failed updates are retried.
+            return
+
+        self.last_check_failed = False
+        self.update_index(response.index)
+
+    def _notify(self, listener: ConfigUpdateListener, path: str, initial: bool, config: dict, modify_index: int,
+                snapshot_entries: Optional[Dict[str, SnapshotEntry]]) -> bool:
+        """Deliver the config right away and collect its snapshot entry in snapshot_entries, if it is not None.
+        With a dispatcher the snapshot entry is written by the worker after the delivery.
+        """
+        if self.dispatcher is None:
+            return self._deliver(listener, path, modify_index, snapshot_entries, initial, config)
+
+        deliver = functools.partial(self._deliver, listener, path, modify_index, None)
+        self.dispatcher.dispatch(listener, path, functools.partial(self._deliver_dispatched, path, deliver), initial,
+                                 config)
+        return True
+
+    def _deliver(self, listener: ConfigUpdateListener, path: str, modify_index: int,
+                 snapshot_entries: Optional[Dict[str, SnapshotEntry]], initial: bool, config: dict) -> bool:
+        successful = notify_listener(listener, initial, config, self.last_configs.get(path))
+        if successful:
+            self.last_configs[path] = remember_config(listener, config)
+            self.applied_modify_indices[path] = modify_index
+            entry = self._snapshot_writer.applied(listener, path, initial, modify_index, config)
+            if entry is not None:
+                if snapshot_entries is not None:
+                    snapshot_entries[path] = entry
+                else:
+                    self._snapshot_writer.write({path: entry})
+        return successful
+
+    def _deliver_dispatched(self, path: str, deliver, initial: bool, config: dict) -> bool:
+        successful = False
+        try:
+            successful = deliver(initial, config)
+            return successful
+        finally:
+            if not successful:
+                with self._failed_paths_lock:
+                    self._failed_paths.add(path)
+
+    def _reset_failed_deliveries(self):
+        """Go back to the last applied modify index of the paths whose dispatched config was not applied, so it is
+        delivered again. The blocking index is reset too, so the next query returns immediately.
+        """
+        with self._failed_paths_lock:
+            failed_paths = self._failed_paths
+            self._failed_paths = set()
+
+        if not failed_paths:
+            return
+
+        for path in failed_paths:
+            LOGGER.warning("Delivering the config of {} again".format(path))
+            self.last_modify_indices[path] = self.applied_modify_indices.get(path, 0)
+        self.index = 0
@@ -0,0 +1,308 @@
+import logging
+import time
+from datetime import timedelta
+from threading import Event, Lock
+from typing import Optional
+
+from counselor.client import ConsulClient
+from counselor.endpoint.common import Response
+from counselor.session_renewer import SessionRenewer
+from counselor.watcher import BlockingTask, next_blocking_index
+
+LOGGER = logging.getLogger(__name__)
+
+
+class ConsulLock:
+    """Distributed lock on a KV key, held by a Consul session with a TTL. The session is created on the first
+    acquire and kept alive by the SessionRenewer, pass a shared one to renew the sessions of many locks on one
+    thread. If the session is invalidated, for example because it could not be renewed in time, the lock is lost.
+    A contender that does not get the lock waits with blocking queries on the key until the holder releases it,
+    so it retries right after the handover instead of polling. If the key is free but can not be acquired, the
+    lock delay of an invalidated session is not over yet, then the acquire is retried after retry_interval.
+    """
+
+    def __init__(self, consul_client: ConsulClient, key: str, value=None, session_name: str = None,
+                 ttl: timedelta = timedelta(seconds=15), lock_delay: timedelta = timedelta(seconds=15),
+                 renewer: SessionRenewer = None, blocking_wait: timedelta = timedelta(minutes=1),
+                 retry_interval: timedelta = timedelta(seconds=1)):
+        self.consul_client = consul_client
+        self.key = key.strip('/')
+        self.value = value
+        self.session_name = session_name if session_name is not None else "lock-" + self.key
+        self.ttl = ttl
+        self.lock_delay = lock_delay
+        self.blocking_wait = blocking_wait
+        self.retry_interval = retry_interval.total_seconds()
+        self.session_id: Optional[str] = None
+        self._owns_renewer = renewer is None
+        self._renewer = renewer if renewer is not None else SessionRenewer(consul_client.session)
+        self._held = False
+        self._lock = Lock()
+        self._closed = Event()
+
+    def is_held(self) -> bool:
+        """Return whether the lock is held, as far as known. A lost session is noticed on its next renewal."""
+        return self._held
+
+    def acquire(self, timeout: timedelta = None) -> bool:
+        """Acquire the lock, waiting at most timeout for the holder to release it, or forever if it is None.
+        Return whether the lock is held.
+        """
+        deadline = time.monotonic() + timeout.total_seconds() if timeout is not None else None
+        while not self._closed.is_set():
+            if self._try_acquire():
+                return True
+            if not self._wait_until_free(deadline):
+                return False
+        return False
+
+    def release(self) -> bool:
+        """Release the lock, the session is kept for the next acquire. Return whether the lock was released.
+        If the release fails, the lock is still held and the release can be retried. If the session does not hold
+        the key anymore, the lock is marked as lost.
+        """
+        with self._lock:
+            session_id = self.session_id
+            if not self._held or session_id is None:
+                return False
+
+        try:
+            response = self.consul_client.kv.release_lock(self.key, session_id, self.value)
+        except Exception as exc:
+            LOGGER.error("Could not release lock on {}: {}".format(self.key, exc))
+            return False
+
+        if not response.successful:
+            if response.kind == Response.ErrorTypes.LockConflict:
+                LOGGER.warning("Lock on {} was not held by session {} anymore".format(self.key, session_id))
+                self.mark_lost()
+            else:
+                LOGGER.error("Failed to release lock on {}: {}".format(self.key, response.as_string()))
+            return False
+
+        with self._lock:
+            self._held = False
+        LOGGER.info("Released lock on {}".format(self.key))
+        return True
+
+    def mark_lost(self):
+        """Mark the lock as not held, if another watcher noticed that the key has a different holder. The session is
+        kept for the next acquire.
+        """
+        with self._lock:
+            self._held = False
+
+    def close(self):
+        """Release the lock and destroy the session. A closed lock can not be acquired again."""
+        self._closed.set()
+        self.release()
+
+        with self._lock:
+            session_id = self.session_id
+            self.session_id = None
+            self._held = False
+
+        if session_id is not None:
+            self._renewer.remove(session_id)
+            try:
+                self.consul_client.session.destroy(session_id)
+            except Exception as exc:
+                LOGGER.error("Could not destroy session {}: {}".format(session_id, exc))
+
+        if self._owns_renewer:
+            self._renewer.stop()
+
+    def __enter__(self) -> 'ConsulLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        return deadline - time.monotonic() if deadline is not None else None
+
+    def _ensure_session(self) -> Optional[str]:
+        with self._lock:
+            if self.session_id is not None:
+                return self.session_id
+
+            response, session_id = self.consul_client.session.create(self.session_name, ttl=self.ttl,
+                                                                      lock_delay=self.lock_delay)
+            if not response.successful or session_id is None:
+                LOGGER.error("Could not create session for lock on {}: {}".format(self.key, response.as_string()))
+                return None
+
+            self.session_id = session_id
+            self._renewer.add(session_id, self.ttl, on_lost=self._on_session_lost)
+            return session_id
+
+    def _on_session_lost(self, session_id: str):
+        with self._lock:
+            if session_id != self.session_id:
+                return
+            if self._held:
+                LOGGER.warning("Lost lock on {} with session {}".format(self.key, session_id))
+            self.session_id = None
+            self._held = False
+
+    def _try_acquire(self) -> bool:
+        try:
+            session_id = self._ensure_session()
+            if session_id is None:
+                return False
+            response = self.consul_client.kv.acquire_lock(self.key, session_id, self.value)
+        except Exception as exc:
+            LOGGER.error("Could not acquire lock on {}: {}".format(self.key, exc))
+            return False
+
+        if response.successful:
+            with self._lock:
+                self._held = session_id == self.session_id
+            LOGGER.info("Acquired lock on {}".format(self.key))
+            return self._held
+
+        if response.kind != Response.ErrorTypes.LockConflict:
+            LOGGER.error("Failed to acquire lock on {}: {}".format(self.key, response.as_string()))
+            if response.kind == 500 and self._is_session_invalidated(session_id):
+                self._renewer.remove(session_id)
+                self._on_session_lost(session_id)
+        return False
+
+    def _is_session_invalidated(self, session_id: str) -> bool:
+        """Consul answers an acquire with an invalidated session with 500, like other server errors. Ask for the
+        session to tell them apart.
+        """
+        try:
+            response, session = self.consul_client.session.info(session_id)
+        except Exception as exc:
+            LOGGER.error("Could not check session {}: {}".format(session_id, exc))
+            return False
+        return response.successful and session is None
+
+    def _wait_until_free(self, deadline: Optional[float]) -> bool:
+        """Wait with blocking queries until the key has no holder. Return False if the deadline is over."""
+        index = 0
+        while not self._closed.is_set():
+            remaining = self._remaining(deadline)
+            if remaining is not None and remaining <= 0:
+                return False
+
+            wait = self.blocking_wait
+            if remaining is not None:
+                wait = min(wait, timedelta(seconds=remaining))
+
+            try:
+                response, entry = self.consul_client.kv.get(self.key, index=index, wait=wait, cached=False)
+            except Exception as exc:
+                LOGGER.error("Could not check lock on {}: {}".format(self.key, exc))
+                response, entry = Response.create_error_result_with_exception_only(exc), None
+
+            if not response.successful and response.kind != 404:
+                self._closed.wait(self.retry_interval if remaining is None else min(self.retry_interval, remaining))
+                index = 0
+                continue
+
+            if entry is None or entry.session is None:
+                if index == 0:
+                    # The key was already free when the acquire failed, so the lock delay is not over yet.
+                    self._closed.wait(self.retry_interval if remaining is None
+                                      else min(self.retry_interval, remaining))
+                return True
+
+            index = next_blocking_index(index, response.index)
+        return False
+
+
+class LeaderListener:
+    """Interface to provide the methods to call, when the leadership changes"""
+
+    def on_elected(self):
+        """Logic to execute when this instance became the leader"""
+        pass
+
+    def on_demoted(self):
+        """Logic to execute when this instance is no longer the leader"""
+        pass
+
+
+class LeaderElectionTask(BlockingTask):
+    """Campaigns for the leadership with a ConsulLock on the key and notifies the LeaderListener when it is elected
+    or demoted. A follower waits for the lock with blocking queries, so it takes over right after the leader
+    released the lock or lost its session. The leader watches the key with blocking queries too, and is demoted if
+    another session holds the key, the key was deleted or its session was invalidated.
+    Stopping the task releases the lock and destroys the session.
+    """
+
+    def __init__(self, key: str, listener: LeaderListener, consul_client: ConsulClient, interval: timedelta,
+                 stop_event: Event, log_interval_seconds=3 * 60 * 60, blocking_wait: timedelta = timedelta(minutes=1),
+                 value=None, ttl: timedelta = timedelta(seconds=15), lock_delay: timedelta = timedelta(seconds=15),
+                 renewer: SessionRenewer = None):
+        super().__init__("leader-" + key, interval, stop_event, log_interval_seconds, blocking_wait)
+        self.listener = listener
+        self.consul_client = consul_client
+        self.lock = ConsulLock(consul_client, key, value=value, ttl=ttl, lock_delay=lock_delay, renewer=renewer,
+                               blocking_wait=blocking_wait)
+        self.leader = False
+
+    def is_leader(self) -> bool:
+        return self.leader
+
+    def check(self):
+        self.log_with_interval("Checking leadership of {}".format(self.lock.key))
+        self.last_check_failed = False
+
+        if not self.leader:
+            if self.lock.acquire(timeout=self.blocking_wait):
+                self.leader = True
+                self.index = 0
+                LOGGER.info("Elected as leader of {}".format(self.lock.key))
+                self._notify(self.listener.on_elected)
+            return
+
+        if not self.lock.is_held():
+            self._demote()
+            return
+
+        try:
+            response, entry = self.consul_client.kv.get(self.lock.key, index=self.index, wait=self.blocking_wait,
+                                                        cached=False)
+        except Exception as exc:
+            LOGGER.error("Could not check leadership of {}: {}".format(self.lock.key, exc))
+            self.last_check_failed = True
+            return
+
+        if not response.successful and response.kind != 404:
+            LOGGER.error("Failed request for leadership of {}: {}".format(self.lock.key, response.as_string()))
+            self.last_check_failed = True
+            return
+
+        if entry is None or entry.session != self.lock.session_id:
+            self.lock.mark_lost()
+            self._demote()
+            return
+
+        self.update_index(response.index)
+
+    def resign(self):
+        """Give up the leadership. Another instance can take over, this one campaigns again on the next check."""
+        if self.leader:
+            self.lock.release()
+            self._demote()
+
+    def stop(self):
+        super().stop()
+        self.resign()
+        self.lock.close()
+
+    def _demote(self):
+        self.leader = False
+        self.index = 0
+        LOGGER.info("Demoted as leader of {}".format(self.lock.key))
+        self._notify(self.listener.on_demoted)
+
+    def _notify(self, callback):
+        try:
+            callback()
+        except Exception as exc:
+            LOGGER.error("Leader listener of {} failed: {}".format(self.lock.key, exc))
@@ -0,0 +1,215 @@
+import math
+from threading import Lock
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+DEFAULT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pairs = ['{}="{}"'.format(name, _escape_label_value(str(value))) for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append('{}="{}"'.format(extra[0], extra[1]))
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class of the metrics with a fixed list of label names. The values are kept per tuple of label values.
+    """
+    type_name = "untyped"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = Lock()
+
+    def _check_labels(self, labels: Sequence[str]) -> Tuple[str, ...]:
+        labels = tuple(labels)
+        if len(labels) != len(self.label_names):
+            raise ValueError("Metric {} expects the labels {}, got {}".format(self.name, self.label_names, labels))
+        return labels
+
+    def render(self) -> List[str]:
+        return ["# HELP {} {}".format(self.name, self.description), "# TYPE {} {}".format(self.name, self.type_name)]
+
+
+class Counter(Metric):
+    """Value that only goes up, like the number of requests."""
+    type_name = "counter"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = ()):
+        super().__init__(name, description, label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, labels: Sequence[str] = (), amount: float = 1):
+        labels = self._check_labels(labels)
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, labels: Sequence[str] = ()) -> float:
+        return self._values.get(tuple(labels), 0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append("{}{} {}".format(self.name, _format_labels(self.label_names, labels), _format_value(value)))
+        return lines
+
+
+class HistogramValue:
+    """Bucket counts, sum and count of the observations for one tuple of label values."""
+
+    __slots__ = ("bucket_counts", "sum", "count")
+
+    def __init__(self, number_of_buckets: int):
+        self.bucket_counts = [0] * number_of_buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class Histogram(Metric):
+    """Distribution of observed values, like request latencies, in buckets with upper bounds."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, description: str, label_names: Sequence[str] = (),
+                 buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS):
+        super().__init__(name, description, label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple[str, ...], HistogramValue] = {}
+
+    def observe(self, labels: Sequence[str], value: float):
+        labels = self._check_labels(labels)
+        with self._lock:
+            histogram_value = self._values.get(labels)
+            if histogram_value is None:
+                histogram_value = HistogramValue(len(self.buckets))
+                self._values[labels] = histogram_value
+
+            for i, upper_bound in enumerate(self.buckets):
+                if value <= upper_bound:
+                    histogram_value.bucket_counts[i] += 1
+                    break
+            histogram_value.sum += value
+            histogram_value.count += 1
+
+    def get_count(self, labels: Sequence[str] = ()) -> int:
+        histogram_value = self._values.get(tuple(labels))
+        return histogram_value.count if histogram_value is not None else 0
+
+    def get_sum(self, labels: Sequence[str] = ()) -> float:
+        histogram_value = self._values.get(tuple(labels))
+        return histogram_value.sum if histogram_value is not None else 0.0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted((labels, list(v.bucket_counts), v.sum, v.count) for labels, v in self._values.items())
+
+        for labels, bucket_counts, total, count in values:
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                lines.append("{}_bucket{} {}".format(
+                    self.name, _format_labels(self.label_names, labels, ("le", _format_value(upper_bound))),
+                    cumulative))
+            lines.append("{}_bucket{} {}".format(self.name, _format_labels(self.label_names, labels, ("le", "+Inf")),
+                                                 count))
+            lines.append("{}_sum{} {}".format(self.name, _format_labels(self.label_names, labels),
+                                              _format_value(total)))
+            lines.append("{}_count{} {}".format(self.name, _format_labels(self.label_names, labels), count))
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the metrics by name. Registering a metric with the same name again returns the existing one, so that
+    several components can share a registry.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = Lock()
+
+    def counter(self, name: str, description: str, label_names: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, description, label_names))
+
+    def histogram(self, name: str, description: str, label_names: Sequence[str] = (),
+                  buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, description, label_names, buckets))
+
+    def get(self, name: str) -> Metric:
+        return self._metrics.get(name)
+
+    def get_metrics(self) -> List[Metric]:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render_prometheus(self) -> str:
+        """Render all the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in sorted(self.get_metrics(), key=lambda m: m.name):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def _register(self, metric: Metric) -> Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is None:
+                self._metrics[metric.name] = metric
+                return metric
+
+        if type(existing) is not type(metric) or existing.label_names != metric.label_names:
+            raise ValueError("Metric {} is already registered with a different type or labels".format(metric.name))
+        return existing
+
+
+class HttpMetrics:
+    """The metrics of the requests to Consul, recorded by the HttpEndpoint if the EndpointConfig has a registry.
+    The endpoint label is the API path of the endpoint, like kv or agent/service, without the keys.
+    """
+
+    def __init__(self, registry: MetricsRegistry):
+        self.request_seconds = registry.histogram("counselor_http_request_seconds",
+                                                  "Duration of the requests to Consul", ("endpoint", "method"))
+        self.responses = registry.counter("counselor_http_responses_total",
+                                          "Responses from Consul by status code", ("endpoint", "method", "status"))
+        self.errors = registry.counter("counselor_http_errors_total",
+                                       "Requests that failed without a response", ("endpoint", "method"))
+        self.sent_bytes = registry.counter("counselor_http_sent_bytes_total",
+                                           "Bytes sent in request bodies", ("endpoint", "method"))
+        self.received_bytes = registry.counter("counselor_http_received_bytes_total",
+                                               "Bytes received in response bodies", ("endpoint", "method"))
+        self.decode_seconds = registry.histogram("counselor_decode_seconds", "Duration of decoding the responses",
+                                                 ("endpoint", "decoder"))
+
+    def observe_response(self, endpoint: str, method: str, status_code: int, seconds: float, sent_bytes: int,
+                         received_bytes: int):
+        labels = (endpoint, method)
+        self.request_seconds.observe(labels, seconds)
+        self.responses.inc((endpoint, method, str(status_code)))
+        if sent_bytes:
+            self.sent_bytes.inc(labels, sent_bytes)
+        if received_bytes:
+            self.received_bytes.inc(labels, received_bytes)
+
+    def observe_error(self, endpoint: str, method: str, seconds: float):
+        self.request_seconds.observe((endpoint, method), seconds)
+        self.errors.inc((endpoint, method))
+
+    def observe_decode(self, endpoint: str, decoder: str, seconds: float):
+        self.decode_seconds.observe((endpoint, decoder), seconds)
@@ -0,0 +1,129 @@
+import heapq
+import itertools
+import logging
+import random
+import time
+from queue import Queue
+from threading import Thread, Condition
+from typing import List
+
+from counselor.watcher import Task
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Executes the checks of many tasks with a fixed number of worker threads, instead of one thread per task.
+    The tasks are kept in a priority queue ordered by their next due time on the monotonic clock. A single
+    dispatcher thread sleeps until the next task is due and hands it over to the workers. After the check, the task
+    is scheduled again with its wait seconds, randomized by the jitter to spread tasks with the same interval.
+    Blocking tasks occupy a worker for the whole wait time, so add enough workers if you schedule them here.
+    """
+
+    def __init__(self, workers: int = 4, jitter: float = 0.1):
+        if workers < 1:
+            raise ValueError("At least one worker is required")
+        if not 0 <= jitter < 1:
+            raise ValueError("Jitter has to be a fraction between 0 and 1")
+
+        self.workers = workers
+        self.jitter = jitter
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._queue = Queue()
+        self._threads: List[Thread] = []
+        self._number_of_tasks = 0
+        self.running = False
+
+    def add_task(self, task: Task):
+        """Schedule the task. The first check is due after the wait seconds of the task.
+        """
+        with self._condition:
+            self._number_of_tasks += 1
+            self._push(task)
+
+    def get_number_of_active_tasks(self) -> int:
+        return self._number_of_tasks if self.running else 0
+
+    def get_number_of_threads(self) -> int:
+        return len(self._threads)
+
+    def start(self):
+        with self._condition:
+            if self.running:
+                return
+            self.running = True
+
+        self._threads = [Thread(target=self._dispatch, name="scheduler-dispatcher", daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(Thread(target=self._work, name="scheduler-worker-{}".format(i), daemon=True))
+
+        for t in self._threads:
+            t.start()
+
+        LOGGER.info("Scheduler started with {} workers".format(self.workers))
+
+    def stop(self):
+        """Stop the dispatcher and wait for the workers to finish their current checks.
+        """
+        with self._condition:
+            if not self.running:
+                return
+            self.running = False
+            self._condition.notify_all()
+
+        for _ in range(self.workers):
+            self._queue.put(None)
+
+        for t in self._threads:
+            t.join()
+
+        self._threads = []
+        LOGGER.info("Scheduler stopped")
+
+    def _jittered(self, seconds: float) -> float:
+        if self.jitter == 0:
+            return seconds
+        return seconds * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _push(self, task: Task):
+        due = time.monotonic() + self._jittered(task.get_wait_seconds())
+        heapq.heappush(self._heap, (due, next(self._sequence), task))
+        if self._heap[0][2] is task:
+            self._condition.notify()
+
+    def _dispatch(self):
+        with self._condition:
+            while self.running:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                due, _, task = self._heap[0]
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
+
+                heapq.heappop(self._heap)
+                if task.stop_event.is_set():
+                    self._number_of_tasks -= 1
+                    LOGGER.info("Removed stopped task {}".format(task.name))
+                    continue
+
+                self._queue.put(task)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+
+            try:
+                task.check()
+            except Exception as exc:
+                LOGGER.error("Check of task {} failed: {}".format(task.name, exc))
+
+            with self._condition:
+                self._push(task)
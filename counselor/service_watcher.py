@@ -1,10 +1,13 @@
+import functools
 import logging
 from datetime import timedelta
 from threading import Event
 
 from counselor.client import ConsulClient
+from counselor.dispatcher import ListenerDispatcher
+from counselor.endpoint.encoder import Encoder
 from counselor.endpoint.entity import ServiceDefinition
-from counselor.watcher import Task
+from counselor.watcher import BlockingTask
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,26 +27,46 @@ class ServiceUpdateListener:
         pass
 
 
-class ServiceWatcherTask(Task):
+class ServiceWatcherTask(BlockingTask):
     """Fetches the service definition from Consul services and notifies the ServiceUpdateListener if there is an update.
+    A change is detected by the content hash that Consul computes for the service definition. If it is missing, the
+    hash of the canonical encoding of the definition is used instead, so an unchanged definition never triggers the
+    listener. If blocking_wait is set and Consul provides the content hash, the task uses hash based blocking queries
+    instead of polling. If a ListenerDispatcher is given, the listener is called on its workers instead of in the
+    check. If the listener fails on the worker, the next check delivers the service definition again.
     """
 
     def __init__(self, listener: ServiceUpdateListener, consul_client: ConsulClient, interval: timedelta,
-                 stop_event: Event, log_interval_seconds=3 * 60 * 60):
-        super().__init__(listener.get_service_key(), interval, stop_event, log_interval_seconds)
+                 stop_event: Event, log_interval_seconds=3 * 60 * 60, blocking_wait: timedelta = None,
+                 dispatcher: ListenerDispatcher = None):
+        super().__init__(listener.get_service_key(), interval, stop_event, log_interval_seconds, blocking_wait)
         self.listener = listener
         self.last_service_config_hash = ""
+        self.last_content_hash = ""
+        self.applied_service_config_hash = ""
         self.consul_client = consul_client
+        self.dispatcher = dispatcher
+        self._delivery_failed = Event()
 
     def get_service_key(self) -> str:
         return self.listener.get_service_key()
 
+    def get_wait_seconds(self) -> float:
+        if self.is_blocking() and not self.last_check_failed and self.last_content_hash:
+            return 0
+        return self.interval.total_seconds()
+
     def check(self):
         self.log_with_interval("Checking service: {}".format(self.get_service_key()))
+        self._reset_failed_delivery()
+        self.last_check_failed = True
 
         try:
-            response, new_service_definition = self.consul_client.service.get_details(
-                self.get_service_key())
+            if self.is_blocking():
+                response, new_service_definition = self.consul_client.service.get_details(
+                    self.get_service_key(), content_hash=self.last_content_hash, wait=self.blocking_wait)
+            else:
+                response, new_service_definition = self.consul_client.service.get_details(self.get_service_key())
         except Exception as exc:
             LOGGER.error("Could not check service definition for {}: {}".format(self.get_service_key(), exc))
             return
@@ -53,15 +76,59 @@ class ServiceWatcherTask(Task):
                 "Failed request for service definition {}: {}".format(self.get_service_key(), response.as_string()))
             return
 
-        successful = False
-        if self.last_service_config_hash == "":
-            successful = self.listener.on_init(new_service_definition)
+        new_hash = new_service_definition.content_hash
+        if not new_hash:
+            new_hash = Encoder.service_definition_hash(new_service_definition)
 
-        elif self.last_service_config_hash != new_service_definition.content_hash:
-            successful = self.listener.on_update(new_service_definition)
+        if self.last_service_config_hash == new_hash:
+            LOGGER.debug("Service definition still up to date: {}".format(new_hash))
+            self.last_check_failed = False
+            return
+
+        initial = self.last_service_config_hash == ""
+        deliver = functools.partial(self._deliver, new_hash)
+        if self.dispatcher is None:
+            successful = deliver(initial, new_service_definition)
+        else:
+            self.dispatcher.dispatch(self.listener, self.get_service_key(),
+                                     functools.partial(self._deliver_dispatched, deliver), initial,
+                                     new_service_definition)
+            successful = True
 
         if successful:
-            self.last_service_config_hash = new_service_definition.content_hash
+            self.last_check_failed = False
+            self.last_service_config_hash = new_hash
+            self.last_content_hash = new_service_definition.content_hash
             LOGGER.info("Successfully updated to config hash {}".format(self.last_service_config_hash))
         else:
             LOGGER.error("Reconfiguration was not successful")
+
+    def _deliver(self, service_config_hash: str, initial: bool, service_definition: ServiceDefinition) -> bool:
+        if initial:
+            successful = self.listener.on_init(service_definition)
+        else:
+            successful = self.listener.on_update(service_definition)
+        if successful:
+            self.applied_service_config_hash = service_config_hash
+        return successful
+
+    def _deliver_dispatched(self, deliver, initial: bool, service_definition: ServiceDefinition) -> bool:
+        successful = False
+        try:
+            successful = deliver(initial, service_definition)
+            return successful
+        finally:
+            if not successful:
+                self._delivery_failed.set()
+
+    def _reset_failed_delivery(self):
+        """Go back to the last applied hash, if a dispatched service definition was not applied, so it is delivered
+        again. Without a content hash the next query does not block.
+        """
+        if not self._delivery_failed.is_set():
+            return
+
+        self._delivery_failed.clear()
+        LOGGER.warning("Delivering the service definition of {} again".format(self.get_service_key()))
+        self.last_service_config_hash = self.applied_service_config_hash
+        self.last_content_hash = ""
@@ -0,0 +1,140 @@
+import logging
+import time
+from datetime import timedelta
+from threading import Condition, Thread
+from typing import Callable, Dict, List, Optional
+
+from counselor.endpoint.session_endpoint import SessionEndpoint
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _RenewedSession:
+    __slots__ = ("session_id", "ttl_seconds", "on_lost", "due")
+
+    def __init__(self, session_id: str, ttl_seconds: float, on_lost: Callable[[str], None], due: float):
+        self.session_id = session_id
+        self.ttl_seconds = ttl_seconds
+        self.on_lost = on_lost
+        self.due = due
+
+
+class SessionRenewer:
+    """Renews the TTL of many sessions on a single background thread, instead of one thread per session.
+    A session is renewed after renew_fraction of its TTL. All the sessions that are due within the batch_window are
+    renewed in the same pass, so sessions with similar TTLs fall into step and the thread wakes up once per round.
+    A failed renewal is retried after retry_interval. If Consul answers with 404, the session was already
+    invalidated, it is removed and on_lost is called with its id.
+    """
+
+    def __init__(self, session_endpoint: SessionEndpoint, renew_fraction: float = 0.5,
+                 batch_window: timedelta = timedelta(seconds=1), retry_interval: timedelta = timedelta(seconds=1)):
+        if not 0 < renew_fraction < 1:
+            raise ValueError("Renew fraction has to be between 0 and 1")
+
+        self.session_endpoint = session_endpoint
+        self.renew_fraction = renew_fraction
+        self.batch_window = batch_window.total_seconds()
+        self.retry_interval = retry_interval.total_seconds()
+        self._condition = Condition()
+        self._sessions: Dict[str, _RenewedSession] = {}
+        self._thread: Optional[Thread] = None
+        self._stopped = False
+
+    def add(self, session_id: str, ttl: timedelta, on_lost: Callable[[str], None] = None):
+        """Keep the session alive until it is removed. The first renewal is due after renew_fraction of the TTL."""
+        ttl_seconds = ttl.total_seconds()
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Session renewer is stopped")
+
+            self._sessions[session_id] = _RenewedSession(session_id, ttl_seconds, on_lost,
+                                                         time.monotonic() + ttl_seconds * self.renew_fraction)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="session-renewer", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def remove(self, session_id: str):
+        """Stop renewing the session, for example before it is destroyed."""
+        with self._condition:
+            self._sessions.pop(session_id, None)
+
+    def get_session_ids(self) -> List[str]:
+        with self._condition:
+            return list(self._sessions.keys())
+
+    def stop(self):
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+
+    def renew_due(self, now: float = None) -> int:
+        """Renew the sessions that are due within the batch window and return the number of renewed sessions."""
+        if now is None:
+            now = time.monotonic()
+
+        with self._condition:
+            due = [s for s in self._sessions.values() if s.due <= now + self.batch_window]
+
+        renewed = 0
+        lost = []
+        for session in due:
+            try:
+                response, _ = self.session_endpoint.renew(session.session_id)
+            except Exception as exc:
+                LOGGER.error("Could not renew session {}: {}".format(session.session_id, exc))
+                self._reschedule(session, self.retry_interval)
+                continue
+
+            if response.successful:
+                renewed += 1
+                self._reschedule(session, session.ttl_seconds * self.renew_fraction)
+            elif response.kind == 404:
+                LOGGER.warning("Session {} was invalidated".format(session.session_id))
+                lost.append(session)
+            else:
+                LOGGER.error("Failed to renew session {}: {}".format(session.session_id, response.as_string()))
+                self._reschedule(session, self.retry_interval)
+
+        for session in lost:
+            with self._condition:
+                if self._sessions.get(session.session_id) is not session:
+                    continue
+                del self._sessions[session.session_id]
+
+            if session.on_lost is not None:
+                try:
+                    session.on_lost(session.session_id)
+                except Exception as exc:
+                    LOGGER.error("Callback for lost session {} failed: {}".format(session.session_id, exc))
+
+        return renewed
+
+    def _reschedule(self, session: _RenewedSession, seconds: float):
+        with self._condition:
+            session.due = time.monotonic() + seconds
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped:
+                    if not self._sessions:
+                        self._condition.wait()
+                        continue
+
+                    remaining = min(s.due for s in self._sessions.values()) - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                if self._stopped:
+                    return
+
+            try:
+                self.renew_due()
+            except Exception as exc:
+                LOGGER.error("Renewing the sessions failed: {}".format(exc))
@@ -0,0 +1,117 @@
+import copy
+import json
+import logging
+import os
+import tempfile
+from threading import Lock
+from typing import Dict, Optional
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+
+class SnapshotEntry:
+    """The last config of a KV path that a listener applied, with the ModifyIndex it had in Consul."""
+
+    __slots__ = ("modify_index", "config")
+
+    def __init__(self, modify_index: int, config: dict):
+        self.modify_index = modify_index
+        self.config = config
+
+
+class ConfigSnapshotStore:
+    """Keeps the last known configs on disk, so the watchers can notify their listeners at startup without a round
+    trip to Consul, and a service still comes up with its last config if Consul is not reachable.
+    All the configs are kept in one json file. The file is read once when the store is created and rewritten
+    atomically after each update, via a temporary file in the same directory that replaces the old one. A missing or
+    broken file is logged and treated as empty, and a failed write is logged and ignored, so the snapshot never
+    stops the watchers.
+    """
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._lock = Lock()
+        self._entries: Dict[str, SnapshotEntry] = self._load()
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        return path.strip('/')
+
+    def get(self, path: str) -> Optional[SnapshotEntry]:
+        """Return a copy of the entry of the path, so the listener can change the config."""
+        with self._lock:
+            entry = self._entries.get(self._normalize(path))
+            if entry is None:
+                return None
+            return SnapshotEntry(entry.modify_index, copy.deepcopy(entry.config))
+
+    def put(self, path: str, modify_index: int, config: dict) -> bool:
+        """Store the config of the path and write the snapshot file. Return whether the file was written."""
+        return self.put_all({path: SnapshotEntry(modify_index, config)})
+
+    def put_all(self, entries: Dict[str, SnapshotEntry]) -> bool:
+        """Store the configs of several paths with a single write of the snapshot file. If the file can not be
+        written, the entries are not stored either.
+        """
+        if not entries:
+            return True
+
+        with self._lock:
+            previous = dict(self._entries)
+            for path, entry in entries.items():
+                self._entries[self._normalize(path)] = SnapshotEntry(entry.modify_index, copy.deepcopy(entry.config))
+            if self._write():
+                return True
+
+            # Keep the entries in step with the file, so a config that can not be written does not break later writes.
+            self._entries = previous
+            return False
+
+    def _load(self) -> Dict[str, SnapshotEntry]:
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                content = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as exc:
+            LOGGER.warning("Could not read config snapshot {}: {}".format(self.file_path, exc))
+            return {}
+
+        if not isinstance(content, dict) or content.get("version") != SNAPSHOT_VERSION:
+            LOGGER.warning("Ignoring config snapshot {} with an unknown format".format(self.file_path))
+            return {}
+
+        entries = {}
+        for path, entry in content.get("entries", {}).items():
+            try:
+                entries[path] = SnapshotEntry(int(entry["modify_index"]), entry["config"])
+            except (KeyError, TypeError, ValueError) as exc:
+                LOGGER.warning("Ignoring broken snapshot entry {}: {}".format(path, exc))
+        return entries
+
+    def _write(self) -> bool:
+        content = {
+            "version": SNAPSHOT_VERSION,
+            "entries": {path: {"modify_index": entry.modify_index, "config": entry.config}
+                        for path, entry in self._entries.items()}
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        temp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, prefix='.snapshot-',
+                                             suffix='.tmp', delete=False) as f:
+                temp_path = f.name
+                json.dump(content, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.file_path)
+            return True
+        except Exception as exc:
+            LOGGER.error("Could not write config snapshot {}: {}".format(self.file_path, exc))
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+            return False
@@ -0,0 +1,664 @@
+import base64
+import hashlib
+import json
+import logging
+import re
+import socket
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs, unquote
+
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_MAX_WAIT_SECONDS = 300
+
+
+def _parse_wait(value: str) -> float:
+    """Parse a Consul duration like 30s, 500ms or 5m into seconds."""
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)(ms|s|m|h)?', value.strip())
+    if match is None:
+        return DEFAULT_MAX_WAIT_SECONDS
+    number = float(match.group(1))
+    unit = match.group(2) or 's'
+    return number * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+
+
+def _unquote_filter_value(value: str) -> str:
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ('"', "'", '`'):
+        return value[1:-1]
+    return value
+
+
+def _select(service: dict, selector: str):
+    value = service
+    for part in selector.strip().split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _matches_filter(service: dict, expression: str) -> bool:
+    """Evaluate the subset of the Consul filter expressions that counselor.filter.Filter creates."""
+    expression = expression.strip()
+
+    for operator in (' not contains ', ' contains '):
+        if operator in expression:
+            selector, value = expression.split(operator, 1)
+            contained = _unquote_filter_value(value) in (_select(service, selector) or [])
+            return contained if operator == ' contains ' else not contained
+
+    for operator in (' not in ', ' in '):
+        if operator in expression:
+            value, selector = expression.split(operator, 1)
+            contained = _unquote_filter_value(value) in (_select(service, selector) or [])
+            return contained if operator == ' in ' else not contained
+
+    for operator in ('==', '!='):
+        if operator in expression:
+            selector, value = expression.split(operator, 1)
+            equal = str(_select(service, selector)) == _unquote_filter_value(value)
+            return equal if operator == '==' else not equal
+
+    match = re.fullmatch(r'(\S+)\s+(is\s+)?(not\s+)?empty.*', expression)
+    if match is not None:
+        empty = not _select(service, match.group(1))
+        return empty if match.group(3) is None else not empty
+
+    raise ValueError("Unsupported filter expression: {}".format(expression))
+
+
+class FakeConsulState:
+    """In memory state of the FakeConsul server. Every write raises the global index, like the raft index of Consul.
+    Blocking queries wait on the condition until the index of their result is greater than the requested index.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.index = 1
+        self.kv: Dict[str, dict] = {}
+        self.tombstones: Dict[str, int] = {}
+        self.services: Dict[str, dict] = {}
+        self.services_index = 1
+        self.passing: Dict[str, bool] = {}
+        self.sessions: Dict[str, dict] = {}
+        self.session_expiry: Dict[str, float] = {}
+        self.lock_delays: Dict[str, float] = {}
+
+    def next_index(self) -> int:
+        self.index += 1
+        self.condition.notify_all()
+        return self.index
+
+    def kv_index(self, key: str, recurse: bool) -> int:
+        """Return the index of a key or a prefix, which changes with every write or delete below it."""
+        index = 0
+        if recurse:
+            for k, entry in self.kv.items():
+                if k.startswith(key):
+                    index = max(index, entry['ModifyIndex'])
+            for k, deleted_at in self.tombstones.items():
+                if k.startswith(key):
+                    index = max(index, deleted_at)
+        else:
+            entry = self.kv.get(key)
+            index = entry['ModifyIndex'] if entry is not None else self.tombstones.get(key, 0)
+        return index if index > 0 else self.index
+
+    def kv_set(self, key: str, value: bytes, flags: int = None) -> dict:
+        index = self.next_index()
+        entry = self.kv.get(key)
+        if entry is None:
+            entry = {'LockIndex': 0, 'Key': key, 'Flags': 0, 'Value': None, 'CreateIndex': index,
+                     'ModifyIndex': index}
+            self.kv[key] = entry
+            self.tombstones.pop(key, None)
+        entry['Value'] = value
+        entry['ModifyIndex'] = index
+        if flags is not None:
+            entry['Flags'] = flags
+        return entry
+
+    def kv_delete(self, key: str, recurse: bool):
+        keys = [k for k in self.kv if k.startswith(key)] if recurse else [key]
+        keys = [k for k in keys if k in self.kv]
+        if not keys:
+            return
+        index = self.next_index()
+        for k in keys:
+            del self.kv[k]
+            self.tombstones[k] = index
+
+    def register_service(self, service: dict):
+        self.services[service['ID']] = service
+        self.passing.setdefault(service['ID'], True)
+        self.services_index = self.next_index()
+
+    def deregister_service(self, service_id: str) -> bool:
+        if service_id not in self.services:
+            return False
+        del self.services[service_id]
+        self.passing.pop(service_id, None)
+        self.services_index = self.next_index()
+        return True
+
+    def create_session(self, session: dict, ttl_seconds: float):
+        session['CreateIndex'] = session['ModifyIndex'] = self.next_index()
+        self.sessions[session['ID']] = session
+        if ttl_seconds > 0:
+            self.session_expiry[session['ID']] = time.monotonic() + ttl_seconds
+
+    def renew_session(self, session_id: str, ttl_seconds: float) -> Optional[dict]:
+        session = self.sessions.get(session_id)
+        if session is not None and ttl_seconds > 0:
+            self.session_expiry[session_id] = time.monotonic() + ttl_seconds
+        return session
+
+    def destroy_session(self, session_id: str) -> bool:
+        """Invalidate the session. Its locks are released, or the keys deleted with the delete behavior, and
+        they can not be acquired again until the lock delay is over.
+        """
+        session = self.sessions.pop(session_id, None)
+        self.session_expiry.pop(session_id, None)
+        if session is None:
+            return False
+
+        held_keys = [key for key, entry in self.kv.items() if entry.get('Session') == session_id]
+        if not held_keys:
+            self.next_index()
+            return True
+
+        lock_delay_until = time.monotonic() + session['LockDelay'] / 1e9
+        for key in held_keys:
+            if session['LockDelay'] > 0:
+                self.lock_delays[key] = lock_delay_until
+            if session['Behavior'] == 'delete':
+                self.kv_delete(key, False)
+            else:
+                entry = self.kv[key]
+                entry.pop('Session', None)
+                entry['ModifyIndex'] = self.next_index()
+        return True
+
+    def expire_sessions(self) -> Optional[float]:
+        """Destroy the sessions whose TTL is over and return the seconds until the next one expires."""
+        now = time.monotonic()
+        for session_id, expires_at in list(self.session_expiry.items()):
+            if expires_at <= now:
+                LOGGER.debug("Session {} expired".format(session_id))
+                self.destroy_session(session_id)
+
+        if not self.session_expiry:
+            return None
+        return max(0.0, min(self.session_expiry.values()) - now)
+
+    def wait_for(self, compute_index: Callable[[], int], index: int, wait_seconds: float):
+        """Block until the index computed by compute_index is greater than the given index, or the wait time is
+        over. Sessions that expire while waiting are destroyed, so a blocked query sees their locks released.
+        Must be called with the condition held.
+        """
+        deadline = time.monotonic() + wait_seconds
+        while True:
+            next_expiry = self.expire_sessions()
+            if compute_index() > index:
+                return
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self.condition.wait(remaining if next_expiry is None else min(remaining, next_expiry + 0.001))
+
+
+def _encode_entry(entry: dict, with_value=True) -> dict:
+    encoded = dict(entry)
+    value = entry['Value']
+    encoded['Value'] = base64.b64encode(value).decode() if with_value and value is not None else None
+    return encoded
+
+
+def _service_hash(service: dict) -> str:
+    return hashlib.sha256(json.dumps(service, sort_keys=True).encode()).hexdigest()[:16]
+
+
+class _Response:
+    def __init__(self, status: int, body=None, index: int = None, headers: Dict[str, str] = None, raw=False):
+        self.status = status
+        self.body = body
+        self.index = index
+        self.headers = headers or {}
+        self.raw = raw
+
+    def encode(self) -> bytes:
+        if self.body is None:
+            return b''
+        if self.raw:
+            return self.body if isinstance(self.body, bytes) else str(self.body).encode()
+        return json.dumps(self.body).encode()
+
+
+class FakeConsul:
+    """In-process stand-in for a Consul agent on a local port, implementing the subset of the HTTP API that
+    counselor uses: KV with get, put, delete, recurse, raw, keys, separator, flags and cas, blocking queries with
+    X-Consul-Index, agent service register, deregister, list with filters and get with hash blocking, txn, the
+    health service endpoint and sessions with TTL, lock delay, acquire and release. Sessions expire exactly after
+    their TTL. It has no ACLs and there is a single node.
+    Use it as context manager or call start and stop:
+
+        with FakeConsul() as consul:
+            client = ConsulClient(consul.endpoint_config())
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, max_wait: float = DEFAULT_MAX_WAIT_SECONDS):
+        self.state = FakeConsulState()
+        self.max_wait = max_wait
+        self.requests = 0
+        # Answer of a follower to stale reads, to simulate a server that lost contact with the leader
+        self.stale_last_contact_ms = 0
+        self.stale_known_leader = True
+        self._server = ThreadingHTTPServer((host, port), self._create_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def endpoint_config(self, **kwargs) -> EndpointConfig:
+        """Return an EndpointConfig that points to this server. The kwargs are passed to the EndpointConfig."""
+        return EndpointConfig(host=self.host, port=self.port, **kwargs)
+
+    def start(self) -> 'FakeConsul':
+        if self._thread is None:
+            self._thread = Thread(target=self._server.serve_forever, name="fake-consul", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
+        with self.state.condition:
+            self.state.condition.notify_all()
+
+    def __enter__(self) -> 'FakeConsul':
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def set_passing(self, service_id: str, passing: bool):
+        """Set the state of the health checks of a registered service."""
+        with self.state.condition:
+            self.state.passing[service_id] = passing
+            self.state.services_index = self.state.next_index()
+
+    def _create_handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                super().setup()
+                # Headers and body are written separately, without this every response waits for a delayed ACK
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, format, *args):
+                LOGGER.debug(format, *args)
+
+            def do_GET(self):
+                self._handle('GET')
+
+            def do_PUT(self):
+                self._handle('PUT')
+
+            def do_POST(self):
+                self._handle('PUT')
+
+            def do_DELETE(self):
+                self._handle('DELETE')
+
+            def _handle(self, method: str):
+                fake.requests += 1
+                url = urlparse(self.path)
+                query = parse_qs(url.query, keep_blank_values=True)
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length > 0 else b''
+
+                try:
+                    response = fake.route(method, unquote(url.path), query, body)
+                except Exception as exc:
+                    LOGGER.exception("Request {} {} failed".format(method, self.path))
+                    response = _Response(500, str(exc), raw=True)
+
+                payload = response.encode()
+                self.send_response(response.status)
+                self.send_header('Content-Type', 'text/plain' if response.raw else 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if response.index is not None:
+                    self.send_header('X-Consul-Index', str(response.index))
+                    stale = 'stale' in query
+                    self.send_header('X-Consul-KnownLeader', 'true' if not stale or fake.stale_known_leader else 'false')
+                    self.send_header('X-Consul-LastContact', str(fake.stale_last_contact_ms if stale else 0))
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+    def route(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> _Response:
+        if path.startswith('/v1/kv/'):
+            key = path[len('/v1/kv/'):]
+            if method == 'GET':
+                return self._kv_get(key, query)
+            if method == 'PUT':
+                return self._kv_put(key, query, body)
+            if method == 'DELETE':
+                return self._kv_delete(key, query)
+        elif path == '/v1/txn' and method == 'PUT':
+            return self._txn(body)
+        elif path == '/v1/agent/services' and method == 'GET':
+            return self._agent_services(query)
+        elif path == '/v1/agent/service/register' and method == 'PUT':
+            return self._agent_register(body)
+        elif path.startswith('/v1/agent/service/deregister/') and method == 'PUT':
+            return self._agent_deregister(path[len('/v1/agent/service/deregister/'):])
+        elif path.startswith('/v1/agent/service/') and method == 'GET':
+            return self._agent_service(path[len('/v1/agent/service/'):], query)
+        elif path == '/v1/status/leader' and method == 'GET':
+            return _Response(200, "{}:8300".format(self.host))
+        elif path.startswith('/v1/health/service/') and method == 'GET':
+            return self._health_service(path[len('/v1/health/service/'):], query)
+        elif path.startswith('/v1/session/'):
+            return self._session(method, path[len('/v1/session/'):], body)
+
+        return _Response(404, "Not found: {} {}".format(method, path), raw=True)
+
+    @staticmethod
+    def _param(query: Dict[str, List[str]], name: str, default=None):
+        values = query.get(name)
+        return values[0] if values else default
+
+    def _blocking_args(self, query: Dict[str, List[str]]) -> Tuple[int, float]:
+        index = int(self._param(query, 'index', 0) or 0)
+        wait = self._param(query, 'wait')
+        wait_seconds = _parse_wait(wait) if wait else self.max_wait
+        return index, min(wait_seconds, self.max_wait)
+
+    def _kv_get(self, key: str, query: Dict[str, List[str]]) -> _Response:
+        state = self.state
+        keys_only = 'keys' in query
+        recurse = 'recurse' in query or keys_only
+        index, wait_seconds = self._blocking_args(query)
+
+        with state.condition:
+            state.expire_sessions()
+            if index > 0:
+                state.wait_for(lambda: state.kv_index(key, recurse), index, wait_seconds)
+
+            result_index = state.kv_index(key, recurse)
+            if recurse:
+                entries = [state.kv[k] for k in sorted(state.kv) if k.startswith(key)]
+            else:
+                entries = [state.kv[key]] if key in state.kv else []
+
+            if not entries:
+                return _Response(404, None, result_index)
+
+            if keys_only:
+                separator = self._param(query, 'separator')
+                keys = []
+                for entry in entries:
+                    k = entry['Key']
+                    if separator:
+                        position = k.find(separator, len(key))
+                        if position >= 0:
+                            k = k[:position + len(separator)]
+                    if not keys or keys[-1] != k:
+                        keys.append(k)
+                return _Response(200, keys, result_index)
+
+            if 'raw' in query:
+                return _Response(200, entries[0]['Value'] or b'', result_index, raw=True)
+
+            return _Response(200, [_encode_entry(entry) for entry in entries], result_index)
+
+    def _kv_put(self, key: str, query: Dict[str, List[str]], body: bytes) -> _Response:
+        state = self.state
+        flags = self._param(query, 'flags')
+        flags = int(flags) if flags is not None else None
+        with state.condition:
+            state.expire_sessions()
+            entry = state.kv.get(key)
+
+            cas = self._param(query, 'cas')
+            if cas is not None:
+                current = entry['ModifyIndex'] if entry is not None else 0
+                if int(cas) != current:
+                    return _Response(200, False, state.index)
+
+            session = self._param(query, 'acquire')
+            if session is not None:
+                if session not in state.sessions:
+                    return _Response(500, "invalid session \"{}\"".format(session), raw=True)
+                if entry is not None and entry.get('Session') not in (None, session):
+                    return _Response(200, False, state.index)
+                if state.lock_delays.get(key, 0) > time.monotonic():
+                    return _Response(200, False, state.index)
+                entry = state.kv_set(key, body, flags)
+                if entry.get('Session') != session:
+                    entry['LockIndex'] += 1
+                entry['Session'] = session
+                return _Response(200, True, state.index)
+
+            session = self._param(query, 'release')
+            if session is not None:
+                if entry is None or entry.get('Session') != session:
+                    return _Response(200, False, state.index)
+                entry = state.kv_set(key, body, flags)
+                entry.pop('Session', None)
+                return _Response(200, True, state.index)
+
+            state.kv_set(key, body, flags)
+            return _Response(200, True, state.index)
+
+    def _kv_delete(self, key: str, query: Dict[str, List[str]]) -> _Response:
+        state = self.state
+        with state.condition:
+            cas = self._param(query, 'cas')
+            if cas is not None:
+                entry = state.kv.get(key)
+                if entry is None or entry['ModifyIndex'] != int(cas):
+                    return _Response(200, False, state.index)
+
+            state.kv_delete(key, 'recurse' in query)
+            return _Response(200, True, state.index)
+
+    def _txn(self, body: bytes) -> _Response:
+        state = self.state
+        operations = json.loads(body or b'[]')
+        if len(operations) > 64:
+            return _Response(413, "Transaction contains too many operations", raw=True)
+
+        with state.condition:
+            errors = []
+            for i, operation in enumerate(operations):
+                kv = operation.get('KV', {})
+                key = kv.get('Key', '')
+                verb = kv.get('Verb')
+                entry = state.kv.get(key)
+                if verb in ('cas', 'delete-cas'):
+                    current = entry['ModifyIndex'] if entry is not None else 0
+                    if kv.get('Index', 0) != current:
+                        errors.append({'OpIndex': i, 'What': "failed to {} key {}, index is stale".format(verb, key)})
+                elif verb == 'get' and entry is None:
+                    errors.append({'OpIndex': i, 'What': "key {} doesn't exist".format(key)})
+                elif verb not in ('set', 'get', 'delete', 'delete-tree'):
+                    errors.append({'OpIndex': i, 'What': "unknown KV verb {}".format(verb)})
+
+            if errors:
+                return _Response(409, {'Results': None, 'Errors': errors}, state.index)
+
+            results = []
+            for operation in operations:
+                kv = operation['KV']
+                key = kv.get('Key', '')
+                verb = kv['Verb']
+                if verb in ('set', 'cas'):
+                    value = base64.b64decode(kv['Value']) if kv.get('Value') is not None else b''
+                    entry = state.kv_set(key, value, kv.get('Flags'))
+                    results.append({'KV': _encode_entry(entry, with_value=False)})
+                elif verb == 'get':
+                    results.append({'KV': _encode_entry(state.kv[key])})
+                elif verb in ('delete', 'delete-cas'):
+                    state.kv_delete(key, False)
+                elif verb == 'delete-tree':
+                    state.kv_delete(key, True)
+
+            return _Response(200, {'Results': results, 'Errors': None}, state.index)
+
+    def _agent_services(self, query: Dict[str, List[str]]) -> _Response:
+        filters = query.get('filter', [])
+        with self.state.condition:
+            services = {}
+            for service_id, service in self.state.services.items():
+                if all(_matches_filter(service, expression) for expression in filters):
+                    services[service_id] = service
+            return _Response(200, services, self.state.services_index)
+
+    def _agent_register(self, body: bytes) -> _Response:
+        definition = json.loads(body or b'{}')
+        service_id = definition.get('ID') or definition.get('Name')
+        if not service_id:
+            return _Response(400, "Missing service name", raw=True)
+
+        service = {
+            'ID': service_id,
+            'Service': definition.get('Name', service_id),
+            'Tags': definition.get('Tags') or [],
+            'Meta': definition.get('Meta') or {},
+            'Port': definition.get('Port', 0),
+            'Address': definition.get('Address', ''),
+            'Weights': {'Passing': 1, 'Warning': 1},
+            'EnableTagOverride': False,
+            'Datacenter': 'dc1',
+        }
+        with self.state.condition:
+            self.state.register_service(service)
+        return _Response(200, None)
+
+    def _agent_deregister(self, service_id: str) -> _Response:
+        with self.state.condition:
+            if not self.state.deregister_service(service_id):
+                return _Response(404, "Unknown service ID {}".format(service_id), raw=True)
+        return _Response(200, None)
+
+    def _agent_service(self, service_id: str, query: Dict[str, List[str]]) -> _Response:
+        state = self.state
+        last_hash = self._param(query, 'hash')
+        _, wait_seconds = self._blocking_args(query)
+
+        with state.condition:
+            if last_hash:
+                deadline = time.monotonic() + wait_seconds
+                while True:
+                    service = state.services.get(service_id)
+                    if service is None or _service_hash(service) != last_hash:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    state.condition.wait(remaining)
+
+            service = state.services.get(service_id)
+            if service is None:
+                return _Response(404, "unknown service ID: {}".format(service_id), raw=True)
+
+            content_hash = _service_hash(service)
+            body = dict(service)
+            body['ContentHash'] = content_hash
+            return _Response(200, body, headers={'X-Consul-ContentHash': content_hash})
+
+    def _health_service(self, service_name: str, query: Dict[str, List[str]]) -> _Response:
+        state = self.state
+        index, wait_seconds = self._blocking_args(query)
+        passing_only = 'passing' in query and self._param(query, 'passing') not in ('false', '0')
+        tag = self._param(query, 'tag')
+
+        with state.condition:
+            if index > 0:
+                state.wait_for(lambda: state.services_index, index, wait_seconds)
+
+            entries = []
+            for service_id, service in sorted(state.services.items()):
+                if service['Service'] != service_name:
+                    continue
+                if tag is not None and tag not in service['Tags']:
+                    continue
+                passing = state.passing.get(service_id, True)
+                if passing_only and not passing:
+                    continue
+                entries.append({
+                    'Node': {'Node': 'fake-node', 'Address': '127.0.0.1', 'Datacenter': 'dc1'},
+                    'Service': service,
+                    'Checks': [{'CheckID': 'service:' + service_id, 'ServiceID': service_id,
+                                'Status': 'passing' if passing else 'critical'}],
+                })
+            return _Response(200, entries, state.services_index)
+
+    @staticmethod
+    def _session_ttl_seconds(session: dict) -> float:
+        return _parse_wait(session['TTL']) if session.get('TTL') else 0
+
+    def _session(self, method: str, path: str, body: bytes) -> _Response:
+        state = self.state
+        action, _, session_id = path.partition('/')
+        with state.condition:
+            state.expire_sessions()
+
+            if action == 'create' and method == 'PUT':
+                definition = json.loads(body or b'{}')
+                session = {
+                    'ID': str(uuid.uuid4()),
+                    'Name': definition.get('Name', ''),
+                    'Node': 'fake-node',
+                    'LockDelay': int(_parse_wait(definition.get('LockDelay', '15s')) * 1e9),
+                    'Behavior': definition.get('Behavior', 'release'),
+                    'TTL': definition.get('TTL', ''),
+                    'NodeChecks': definition.get('NodeChecks', ['serfHealth']),
+                    'ServiceChecks': None,
+                }
+                state.create_session(session, self._session_ttl_seconds(session))
+                return _Response(200, {'ID': session['ID']}, state.index)
+
+            if action == 'destroy' and method == 'PUT':
+                state.destroy_session(session_id)
+                return _Response(200, True, state.index)
+
+            if action == 'renew' and method == 'PUT':
+                session = state.sessions.get(session_id)
+                if session is None:
+                    return _Response(404, "Session id '{}' not found".format(session_id), raw=True)
+                state.renew_session(session_id, self._session_ttl_seconds(session))
+                return _Response(200, [session], state.index)
+
+            if action == 'info' and method == 'GET':
+                session = state.sessions.get(session_id)
+                return _Response(200, [session] if session is not None else [], state.index)
+
+            if action == 'list' and method == 'GET':
+                return _Response(200, list(state.sessions.values()), state.index)
+
+        return _Response(404, "Not found: {} /v1/session/{}".format(method, path), raw=True)
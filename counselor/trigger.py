@@ -1,17 +1,22 @@
 import logging
 from threading import Thread, Event
 
+from counselor.scheduler import Scheduler
+
 LOGGER = logging.getLogger(__name__)
 
 
 class Trigger(Thread):
     """Periodically execute registered tasks.
+    By default every task runs in its own thread. If a Scheduler is given, the checks of all tasks are executed by
+    the worker pool of the scheduler instead, so the number of threads does not grow with the number of tasks.
     """
 
-    def __init__(self):
+    def __init__(self, scheduler: Scheduler = None):
         Thread.__init__(self)
         self.tasks = []
         self.running = False
+        self.scheduler = scheduler
 
     def clear(self):
         self.stop_tasks()
@@ -30,6 +35,9 @@ class Trigger(Thread):
         self.stop_tasks()
 
     def get_number_of_active_tasks(self) -> int:
+        if self.scheduler is not None:
+            return self.scheduler.get_number_of_active_tasks()
+
         active = 0
         for t in self.tasks:
             if t.is_alive():
@@ -40,6 +48,14 @@ class Trigger(Thread):
     def run(self):
         LOGGER.info("Starting tasks...")
 
+        if self.scheduler is not None:
+            for t in self.tasks:
+                self.scheduler.add_task(t)
+                LOGGER.info("Scheduled task {}".format(t.name))
+            self.scheduler.start()
+            LOGGER.info("Trigger is active.")
+            return
+
         for t in self.tasks:
             t.start()
             LOGGER.info("Active task {}".format(t.name))
@@ -51,5 +67,8 @@ class Trigger(Thread):
             LOGGER.info("Stopping task {}".format(t.name))
             t.stop()
 
+        if self.scheduler is not None:
+            self.scheduler.stop()
+
         self.running = False
         LOGGER.info("Trigger exited.")
@@ -35,10 +35,53 @@ class Task(Thread):
         """
         pass
 
+    def get_wait_seconds(self) -> float:
+        """Return the seconds to wait before the next check
+        """
+        return self.interval.total_seconds()
+
     def stop(self):
         self.stop_event.set()
-        self.join()
+        if self.is_alive():
+            self.join()
 
     def run(self):
-        while not self.stop_event.wait(self.interval.total_seconds()):
+        while not self.stop_event.wait(self.get_wait_seconds()):
             self.check()
+
+
+class BlockingTask(Task):
+    """Base class for tasks that can use blocking queries instead of polling.
+    If blocking_wait is set, the next check starts immediately after the last one, because Consul holds the request
+    until there is a change or the wait time is over. The interval is then only used to back off after errors.
+    Keep in mind that stopping the task has to wait for the pending request, which takes up to blocking_wait.
+    """
+
+    def __init__(self, name: str, interval: timedelta, stop_event: Event, log_interval_seconds=3 * 60 * 60,
+                 blocking_wait: timedelta = None, daemon=True):
+        super().__init__(name, interval, stop_event, log_interval_seconds, daemon)
+        self.blocking_wait = blocking_wait
+        self.index = 0
+        self.last_check_failed = False
+
+    def is_blocking(self) -> bool:
+        return self.blocking_wait is not None
+
+    def get_wait_seconds(self) -> float:
+        if self.is_blocking() and not self.last_check_failed:
+            return 0
+        return super().get_wait_seconds()
+
+    def update_index(self, new_index: int):
+        self.index = next_blocking_index(self.index, new_index)
+
+
+def next_blocking_index(last_index: int, new_index: int) -> int:
+    """Return the index to use for the next blocking query, based on the X-Consul-Index of the last response.
+    If the index goes backwards, for example because the cluster was restored from a snapshot or the key was
+    recreated, it is reset to 0, so that the next query returns immediately with the current state. The index
+    has to be at least 1, otherwise the query would not block at all.
+    """
+    if new_index is None or new_index < last_index:
+        return 0
+    return max(1, new_index)
@@ -21,6 +21,6 @@ setup(
         'Programming Language :: Python :: 3.9',
     ],
     license='MIT',
-    install_requires=['requests==2.26.0'],
+    install_requires=['requests==2.26.0', 'urllib3>=1.26,<1.27'],
     packages=find_packages(),
 )
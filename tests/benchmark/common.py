@@ -0,0 +1,41 @@
+import base64
+import json
+import time
+from typing import Callable, List
+
+
+def create_kv_entries(number_of_entries: int, prefix: str = "project/dev/domain") -> List[dict]:
+    value = base64.b64encode(json.dumps({"active": True, "number": 42}).encode()).decode()
+    return [{"LockIndex": 0, "Key": "{}/service-{}/config".format(prefix, i), "Flags": 0, "Value": value,
+             "CreateIndex": i + 1, "ModifyIndex": i + 1} for i in range(number_of_entries)]
+
+
+def percentile(sorted_samples: List[float], fraction: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    position = min(len(sorted_samples) - 1, int(round(fraction * (len(sorted_samples) - 1))))
+    return sorted_samples[position]
+
+
+def measure_latencies(call: Callable, iterations: int, warmup: int = 10) -> dict:
+    """Call the function iterations times and return the throughput and the latency percentiles in milliseconds."""
+    for _ in range(warmup):
+        call()
+
+    samples = []
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        call_started_at = time.perf_counter()
+        call()
+        samples.append(time.perf_counter() - call_started_at)
+    elapsed = time.perf_counter() - started_at
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_second": iterations / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": percentile(samples, 0.5) * 1000,
+        "p90_ms": percentile(samples, 0.9) * 1000,
+        "p99_ms": percentile(samples, 0.99) * 1000,
+        "max_ms": samples[-1] * 1000 if samples else 0.0,
+    }
@@ -0,0 +1,46 @@
+import json
+import time
+from typing import List
+
+from counselor.endpoint.decoder import ConsulKVListDecoder
+from tests.benchmark.common import create_kv_entries
+
+SIZES = (1000, 10000, 100000)
+REPETITIONS = 5
+
+
+def run(sizes=SIZES, repetitions: int = REPETITIONS) -> List[dict]:
+    """Measure the time ConsulKVListDecoder needs to decode a recursive KV response, and to decode all the values."""
+    results = []
+    for size in sizes:
+        payload = json.dumps(create_kv_entries(size)).encode()
+
+        decode_seconds = []
+        value_seconds = []
+        for _ in range(repetitions):
+            started_at = time.perf_counter()
+            kv_list = ConsulKVListDecoder().decode(payload)
+            decoded_at = time.perf_counter()
+            for kv in kv_list:
+                _ = kv.value
+            finished_at = time.perf_counter()
+            decode_seconds.append(decoded_at - started_at)
+            value_seconds.append(finished_at - decoded_at)
+
+        result = {
+            "name": "ConsulKVListDecoder.decode",
+            "entries": size,
+            "payload_bytes": len(payload),
+            "decode_ms": min(decode_seconds) * 1000,
+            "decode_us_per_entry": min(decode_seconds) / size * 1000000,
+            "values_ms": min(value_seconds) * 1000,
+        }
+        print("{name}: {entries} entries, decode {decode_ms:.1f} ms ({decode_us_per_entry:.2f} us per entry), "
+              "values {values_ms:.1f} ms".format(**result))
+        results.append(result)
+
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,38 @@
+from typing import List
+
+from counselor.client import ConsulClient
+from counselor.endpoint.entity import KVOperation
+from counselor.testing.fake_consul import FakeConsul
+from tests.benchmark.common import measure_latencies
+
+ITERATIONS = 2000
+RECURSIVE_ENTRIES = 100
+
+
+def run(iterations: int = ITERATIONS, recursive_entries: int = RECURSIVE_ENTRIES) -> List[dict]:
+    """Measure the KVEndpoint reads against the FakeConsul server, over HTTP on the loopback interface."""
+    results = []
+    with FakeConsul() as consul:
+        kv = ConsulClient(consul.endpoint_config()).kv
+        kv.set("benchmark/single/config", {"active": True, "number": 42})
+        operations = [KVOperation.new_set("benchmark/tree/service-{}/config".format(i), {"number": i})
+                      for i in range(recursive_entries)]
+        kv.write_batch(operations)
+
+        calls = [
+            ("KVEndpoint.get", lambda: kv.get("benchmark/single/config", cached=False)),
+            ("KVEndpoint.get_raw", lambda: kv.get_raw("benchmark/single/config", cached=False)),
+            ("KVEndpoint.get_recursive", lambda: kv.get_recursive("benchmark/tree/")),
+        ]
+        for name, call in calls:
+            result = {"name": name, "entries": recursive_entries if name.endswith("recursive") else 1}
+            result.update(measure_latencies(call, iterations))
+            print("{name}: {ops_per_second:.0f} ops/s, p50 {p50_ms:.3f} ms, p90 {p90_ms:.3f} ms, "
+                  "p99 {p99_ms:.3f} ms".format(**result))
+            results.append(result)
+
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,85 @@
+import base64
+import json
+import tracemalloc
+from typing import List
+
+from counselor.endpoint.decoder import ConsulKVListDecoder, ServiceDefinitionListDecoder
+from counselor.endpoint.entity import ConsulKeyValue, ServiceDefinition
+
+NUMBER_OF_ENTRIES = 50000
+
+
+class DictConsulKeyValue:
+    """The ConsulKeyValue without slots, as reference."""
+
+    def __init__(self, kv: ConsulKeyValue):
+        for name in ConsulKeyValue.__slots__:
+            setattr(self, name, getattr(kv, name))
+
+
+class DictServiceDefinition:
+    """The ServiceDefinition without slots, as reference."""
+
+    def __init__(self, service_definition: ServiceDefinition):
+        for name in ServiceDefinition.__slots__:
+            setattr(self, name, getattr(service_definition, name))
+
+
+def create_kv_payload(number_of_entries: int) -> bytes:
+    value = base64.b64encode(json.dumps({"active": True, "number": 42}).encode()).decode()
+    entries = [{"LockIndex": 0, "Key": "project/dev/domain/service-{}/config".format(i), "Flags": 0, "Value": value,
+                "CreateIndex": i, "ModifyIndex": i} for i in range(number_of_entries)]
+    return json.dumps(entries).encode()
+
+
+def create_service_payload(number_of_entries: int) -> bytes:
+    services = {}
+    for i in range(number_of_entries):
+        key = "service-{}".format(i)
+        services[key] = {"ID": key, "Service": key, "Tags": ["test"], "Meta": {"version": "1.0"}, "Port": 8080,
+                         "Address": "10.0.0.1", "ContentHash": "abc"}
+    return json.dumps(services).encode()
+
+
+def measure(create_objects) -> (int, List):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = create_objects()
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return after - before, objects
+
+
+def compare(name: str, decoded: List, reference_class) -> dict:
+    slotted_bytes, _ = measure(lambda: [copy_slotted(e) for e in decoded])
+    dict_bytes, _ = measure(lambda: [reference_class(e) for e in decoded])
+
+    result = {
+        "name": name,
+        "entries": len(decoded),
+        "slots_bytes": slotted_bytes,
+        "dict_bytes": dict_bytes,
+        "reduction": 1 - slotted_bytes / dict_bytes,
+    }
+    print("{name}: {entries} entries, slots {slots_bytes} bytes, dict {dict_bytes} bytes, "
+          "reduction {reduction:.1%}".format(**result))
+    return result
+
+
+def copy_slotted(entity):
+    copied = type(entity).__new__(type(entity))
+    for name in type(entity).__slots__:
+        setattr(copied, name, getattr(entity, name))
+    return copied
+
+
+def run() -> List[dict]:
+    kv_list = ConsulKVListDecoder().decode(create_kv_payload(NUMBER_OF_ENTRIES))
+    service_list = ServiceDefinitionListDecoder().decode(create_service_payload(NUMBER_OF_ENTRIES))
+
+    return [compare("ConsulKeyValue", kv_list, DictConsulKeyValue),
+            compare("ServiceDefinition", service_list, DictServiceDefinition)]
+
+
+if __name__ == '__main__':
+    run()
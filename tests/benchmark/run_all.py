@@ -0,0 +1,55 @@
+import argparse
+import json
+import platform
+import subprocess
+import time
+
+from tests.benchmark import decoder_benchmark, endpoint_benchmark, entity_memory_benchmark, trigger_benchmark
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the counselor benchmarks and write the results as json.")
+    parser.add_argument("--output", default="benchmark-results.json", help="File to write the results to")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast smoke run")
+    args = parser.parse_args()
+
+    if args.quick:
+        suites = {
+            "endpoint": lambda: endpoint_benchmark.run(iterations=200, recursive_entries=50),
+            "decoder": lambda: decoder_benchmark.run(sizes=(1000, 10000), repetitions=2),
+            "trigger": lambda: trigger_benchmark.run(sizes=(10, 1000), duration_seconds=2),
+        }
+    else:
+        suites = {
+            "endpoint": endpoint_benchmark.run,
+            "decoder": decoder_benchmark.run,
+            "trigger": trigger_benchmark.run,
+            "entity_memory": entity_memory_benchmark.run,
+        }
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "quick": args.quick,
+        "suites": {},
+    }
+    for name, run in suites.items():
+        print("== {}".format(name))
+        report["suites"][name] = run()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == '__main__':
+    main()
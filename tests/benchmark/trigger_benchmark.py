@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+from datetime import timedelta
+from threading import Event
+from typing import List
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_watcher import ConfigUpdateListener, KVWatcherTask
+from counselor.scheduler import Scheduler
+from counselor.trigger import Trigger
+from tests.benchmark.common import create_kv_entries
+
+SIZES = (10, 1000, 10000)
+INTERVAL = timedelta(seconds=1)
+DURATION_SECONDS = 5
+SCHEDULER_WORKERS = 8
+
+
+class StaticTransport:
+    """Answer every request from memory, so that only the overhead of the watchers is measured."""
+
+    def __init__(self):
+        self.payload = json.dumps(create_kv_entries(1)).encode()
+        self.headers = {"X-Consul-Index": "1"}
+        self.requests = 0
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        self.requests += 1
+        return HttpResponse(200, self.payload, self.headers)
+
+
+class NoopListener(ConfigUpdateListener):
+    def __init__(self, path: str):
+        self.path = path
+
+    def get_path(self) -> str:
+        return self.path
+
+    def on_update(self, new_config: dict) -> bool:
+        return True
+
+
+def trigger_name(scheduler: Scheduler = None) -> str:
+    return "Trigger with {}".format("Scheduler" if scheduler is not None else "threads")
+
+
+def measure(number_of_tasks: int, scheduler: Scheduler = None, duration_seconds: float = DURATION_SECONDS) -> dict:
+    transport = StaticTransport()
+    client = ConsulClient(EndpointConfig(transport=transport))
+    stop_event = Event()
+    trigger = Trigger(scheduler=scheduler)
+    for i in range(number_of_tasks):
+        trigger.add_task(KVWatcherTask(NoopListener("benchmark/service-{}/config".format(i)), client, INTERVAL,
+                                       stop_event))
+
+    try:
+        threads_before = threading.active_count()
+        started_at = time.perf_counter()
+        trigger.run_nonblocking()
+        start_seconds = time.perf_counter() - started_at
+        threads = threading.active_count() - threads_before
+
+        cpu_started_at = time.process_time()
+        requests_before = transport.requests
+        time.sleep(duration_seconds)
+        cpu_seconds = time.process_time() - cpu_started_at
+        checks = transport.requests - requests_before
+    finally:
+        # Also stop the tasks that were started before a failure, so they do not keep polling during later suites.
+        stop_event.set()
+        stopped_at = time.perf_counter()
+        trigger.stop_tasks()
+        stop_seconds = time.perf_counter() - stopped_at
+
+    return {
+        "name": trigger_name(scheduler),
+        "tasks": number_of_tasks,
+        "threads": threads,
+        "start_seconds": start_seconds,
+        "stop_seconds": stop_seconds,
+        "checks_per_second": checks / duration_seconds,
+        "expected_checks_per_second": number_of_tasks / INTERVAL.total_seconds(),
+        "cpu_percent": cpu_seconds / duration_seconds * 100,
+    }
+
+
+def run(sizes=SIZES, duration_seconds: float = DURATION_SECONDS) -> List[dict]:
+    """Measure the threads and the CPU time of KVWatcherTasks that poll every second, once with a thread per task
+    and once with a Scheduler."""
+    results = []
+    for size in sizes:
+        for scheduler in (None, Scheduler(workers=SCHEDULER_WORKERS)):
+            try:
+                result = measure(size, scheduler, duration_seconds)
+            except RuntimeError as exc:
+                # Starting thousands of threads can hit the limits of the system
+                result = {"name": trigger_name(scheduler), "tasks": size, "error": str(exc)}
+                print("{name}: {tasks} tasks failed: {error}".format(**result))
+                results.append(result)
+                continue
+
+            print("{name}: {tasks} tasks, {threads} threads, {checks_per_second:.0f} of "
+                  "{expected_checks_per_second:.0f} checks/s, cpu {cpu_percent:.1f}%, start {start_seconds:.2f}s, "
+                  "stop {stop_seconds:.2f}s".format(**result))
+            results.append(result)
+
+    return results
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,120 @@
+import unittest
+from datetime import timedelta
+
+from counselor.client import ConsulClient
+from counselor.endpoint.agent_pool import AgentPool, FailoverTransport
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.testing.fake_consul import FakeConsul
+
+
+class HostTransport:
+    """Fail the requests to the hosts that are down and remember the requested URIs."""
+
+    def __init__(self, down=()):
+        self.down = set(down)
+        self.uris = []
+
+    def _send(self, uri) -> HttpResponse:
+        self.uris.append(uri)
+        for host in self.down:
+            if host in uri:
+                raise ConnectionError("{} is down".format(host))
+        return HttpResponse(200, b'true', {})
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        return self._send(uri)
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        return self._send(uri)
+
+
+def create_pool(**kwargs) -> AgentPool:
+    return AgentPool(["http://a:8500/v1", "http://b:8500/v1"], probe_interval=timedelta(0), **kwargs)
+
+
+class AgentPoolTests(unittest.TestCase):
+
+    def test_reads_fail_over_and_agent_is_ejected(self):
+        pool = create_pool(max_failures=2, ejection_backoff=timedelta(minutes=1))
+        transport = HostTransport(down=["//a:"])
+        failover = FailoverTransport(transport, pool)
+
+        for _ in range(3):
+            self.assertEqual(200, failover.get("http://a:8500/v1/kv/config").status_code)
+
+        self.assertEqual(["http://a:8500/v1/kv/config", "http://b:8500/v1/kv/config",
+                          "http://a:8500/v1/kv/config", "http://b:8500/v1/kv/config",
+                          "http://b:8500/v1/kv/config"], transport.uris)
+        self.assertTrue(pool.agents[0].is_ejected())
+        self.assertEqual(["http://b:8500/v1"], [agent.base_uri for agent in pool.get_candidates()])
+
+    def test_writes_are_not_retried(self):
+        pool = create_pool()
+        failover = FailoverTransport(HostTransport(down=["//a:"]), pool)
+
+        with self.assertRaises(ConnectionError):
+            failover.put("http://a:8500/v1/kv/config", "value")
+        self.assertEqual(1, pool.agents[0].consecutive_failures)
+
+    def test_fastest_agent_first(self):
+        pool = create_pool()
+        pool.record_success(pool.agents[0], 0.050)
+        pool.record_success(pool.agents[1], 0.005)
+
+        self.assertEqual("http://b:8500/v1", pool.get_candidates()[0].base_uri)
+
+    def test_probe_reinstates_agent(self):
+        pool = create_pool(max_failures=1, ejection_backoff=timedelta(0))
+        transport = HostTransport(down=["//a:"])
+        pool.record_failure(pool.agents[0])
+        self.assertEqual(1, pool.agents[0].ejections)
+
+        pool.probe(transport)
+        self.assertEqual(2, pool.agents[0].ejections)
+
+        transport.down.clear()
+        pool.probe(transport)
+        self.assertEqual(0, pool.agents[0].ejections)
+        self.assertIn("http://a:8500/v1/status/leader", transport.uris)
+
+    def test_endpoint_config_with_addresses(self):
+        config = EndpointConfig(addresses=["10.0.0.1:8501", "10.0.0.2"], transport=HostTransport())
+
+        self.assertEqual("10.0.0.1", config.host)
+        self.assertEqual(8501, config.port)
+        self.assertEqual(["http://10.0.0.1:8501/v1", "http://10.0.0.2:8500/v1"],
+                         [agent.base_uri for agent in config.agent_pool.agents])
+        self.assertIsInstance(config.transport, FailoverTransport)
+
+    def test_endpoint_config_with_agent_pool_only(self):
+        transport = HostTransport(down=["//a:"])
+        pool = create_pool()
+        client = ConsulClient(EndpointConfig(agent_pool=pool, transport=transport))
+
+        client.kv.get_raw("config", cached=False)
+
+        self.assertEqual(["http://a:8500/v1/kv/config?raw=True", "http://b:8500/v1/kv/config?raw=True"],
+                         transport.uris)
+        self.assertEqual(1, pool.agents[0].consecutive_failures)
+
+    def test_reads_survive_agent_outage(self):
+        with FakeConsul() as first, FakeConsul() as second:
+            for consul in (first, second):
+                ConsulClient(consul.endpoint_config()).kv.set("project/config", {"a": 1})
+
+            config = EndpointConfig(addresses=["127.0.0.1:{}".format(first.port), "127.0.0.1:{}".format(second.port)],
+                                    connect_timeout=1)
+            client = ConsulClient(config)
+            self.assertEqual({"a": 1}, client.kv.get("project/config", cached=False)[1].value)
+
+            first.stop()
+            for _ in range(5):
+                response, entry = client.kv.get("project/config", cached=False)
+                self.assertTrue(response.successful)
+                self.assertEqual({"a": 1}, entry.value)
+            config.agent_pool.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+from collections import Counter
+
+from counselor.balancer import LoadBalancer, RoundRobinStrategy, RandomTwoChoicesStrategy, \
+    LeastOutstandingStrategy
+from counselor.client import ConsulClient
+from counselor.discovery import ServiceDiscovery
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+def create_instances(number: int):
+    return tuple(ServiceDefinition(key="api-{}".format(i), address="10.0.0.{}".format(i), port=8080)
+                 for i in range(number))
+
+
+class ServicesTransport:
+    def __init__(self, services: dict):
+        self.services = services
+        self.uris = []
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        self.uris.append(uri)
+        return HttpResponse(200, json.dumps(self.services).encode(), {})
+
+
+class LoadBalancerTests(unittest.TestCase):
+
+    def test_round_robin(self):
+        instances = create_instances(3)
+        balancer = LoadBalancer(lambda: instances, RoundRobinStrategy())
+
+        picked = [balancer.pick().key for _ in range(6)]
+
+        self.assertEqual(["api-0", "api-1", "api-2", "api-0", "api-1", "api-2"], picked)
+
+    def test_no_instances(self):
+        balancer = LoadBalancer(lambda: ())
+
+        self.assertIsNone(balancer.pick())
+        with balancer.acquire() as instance:
+            self.assertIsNone(instance)
+
+    def test_least_outstanding(self):
+        instances = create_instances(3)
+        balancer = LoadBalancer(lambda: instances, LeastOutstandingStrategy())
+
+        with balancer.acquire() as first:
+            with balancer.acquire() as second:
+                self.assertNotEqual(first.key, second.key)
+                self.assertEqual(1, balancer.get_outstanding(first.key))
+                with balancer.acquire() as third:
+                    self.assertNotIn(third.key, (first.key, second.key))
+
+        self.assertEqual(0, balancer.get_outstanding(first.key))
+
+    def test_random_two_choices_avoids_busy_instance(self):
+        instances = create_instances(2)
+        strategy = RandomTwoChoicesStrategy()
+
+        picked = Counter(strategy.select(instances, {"api-0": 5}).key for _ in range(50))
+
+        self.assertEqual({"api-1": 50}, picked)
+        self.assertEqual("api-0", strategy.select(instances[:1], {}).key)
+
+    def test_balancer_with_service_search(self):
+        transport = ServicesTransport({"api-1": {"ID": "api-1", "Port": 8080, "Tags": ["api"]},
+                                       "api-2": {"ID": "api-2", "Port": 8081, "Tags": ["api"]}})
+        service_discovery = ServiceDiscovery(ConsulClient(EndpointConfig(transport=transport)))
+
+        balancer = service_discovery.create_load_balancer(tags=["api"])
+        try:
+            self.assertEqual({"api-1", "api-2"}, {balancer.pick().key for _ in range(4)})
+            self.assertEqual(1, len(transport.uris))
+            self.assertIn("filter=api+in+Tags", transport.uris[0])
+        finally:
+            balancer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
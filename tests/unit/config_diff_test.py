@@ -0,0 +1,66 @@
+import unittest
+from datetime import timedelta
+from threading import Event
+
+from counselor.client import ConsulClient
+from counselor.config_diff import ConfigDiff
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_watcher import DiffConfigUpdateListener, KVWatcherTask
+from fixtures import ScriptedTransport, kv_response
+
+
+class TestDiffListener(DiffConfigUpdateListener):
+    def __init__(self):
+        self.diffs = []
+
+    def get_path(self) -> str:
+        return "project/dev/feature/service/config"
+
+    def on_diff(self, diff: ConfigDiff, new_config: dict) -> bool:
+        self.diffs.append(diff)
+        return True
+
+
+class ConfigDiffTests(unittest.TestCase):
+
+    def test_compute(self):
+        old = {"a": 1, "b": {"c": 2, "d": 3}, "e": "x", "f": [1]}
+        new = {"a": 1, "b": {"c": 4}, "e": {"nested": True}, "f": [1], "g": None}
+
+        diff = ConfigDiff.compute(old, new)
+
+        self.assertEqual({("g",): None}, diff.added)
+        self.assertEqual({("b", "d"): 3}, diff.removed)
+        self.assertEqual({("b", "c"): (2, 4), ("e",): ("x", {"nested": True})}, diff.changed)
+        self.assertEqual({"b", "e", "g"}, diff.affected_top_level_keys())
+
+    def test_type_change_is_a_change(self):
+        diff = ConfigDiff.compute({"a": 1}, {"a": True})
+
+        self.assertEqual({("a",): (1, True)}, diff.changed)
+        self.assertTrue(ConfigDiff.compute({"a": 1}, {"a": 1}).is_empty())
+        self.assertEqual({("a",): 1}, ConfigDiff.compute(None, {"a": 1}).added)
+
+
+class DiffConfigUpdateListenerTests(unittest.TestCase):
+
+    def test_watcher_delivers_diffs(self):
+        transport = ScriptedTransport([kv_response({"a": 1, "b": 1}, 10, 10),
+                                       kv_response({"a": 1, "b": 2}, 11, 11),
+                                       kv_response({"a": 1, "b": 2}, 12, 12)])
+        listener = TestDiffListener()
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVWatcherTask(listener, client, timedelta(seconds=1), Event())
+
+        task.check()
+        task.check()
+        task.check()
+
+        self.assertEqual(2, len(listener.diffs))
+        self.assertEqual({("a",): 1, ("b",): 1}, listener.diffs[0].added)
+        self.assertEqual({("b",): (1, 2)}, listener.diffs[1].changed)
+        self.assertEqual(12, task.last_modify_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import unittest
+from datetime import timedelta
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig, ConsistencyMode
+from counselor.endpoint.kv_cache import KVCache
+from counselor.testing.fake_consul import FakeConsul
+
+
+class StaleTransport:
+    """Answer stale reads with the given last contact and remember the query parameters."""
+
+    def __init__(self, last_contact_ms: int, known_leader=True):
+        self.last_contact_ms = last_contact_ms
+        self.known_leader = known_leader
+        self.queries = []
+        self.waits = []
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        query = parse_qs(urlparse(uri).query, keep_blank_values=True)
+        self.queries.append(query)
+        self.waits.append(wait.total_seconds() if wait is not None else None)
+        stale = "stale" in query
+        headers = {"X-Consul-Index": "5",
+                   "X-Consul-LastContact": str(self.last_contact_ms if stale else 0),
+                   "X-Consul-KnownLeader": "true" if self.known_leader or not stale else "false"}
+        return HttpResponse(200, b'[]', headers)
+
+
+class ConsistencyModeTests(unittest.TestCase):
+
+    def test_default_mode_of_the_client(self):
+        transport = StaleTransport(10)
+        client = ConsulClient(EndpointConfig(transport=transport, consistency=ConsistencyMode.STALE))
+
+        response, _ = client.kv.get_recursive("project/")
+        client.kv.get_keys("project/", consistency=ConsistencyMode.CONSISTENT)
+        client.health.service("api", consistency=ConsistencyMode.DEFAULT)
+        client.service.search()
+
+        self.assertIn("stale", transport.queries[0])
+        self.assertIn("consistent", transport.queries[1])
+        self.assertNotIn("stale", transport.queries[2])
+        self.assertNotIn("stale", transport.queries[3])
+        self.assertEqual(10, response.last_contact)
+        self.assertTrue(response.known_leader)
+
+    def test_too_stale_read_is_retried_with_the_leader(self):
+        transport = StaleTransport(2000)
+        client = ConsulClient(EndpointConfig(transport=transport, consistency=ConsistencyMode.STALE,
+                                             max_staleness=timedelta(seconds=1)))
+
+        response, _ = client.kv.get_recursive("project/")
+
+        self.assertEqual(2, len(transport.queries))
+        self.assertNotIn("stale", transport.queries[1])
+        self.assertEqual(0, response.last_contact)
+
+        client.kv.get_recursive("project/", max_staleness=timedelta(seconds=5))
+        self.assertEqual(3, len(transport.queries))
+
+    def test_too_stale_blocking_read_is_retried_without_blocking(self):
+        transport = StaleTransport(2000)
+        client = ConsulClient(EndpointConfig(transport=transport, consistency=ConsistencyMode.STALE,
+                                             max_staleness=timedelta(seconds=1)))
+
+        client.kv.get("project/config", index=4, wait=timedelta(seconds=30), cached=False)
+
+        self.assertEqual(["4"], transport.queries[0]["index"])
+        self.assertEqual(["30s"], transport.queries[0]["wait"])
+        self.assertNotIn("index", transport.queries[1])
+        self.assertNotIn("wait", transport.queries[1])
+        self.assertEqual([30, None], transport.waits)
+
+    def test_unknown_leader_is_retried(self):
+        transport = StaleTransport(0, known_leader=False)
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        client.kv.get_recursive("project/", consistency=ConsistencyMode.STALE, max_staleness=timedelta(seconds=1))
+
+        self.assertEqual(2, len(transport.queries))
+
+    def test_cache_is_bypassed_for_consistency_modes(self):
+        transport = StaleTransport(0)
+        client = ConsulClient(EndpointConfig(transport=transport), kv_cache=KVCache())
+
+        client.kv.get("project/config")
+        client.kv.get("project/config", consistency=ConsistencyMode.CONSISTENT)
+        client.kv.get_raw("project/config", consistency=ConsistencyMode.STALE, max_staleness=timedelta(seconds=1))
+        client.kv.get_raw("project/config", max_staleness=timedelta(seconds=1))
+        self.assertEqual(4, len(transport.queries))
+
+        client.kv.get("project/config")
+        client.kv.get_raw("project/config")
+        self.assertEqual(5, len(transport.queries))
+
+    def test_unknown_mode(self):
+        client = ConsulClient(EndpointConfig(transport=StaleTransport(0)))
+        with self.assertRaises(ValueError):
+            client.kv.get_recursive("project/", consistency="eventual")
+
+    def test_stale_read_against_fake_consul(self):
+        with FakeConsul() as consul:
+            consul.stale_last_contact_ms = 500
+            client = ConsulClient(consul.endpoint_config(consistency=ConsistencyMode.STALE,
+                                                         max_staleness=timedelta(seconds=1)))
+            client.kv.set("project/config", {"a": 1})
+
+            response, entry = client.kv.get("project/config", cached=False)
+            self.assertEqual(500, response.last_contact)
+            self.assertEqual({"a": 1}, entry.value)
+
+            consul.stale_last_contact_ms = 1500
+            requests = consul.requests
+            response, _ = client.kv.get("project/config", cached=False)
+            self.assertEqual(0, response.last_contact)
+            self.assertEqual(requests + 2, consul.requests)
+
+
+if __name__ == '__main__':
+    unittest.main()
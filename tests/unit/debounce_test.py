@@ -0,0 +1,105 @@
+import time
+import unittest
+from datetime import timedelta
+from threading import Event
+
+from counselor.config_diff import ConfigDiff
+from counselor.debounce import DebouncedConfigUpdateListener
+from counselor.kv_watcher import ConfigUpdateListener, DiffConfigUpdateListener
+
+
+class RecordingListener(ConfigUpdateListener):
+    def __init__(self, failures=0):
+        self.configs = []
+        self.failures = failures
+        self.delivered = Event()
+
+    def get_path(self) -> str:
+        return "project/dev/feature/service/config"
+
+    def on_update(self, new_config: dict) -> bool:
+        if self.failures > 0:
+            self.failures -= 1
+            return False
+        self.configs.append(new_config)
+        self.delivered.set()
+        return True
+
+
+class RecordingDiffListener(DiffConfigUpdateListener):
+    def __init__(self):
+        self.diffs = []
+
+    def get_path(self) -> str:
+        return "project/dev/feature/service/config"
+
+    def on_diff(self, diff: ConfigDiff, new_config: dict) -> bool:
+        self.diffs.append(diff)
+        return True
+
+
+class DebouncedConfigUpdateListenerTests(unittest.TestCase):
+
+    def test_burst_is_coalesced(self):
+        inner = RecordingListener()
+        listener = DebouncedConfigUpdateListener(inner, quiet_period=timedelta(milliseconds=50))
+        try:
+            self.assertTrue(listener.on_init({"a": 0}))
+            for i in range(1, 4):
+                self.assertTrue(listener.on_update({"a": i}))
+
+            self.assertEqual([{"a": 0}], inner.configs)
+            self.assertTrue(inner.delivered.wait(2))
+            time.sleep(0.1)
+            self.assertEqual([{"a": 0}, {"a": 3}], inner.configs)
+        finally:
+            listener.stop()
+
+    def test_max_delay_bounds_a_long_burst(self):
+        inner = RecordingListener()
+        listener = DebouncedConfigUpdateListener(inner, quiet_period=timedelta(milliseconds=100),
+                                                 max_delay=timedelta(milliseconds=200))
+        try:
+            delivered_during_burst = False
+            for i in range(40):
+                listener.on_update({"a": i})
+                if inner.delivered.wait(0.02):
+                    delivered_during_burst = True
+                    break
+
+            self.assertTrue(delivered_during_burst)
+            self.assertEqual(1, len(inner.configs))
+        finally:
+            listener.stop()
+
+    def test_failed_delivery_is_retried(self):
+        inner = RecordingListener(failures=1)
+        listener = DebouncedConfigUpdateListener(inner, quiet_period=timedelta(milliseconds=10))
+        try:
+            listener.on_update({"a": 1})
+
+            self.assertTrue(inner.delivered.wait(2))
+            self.assertEqual([{"a": 1}], inner.configs)
+        finally:
+            listener.stop()
+
+    def test_diff_against_last_delivered_config(self):
+        inner = RecordingDiffListener()
+        listener = DebouncedConfigUpdateListener(inner, quiet_period=timedelta(seconds=5))
+
+        listener.on_init({"a": 1, "b": 1})
+        listener.on_update({"a": 2, "b": 1})
+        listener.on_update({"a": 1, "b": 2})
+        listener.stop(flush=True)
+
+        self.assertEqual(2, len(inner.diffs))
+        self.assertEqual({("b",): (1, 2)}, inner.diffs[1].changed)
+
+    def test_max_delay_shorter_than_quiet_period(self):
+        with self.assertRaises(ValueError):
+            DebouncedConfigUpdateListener(RecordingListener(), quiet_period=timedelta(seconds=2),
+                                          max_delay=timedelta(seconds=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import time
+import unittest
+from datetime import timedelta
+from threading import Event
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.dispatcher import ListenerDispatcher
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_watcher import KVWatcherTask, KVPrefixWatcherTask
+from counselor.service_watcher import ServiceWatcherTask
+from fixtures import (ScriptedTransport, ServiceTransport, TestListener, TestServiceListener, kv_entry, kv_list_response,
+                      kv_response)
+
+
+class BlockingListener(TestListener):
+    """Blocks in on_update until it is released."""
+
+    def __init__(self):
+        super().__init__()
+        self.initialized = []
+        self.entered = Event()
+        self.release = Event()
+
+    def on_init(self, config: dict) -> bool:
+        self.entered.set()
+        self.release.wait(2)
+        self.initialized.append(config)
+        return True
+
+
+class FlakyListener(TestListener):
+    """Fails the first calls of on_init and on_update."""
+
+    def __init__(self, path="project/dev/feature/service/config", init_failures=0, update_failures=0):
+        super().__init__(path)
+        self.init_failures = init_failures
+        self.update_failures = update_failures
+
+    def on_init(self, config: dict) -> bool:
+        if self.init_failures > 0:
+            self.init_failures -= 1
+            raise ValueError("broken")
+        return super().on_update(config)
+
+    def on_update(self, new_config: dict) -> bool:
+        if self.update_failures > 0:
+            self.update_failures -= 1
+            return False
+        return super().on_update(new_config)
+
+
+class FlakyServiceListener(TestServiceListener):
+    def __init__(self):
+        super().__init__()
+        self.failures = 1
+
+    def on_init(self, service_definition) -> bool:
+        if self.failures > 0:
+            self.failures -= 1
+            return False
+        return super().on_init(service_definition)
+
+
+def wait_for_calls(dispatcher: ListenerDispatcher, name: str, calls: int):
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        stats = dispatcher.get_stats().get(name)
+        if stats is not None and stats.delivered + stats.failed >= calls:
+            return
+        time.sleep(0.01)
+    raise AssertionError("{} was not called {} times".format(name, calls))
+
+
+class ListenerDispatcherTests(unittest.TestCase):
+
+    def test_latest_wins_and_initial_is_kept(self):
+        dispatcher = ListenerDispatcher(workers=2)
+        calls = []
+        entered = Event()
+        release = Event()
+
+        def slow(initial, value):
+            entered.set()
+            release.wait(2)
+            calls.append(("slow", initial, value))
+            return True
+
+        def record(initial, value):
+            calls.append(("record", initial, value))
+            return value != "fail"
+
+        try:
+            dispatcher.dispatch("slow", "slow", slow, True, 1)
+            self.assertTrue(entered.wait(2))
+            dispatcher.dispatch("a", "a", record, True, 1)
+            dispatcher.dispatch("a", "a", record, False, 2)
+            dispatcher.dispatch("slow", "slow", slow, False, 2)
+            dispatcher.dispatch("slow", "slow", slow, False, 3)
+            release.set()
+        finally:
+            dispatcher.stop()
+
+        slow_calls = [c for c in calls if c[0] == "slow"]
+        self.assertEqual([("slow", True, 1), ("slow", False, 3)], slow_calls)
+        self.assertEqual(0, dispatcher.get_queue_depth())
+
+        stats = dispatcher.get_stats()
+        self.assertEqual(3, stats["slow"].dispatched)
+        self.assertEqual(1, stats["slow"].coalesced)
+        self.assertEqual(2, stats["slow"].delivered)
+        self.assertEqual(2, stats["a"].dispatched)
+
+    def test_failures_are_counted(self):
+        dispatcher = ListenerDispatcher(workers=1)
+
+        def fail(initial, value):
+            raise ValueError("broken")
+
+        dispatcher.dispatch("a", "a", fail, False, 1)
+        dispatcher.stop()
+
+        self.assertEqual(1, dispatcher.get_stats()["a"].failed)
+        with self.assertRaises(RuntimeError):
+            dispatcher.dispatch("a", "a", fail, False, 2)
+
+    def test_slow_listener_does_not_block_the_watcher(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 2}, 11, 11),
+                                       kv_response({"a": 3}, 12, 12)])
+        listener = BlockingListener()
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVWatcherTask(listener, client, timedelta(seconds=1), Event(), dispatcher=dispatcher)
+
+        task.check()
+        self.assertTrue(listener.entered.wait(2))
+        task.check()
+        task.check()
+        self.assertEqual(12, task.last_modify_index)
+        self.assertEqual(1, dispatcher.get_queue_depth())
+
+        listener.release.set()
+        dispatcher.stop()
+
+        self.assertEqual([{"a": 1}], listener.initialized)
+        self.assertEqual([{"a": 3}], listener.configs)
+        self.assertEqual(1, dispatcher.get_stats()[listener.get_path()].coalesced)
+
+    def test_failed_update_is_delivered_again(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 2}, 11, 11),
+                                       kv_response({"a": 2}, 11, 11)])
+        listener = FlakyListener(update_failures=1)
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVWatcherTask(listener, client, timedelta(seconds=1), Event(), blocking_wait=timedelta(seconds=30),
+                             dispatcher=dispatcher)
+
+        task.check()
+        wait_for_calls(dispatcher, listener.get_path(), 1)
+        task.check()
+        wait_for_calls(dispatcher, listener.get_path(), 2)
+        task.check()
+        dispatcher.stop()
+
+        self.assertNotIn("index", parse_qs(urlparse(transport.uris[2]).query))
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+        self.assertEqual(11, task.applied_modify_index)
+
+    def test_failed_init_is_delivered_again(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 1}, 10, 10)])
+        listener = FlakyListener(init_failures=1)
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVWatcherTask(listener, client, timedelta(seconds=1), Event(), dispatcher=dispatcher)
+
+        task.check()
+        wait_for_calls(dispatcher, listener.get_path(), 1)
+        task.check()
+        dispatcher.stop()
+
+        self.assertEqual([{"a": 1}], listener.configs)
+        self.assertEqual(10, task.applied_modify_index)
+
+    def test_prefix_watcher_delivers_a_failed_path_again(self):
+        entries = [kv_entry("project/a", {"a": 1}, 10), kv_entry("project/b", {"b": 1}, 11)]
+        transport = ScriptedTransport([kv_list_response(entries, 11), kv_list_response(entries, 11)])
+        listeners = [TestListener("project/a"), FlakyListener("project/b", init_failures=1)]
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVPrefixWatcherTask("project", listeners, client, timedelta(seconds=1), Event(),
+                                   blocking_wait=timedelta(seconds=30), dispatcher=dispatcher)
+
+        task.check()
+        wait_for_calls(dispatcher, "project/b", 1)
+        task.check()
+        dispatcher.stop()
+
+        self.assertNotIn("index", parse_qs(urlparse(transport.uris[1]).query))
+        self.assertEqual([{"a": 1}], listeners[0].configs)
+        self.assertEqual([{"b": 1}], listeners[1].configs)
+
+    def test_service_watcher_delivers_a_failed_definition_again(self):
+        transport = ServiceTransport({"ID": "test-service", "Port": 80}, content_hash="abc")
+        listener = FlakyServiceListener()
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = ServiceWatcherTask(listener, client, timedelta(seconds=1), Event(), dispatcher=dispatcher)
+
+        task.check()
+        wait_for_calls(dispatcher, listener.get_service_key(), 1)
+        task.check()
+        dispatcher.stop()
+
+        self.assertEqual(1, listener.initialized)
+        self.assertEqual("abc", task.applied_service_config_hash)
+
+
+if __name__ == '__main__':
+    unittest.main()
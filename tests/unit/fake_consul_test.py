@@ -0,0 +1,99 @@
+import time
+import unittest
+from datetime import timedelta
+from threading import Thread
+
+from counselor.client import ConsulClient
+from counselor.discovery import ServiceDiscovery
+from counselor.endpoint.entity import ServiceDefinition, KVOperation
+from counselor.filter import KeyValuePair
+from counselor.testing.fake_consul import FakeConsul
+
+
+class FakeConsulTests(unittest.TestCase):
+
+    def setUp(self):
+        self.consul = FakeConsul().start()
+        self.client = ConsulClient(self.consul.endpoint_config())
+
+    def tearDown(self):
+        self.consul.stop()
+
+    def test_kv(self):
+        kv = self.client.kv
+        self.assertTrue(kv.set("project/dev/a/config", {"a": 1}).successful)
+        self.assertTrue(kv.set("project/dev/b/config", {"b": 1}).successful)
+
+        response, entry = kv.get("project/dev/a/config")
+        self.assertTrue(response.successful)
+        self.assertEqual({"a": 1}, entry.value)
+        self.assertEqual({"a": 1}, kv.get_raw("project/dev/a/config")[1])
+        self.assertEqual(2, len(kv.get_recursive("project/dev/")[1]))
+        self.assertEqual(["project/dev/a/", "project/dev/b/"], kv.get_keys("project/dev/", separator="/")[1])
+
+        self.assertFalse(kv.set("project/dev/a/config", {"a": 2}, cas=entry.modify_index - 1).successful)
+        self.assertTrue(kv.set("project/dev/a/config", {"a": 2}, cas=entry.modify_index).successful)
+
+        self.assertTrue(kv.delete("project/dev/", recurse=True).successful)
+        response, _ = kv.get("project/dev/a/config", cached=False)
+        self.assertEqual(404, response.kind)
+
+    def test_blocking_query(self):
+        kv = self.client.kv
+        kv.set("project/config", {"a": 1})
+        response, entry = kv.get("project/config")
+
+        def update():
+            time.sleep(0.2)
+            ConsulClient(self.consul.endpoint_config()).kv.set("project/config", {"a": 2})
+
+        Thread(target=update).start()
+        started_at = time.monotonic()
+        blocked_response, blocked_entry = kv.get("project/config", index=response.index, wait=timedelta(seconds=5))
+
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.15)
+        self.assertEqual({"a": 2}, blocked_entry.value)
+        self.assertGreater(blocked_response.index, response.index)
+
+    def test_txn(self):
+        kv = self.client.kv
+        kv.set("project/a", {"a": 1})
+        _, entry = kv.get("project/a")
+
+        response, results = self.client.txn.execute([KVOperation.new_cas("project/a", {"a": 2}, entry.modify_index - 1),
+                                                     KVOperation.new_set("project/b", {"b": 1})])
+        self.assertFalse(results[0].successful)
+        self.assertEqual(404, kv.get("project/b")[0].kind)
+
+        response, results = self.client.txn.execute([KVOperation.new_cas("project/a", {"a": 2}, entry.modify_index),
+                                                     KVOperation.new_get("project/a")])
+        self.assertTrue(response.successful)
+        self.assertEqual({"a": 2}, results[1].kv.value)
+
+    def test_services(self):
+        discovery = ServiceDiscovery(self.client)
+        discovery.register_service(ServiceDefinition("api-1", port=8080, tags=["api"], meta={"version": "1"}))
+        discovery.register_service(ServiceDefinition("db-1", port=5432, tags=["db"], meta={"version": "2"}))
+
+        _, services = discovery.search_for_services(tags=["api"])
+        self.assertEqual(["api-1"], [s.key for s in services])
+        _, services = discovery.search_for_services(meta=[KeyValuePair("version", "2")])
+        self.assertEqual(["db-1"], [s.key for s in services])
+
+        response, details = self.client.service.get_details("api-1")
+        self.assertTrue(response.successful)
+        self.assertTrue(details.content_hash)
+        started_at = time.monotonic()
+        self.client.service.get_details("api-1", content_hash=details.content_hash, wait=timedelta(seconds=1))
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.9)
+
+        self.assertEqual(["api-1"], [s.key for s in self.client.health.service("api-1")[1]])
+        self.consul.set_passing("api-1", False)
+        self.assertEqual([], self.client.health.service("api-1")[1])
+
+        self.assertTrue(discovery.deregister_service("api-1").successful)
+        self.assertEqual(["db-1"], [s.key for s in discovery.search_for_services()[1]])
+
+
+if __name__ == '__main__':
+    unittest.main()
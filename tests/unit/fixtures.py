@@ -0,0 +1,87 @@
+"""Fixtures shared by the unit tests: scripted transports, KV payloads and recording listeners."""
+import base64
+import json
+
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.http_client import HttpResponse
+from counselor.kv_watcher import ConfigUpdateListener
+from counselor.service_watcher import ServiceUpdateListener
+
+
+def kv_entry(key: str, value: dict, modify_index: int) -> dict:
+    return {
+        "LockIndex": 0,
+        "Key": key,
+        "Flags": 0,
+        "Value": base64.b64encode(json.dumps(value).encode()).decode(),
+        "CreateIndex": 1,
+        "ModifyIndex": modify_index
+    }
+
+
+def kv_list_response(entries: list, consul_index: int) -> HttpResponse:
+    return HttpResponse(200, json.dumps(entries).encode(), {"X-Consul-Index": str(consul_index)})
+
+
+def kv_response(value: dict, modify_index: int, consul_index: int) -> HttpResponse:
+    return kv_list_response([kv_entry("project/dev/feature/service/config", value, modify_index)], consul_index)
+
+
+class ScriptedTransport:
+    """Return the prepared responses in order and remember the requested URIs."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.uris = []
+        self.waits = []
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        self.uris.append(uri)
+        self.waits.append(wait)
+        return self.responses.pop(0)
+
+
+class TestListener(ConfigUpdateListener):
+    def __init__(self, path="project/dev/feature/service/config"):
+        self.path = path
+        self.configs = []
+
+    def get_path(self) -> str:
+        return self.path
+
+    def on_update(self, new_config: dict) -> bool:
+        self.configs.append(new_config)
+        return True
+
+
+class ServiceTransport:
+    """Return the current service definition and remember the requested URIs."""
+
+    def __init__(self, service: dict, content_hash: str = None):
+        self.service = service
+        self.content_hash = content_hash
+        self.uris = []
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        self.uris.append(uri)
+        headers = {}
+        if self.content_hash:
+            headers["X-Consul-ContentHash"] = self.content_hash
+        return HttpResponse(200, json.dumps(self.service).encode(), headers)
+
+
+class TestServiceListener(ServiceUpdateListener):
+    def __init__(self):
+        self.initialized = 0
+        self.updated = 0
+
+    def get_service_key(self) -> str:
+        return "test-service"
+
+    def on_init(self, service_definition: ServiceDefinition) -> bool:
+        self.initialized += 1
+        return True
+
+    def on_update(self, service_definition: ServiceDefinition) -> bool:
+        self.updated += 1
+        return True
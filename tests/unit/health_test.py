@@ -0,0 +1,84 @@
+import json
+import threading
+import time
+import unittest
+from datetime import timedelta
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.discovery import ServiceDiscovery
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+def health_entry(service_id: str, address: str = "", node_address: str = "10.0.0.1", port: int = 8080) -> dict:
+    return {"Node": {"Node": "node-1", "Address": node_address},
+            "Service": {"ID": service_id, "Service": "api", "Address": address, "Port": port, "Tags": ["v1"],
+                        "Meta": {}},
+            "Checks": []}
+
+
+class BlockingHealthTransport:
+    """Serve the health entries and hold blocking queries until the entries change."""
+
+    def __init__(self, entries: list):
+        self.entries = entries
+        self.index = 1
+        self.changed = threading.Condition()
+        self.uris = []
+
+    def update(self, entries: list):
+        with self.changed:
+            self.entries = entries
+            self.index += 1
+            self.changed.notify_all()
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        self.uris.append(uri)
+        query = parse_qs(urlparse(uri).query)
+        with self.changed:
+            if "index" in query:
+                self.changed.wait_for(lambda: self.index > int(query["index"][0]), timeout=0.5)
+            payload = json.dumps(self.entries).encode()
+            return HttpResponse(200, payload, {"X-Consul-Index": str(self.index)})
+
+
+class HealthTests(unittest.TestCase):
+
+    def test_service_instances(self):
+        transport = BlockingHealthTransport([health_entry("api-1"), health_entry("api-2", address="10.0.0.2")])
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response, instances = client.health.service("api", tag="v1")
+
+        self.assertTrue(response.successful)
+        self.assertEqual(1, response.index)
+        self.assertEqual(["10.0.0.1", "10.0.0.2"], [i.address for i in instances])
+        self.assertEqual({"passing": ["True"], "tag": ["v1"]}, parse_qs(urlparse(transport.uris[0]).query))
+        self.assertTrue(urlparse(transport.uris[0]).path.endswith("/v1/health/service/api"))
+
+    def test_cache_is_refreshed_in_the_background(self):
+        transport = BlockingHealthTransport([health_entry("api-1")])
+        service_discovery = ServiceDiscovery(ConsulClient(EndpointConfig(transport=transport)))
+
+        cache = service_discovery.create_healthy_instance_cache(["api"], blocking_wait=timedelta(seconds=1))
+        try:
+            self.assertEqual(["api-1"], [i.key for i in cache.get_healthy_instances("api")])
+            self.assertEqual((), cache.get_healthy_instances("other"))
+
+            transport.update([health_entry("api-1"), health_entry("api-2")])
+            deadline = time.time() + 2
+            while len(cache.get_healthy_instances("api")) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(["api-1", "api-2"], [i.key for i in cache.get_healthy_instances("api")])
+            self.assertIn("index", parse_qs(urlparse(transport.uris[-1]).query))
+        finally:
+            cache.stop()
+
+        self.assertEqual((), cache.get_healthy_instances("api"))
+        self.assertEqual((), cache.get_watched_services())
+
+
+if __name__ == '__main__':
+    unittest.main()
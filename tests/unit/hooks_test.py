@@ -0,0 +1,110 @@
+import json
+import unittest
+
+from counselor.client import ConsulClient
+from counselor.endpoint.entity import ServiceDefinition
+from counselor.endpoint.hooks import TransportHooks, RequestContext
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from fixtures import kv_response
+
+
+class RecordingHooks(TransportHooks):
+    def __init__(self):
+        self.sent = []
+        self.received = []
+        self.errors = []
+
+    def before_send(self, context: RequestContext):
+        context.attributes["span"] = len(self.sent)
+        self.sent.append(context)
+
+    def after_receive(self, context: RequestContext):
+        self.received.append(context)
+
+    def on_error(self, context: RequestContext, error: Exception):
+        self.errors.append((context, error))
+
+
+class BrokenHooks(TransportHooks):
+    def before_send(self, context: RequestContext):
+        raise ValueError("broken hook")
+
+
+class Transport:
+    def __init__(self):
+        self.fail = False
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        if self.fail:
+            raise ConnectionError("agent down")
+        if "/health/" in uri:
+            return HttpResponse(200, b'[]', {})
+        if "/agent/service/" in uri:
+            return HttpResponse(200, json.dumps({"ID": "api-1", "Port": 80}).encode(), {})
+        response = kv_response({"a": 1}, 10, 10)
+        response.retries = 2
+        return response
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        return HttpResponse(200, b'true', {})
+
+
+class TransportHooksTests(unittest.TestCase):
+
+    def test_context_of_requests(self):
+        hooks = RecordingHooks()
+        client = ConsulClient(EndpointConfig(transport=Transport(), hooks=[BrokenHooks(), hooks]))
+
+        response, _ = client.kv.get("project/dev/service/config", cached=False)
+        self.assertTrue(response.successful)
+        client.kv.set("project/dev/service/config", "value")
+        client.service.get_details("api-1")
+        client.service.register(ServiceDefinition("api-1", port=80))
+        client.service.deregister("api-1")
+        client.health.service("api")
+
+        self.assertEqual(["/v1/kv/{key}", "/v1/kv/{key}", "/v1/agent/service/{service_id}",
+                          "/v1/agent/service/register", "/v1/agent/service/deregister/{service_id}",
+                          "/v1/health/service/{service}"],
+                         [context.uri_template for context in hooks.received])
+        first = hooks.received[0]
+        self.assertEqual("GET", first.method)
+        self.assertEqual(200, first.status_code)
+        self.assertEqual(2, first.retries)
+        self.assertEqual(len(kv_response({"a": 1}, 10, 10).payload), first.response_size)
+        self.assertEqual(0, first.attributes["span"])
+        self.assertIsNotNone(first.duration_seconds)
+        self.assertEqual(len("value"), hooks.received[1].request_size)
+
+    def test_on_error(self):
+        hooks = RecordingHooks()
+        transport = Transport()
+        transport.fail = True
+        client = ConsulClient(EndpointConfig(transport=transport, hooks=[hooks]))
+
+        with self.assertRaises(ConnectionError):
+            client.kv.get("project/dev/service/config", cached=False)
+
+        self.assertEqual(1, len(hooks.sent))
+        self.assertEqual(0, len(hooks.received))
+        context, error = hooks.errors[0]
+        self.assertIsInstance(error, ConnectionError)
+        self.assertIs(error, context.error)
+        self.assertEqual("/v1/kv/{key}", context.uri_template)
+
+    def test_token_is_not_passed_to_the_hooks(self):
+        hooks = RecordingHooks()
+        client = ConsulClient(EndpointConfig(transport=Transport(), hooks=[hooks], token="secret-token"))
+
+        client.kv.get_raw("project/dev/service/config", cached=False)
+        client.service.deregister("api-1")
+
+        self.assertTrue(hooks.sent[0].uri.endswith("/v1/kv/project/dev/service/config?raw=True"))
+        self.assertTrue(hooks.sent[1].uri.endswith("/v1/agent/service/deregister/api-1"))
+        for context in hooks.sent:
+            self.assertNotIn("secret-token", context.uri)
+
+
+if __name__ == '__main__':
+    unittest.main()
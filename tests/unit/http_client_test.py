@@ -0,0 +1,37 @@
+import unittest
+from datetime import timedelta
+
+from counselor.endpoint.http_client import HttpRequest
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+class HttpRequestTests(unittest.TestCase):
+
+    def test_pool_and_retry_settings(self):
+        config = EndpointConfig(pool_connections=2, pool_maxsize=50, max_retries=3, retry_backoff_factor=0.5)
+        adapter = config.transport.session.get_adapter("http://127.0.0.1:8500/v1/kv/test")
+
+        self.assertEqual(50, adapter._pool_maxsize)
+        self.assertEqual(3, adapter.max_retries.total)
+        self.assertEqual(0.5, adapter.max_retries.backoff_factor)
+        self.assertNotIn("PUT", adapter.max_retries.allowed_methods)
+
+    def test_timeouts(self):
+        transport = EndpointConfig(connect_timeout=1, read_timeout=5, write_timeout=2).transport
+
+        self.assertEqual((1, 5), transport._read_timeouts())
+        self.assertEqual((1, 2), transport._write_timeouts())
+        self.assertEqual((1, 5 + 160 + 10), transport._read_timeouts(timedelta(seconds=160)))
+
+    def test_single_timeout(self):
+        transport = HttpRequest(timeout=3)
+        self.assertEqual((3, 3), transport._write_timeouts())
+        self.assertEqual((3, 3 + 16 + 1), transport._read_timeouts(timedelta(seconds=16)))
+
+    def test_no_timeout(self):
+        transport = EndpointConfig().transport
+        self.assertEqual((None, None), transport._read_timeouts(timedelta(seconds=10)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import time
+import unittest
+from datetime import timedelta
+
+from counselor.client import ConsulClient
+from counselor.endpoint.common import Response
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.endpoint.kv_cache import KVCache
+
+
+class CountingTransport:
+    """Serve a single raw config and count the requests."""
+
+    def __init__(self):
+        self.gets = 0
+        self.puts = 0
+
+    def get(self, uri) -> HttpResponse:
+        self.gets += 1
+        return HttpResponse(200, b'{"a": 1}', {"X-Consul-Index": "3"})
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        self.puts += 1
+        return HttpResponse(200, b'true', {})
+
+
+class KVCacheTests(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = KVCache(max_entries=2)
+        cache.put(KVCache.RAW, "a", Response(), {"a": 1})
+        cache.put(KVCache.RAW, "b", Response(), {"b": 1})
+        cache.get(KVCache.RAW, "a")
+        cache.put(KVCache.RAW, "c", Response(), {"c": 1})
+
+        self.assertTrue(cache.get(KVCache.RAW, "a")[0])
+        self.assertFalse(cache.get(KVCache.RAW, "b")[0])
+        self.assertTrue(cache.get(KVCache.RAW, "c")[0])
+        self.assertEqual(1, cache.evictions)
+        self.assertEqual(3, cache.hits)
+        self.assertEqual(1, cache.misses)
+
+    def test_ttl(self):
+        cache = KVCache(ttl=timedelta(milliseconds=20))
+        cache.put(KVCache.KV, "/a/", Response(), {"a": 1})
+        self.assertTrue(cache.get(KVCache.KV, "a")[0])
+
+        time.sleep(0.05)
+        self.assertFalse(cache.get(KVCache.KV, "a")[0])
+        self.assertEqual(0, cache.size())
+
+    def test_values_are_copied(self):
+        cache = KVCache()
+        cache.put(KVCache.RAW, "a", Response(), {"a": 1})
+        _, _, value = cache.get(KVCache.RAW, "a")
+        value["a"] = 2
+
+        self.assertEqual({"a": 1}, cache.get(KVCache.RAW, "a")[2])
+
+    def test_invalidate_prefix(self):
+        cache = KVCache()
+        cache.put(KVCache.RAW, "project/dev/a", Response(), {})
+        cache.put(KVCache.KV, "project/dev/b", Response(), {})
+        cache.put(KVCache.RAW, "project/prod/a", Response(), {})
+        cache.invalidate_prefix("project/dev")
+
+        self.assertEqual(1, cache.size())
+
+    def test_endpoint_reads_through_cache(self):
+        transport = CountingTransport()
+        cache = KVCache()
+        client = ConsulClient(EndpointConfig(transport=transport), kv_cache=cache)
+
+        for _ in range(3):
+            response, config = client.kv.get_raw("project/dev/service")
+            self.assertTrue(response.successful)
+            self.assertEqual({"a": 1}, config)
+        self.assertEqual(1, transport.gets)
+
+        client.kv.get_raw("project/dev/service", cached=False)
+        self.assertEqual(2, transport.gets)
+
+        client.kv.set("project/dev/service", {"a": 2})
+        client.kv.get_raw("project/dev/service")
+        self.assertEqual(3, transport.gets)
+        self.assertEqual(2, cache.hits)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import base64
+import json
+import unittest
+from datetime import timedelta
+from urllib.parse import urlparse
+
+from counselor.client import ConsulClient
+from counselor.endpoint.common import Response
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_updater import KVUpdater
+
+
+class CASTransport:
+    """Keep a single key in memory and apply check-and-set transactions on it."""
+
+    def __init__(self, value=None, modify_index=0):
+        self.value = value
+        self.modify_index = modify_index
+        self.gets = 0
+        self.transactions = 0
+        self.concurrent_updates = []
+
+    def get(self, uri) -> HttpResponse:
+        self.gets += 1
+        if self.value is None:
+            return HttpResponse(404, b'', {"X-Consul-Index": "1"})
+
+        entry = {"Key": "config", "Value": base64.b64encode(json.dumps(self.value).encode()).decode(),
+                 "ModifyIndex": self.modify_index}
+        return HttpResponse(200, json.dumps([entry]).encode(), {"X-Consul-Index": str(self.modify_index)})
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        self.transactions += 1
+        self.assert_txn(uri)
+        if self.concurrent_updates:
+            self.value = self.concurrent_updates.pop(0)
+            self.modify_index += 1
+
+        kv = data[0]["KV"]
+        if kv["Index"] != self.modify_index:
+            errors = [{"OpIndex": 0, "What": "index mismatch"}]
+            return HttpResponse(409, json.dumps({"Errors": errors}).encode(), {})
+
+        self.value = json.loads(base64.b64decode(kv["Value"]))
+        self.modify_index += 1
+        result = {"KV": {"Key": kv["Key"], "Value": None, "ModifyIndex": self.modify_index}}
+        return HttpResponse(200, json.dumps({"Results": [result]}).encode(), {})
+
+    @staticmethod
+    def assert_txn(uri):
+        if not urlparse(uri).path.endswith("/txn"):
+            raise AssertionError("Expected a transaction: {}".format(uri))
+
+
+class KVMergeTests(unittest.TestCase):
+
+    def test_merge_retries_on_conflict(self):
+        transport = CASTransport({"a": 1, "b": 1}, modify_index=5)
+        transport.concurrent_updates.append({"a": 1, "b": 2})
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response, kv = client.kv.merge_cas("config", {"a": 3}, backoff=timedelta(milliseconds=1))
+
+        self.assertTrue(response.successful)
+        self.assertEqual({"a": 3, "b": 2}, transport.value)
+        self.assertEqual(2, transport.gets)
+        self.assertEqual(2, transport.transactions)
+        self.assertEqual(transport.modify_index, kv.modify_index)
+
+    def test_merge_creates_missing_config(self):
+        transport = CASTransport()
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response = client.kv.merge("config", {"a": 1})
+
+        self.assertTrue(response.successful)
+        self.assertEqual({"a": 1}, transport.value)
+
+    def test_merge_gives_up(self):
+        transport = CASTransport({"a": 1}, modify_index=5)
+        transport.concurrent_updates.extend([{"a": 2}, {"a": 3}])
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response, kv = client.kv.merge_cas("config", {"b": 1}, max_attempts=2, backoff=timedelta(milliseconds=1))
+
+        self.assertFalse(response.successful)
+        self.assertEqual(Response.ErrorTypes.CASConflict, response.kind)
+        self.assertIsNone(kv)
+
+    def test_merge_with_malformed_config(self):
+        transport = CASTransport({"a": 1}, modify_index=5)
+        transport.get = lambda uri: HttpResponse(200, json.dumps([{"Key": "config", "Value": "bm90IGpzb24=",
+                                                                    "ModifyIndex": 5}]).encode(), {})
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response, kv = client.kv.merge_cas("config", {"b": 1})
+
+        self.assertFalse(response.successful)
+        self.assertEqual("DecodeError", response.kind)
+        self.assertIsNone(kv)
+        self.assertEqual(0, transport.transactions)
+
+    def test_updater_skips_the_read(self):
+        transport = CASTransport({"a": 1}, modify_index=5)
+        updater = KVUpdater("config", ConsulClient(EndpointConfig(transport=transport)))
+
+        self.assertTrue(updater.merge({"b": 1}).successful)
+        self.assertTrue(updater.merge({"c": 1}).successful)
+
+        self.assertEqual({"a": 1, "b": 1, "c": 1}, transport.value)
+        self.assertEqual(1, transport.gets)
+        self.assertEqual(2, transport.transactions)
+
+
+if __name__ == '__main__':
+    unittest.main()
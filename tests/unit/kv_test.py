@@ -1,6 +1,8 @@
+import json
 import unittest
 
-from counselor.endpoint.decoder import JsonDecoder
+from counselor.endpoint.decoder import JsonDecoder, ConsulKVDecoder, ConsulKVListDecoder
+from counselor.endpoint.entity import ServiceDefinition
 
 
 class KeyValueTestCase(unittest.TestCase):
@@ -12,6 +14,38 @@ class KeyValueTestCase(unittest.TestCase):
         self.assertTrue(decoder.successful)
         self.assertIsNotNone(result)
 
+    def test_kv_value_is_decoded_lazily(self):
+        json_bytes = b'[{"LockIndex":0,"Key":"test","Flags":0,"Value":"eyJmb28iOiAzLjE0MTV9","CreateIndex":5331,"ModifyIndex":5332}]'
+        decoder = ConsulKVDecoder()
+        result = decoder.decode(json_bytes)
+        self.assertTrue(decoder.successful)
+        self.assertEqual(5332, result.modify_index)
+        self.assertFalse(result.is_decoded())
+
+        self.assertEqual({"foo": 3.1415}, result.value)
+        self.assertTrue(result.is_decoded())
+        self.assertIs(result.value, result.value)
+
+    def test_kv_list_without_values(self):
+        json_bytes = b'[{"Key":"a","Value":null,"ModifyIndex":1},{"Key":"b","Value":"eyJiIjogMX0=","ModifyIndex":2}]'
+        decoder = ConsulKVListDecoder()
+        result = decoder.decode(json_bytes)
+        self.assertEqual({}, result[0].value)
+        self.assertEqual({"b": 1}, result[1].value)
+
+        result[1].value = {"b": 2}
+        self.assertEqual({"b": 2}, result[1].value)
+
+    def test_slotted_entities(self):
+        service_definition = ServiceDefinition(key="test", port=8080, tags=["a"], meta={"version": "1"})
+        self.assertFalse(hasattr(service_definition, "__dict__"))
+        self.assertEqual({"key": "test", "address": None, "port": 8080, "tags": ["a"], "meta": {"version": "1"},
+                          "content_hash": None, "check": None, "interval": None, "ttl": None, "http_check": None},
+                         json.loads(service_definition.as_json()))
+
+        kv = ConsulKVDecoder().decode(b'[{"Key":"a","Value":null}]')
+        self.assertFalse(hasattr(kv, "__dict__"))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,105 @@
+import base64
+import json
+import threading
+import unittest
+from urllib.parse import urlparse, parse_qs, unquote
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+class TreeTransport:
+    """Serve key listings and transactional gets from an in-memory tree."""
+
+    def __init__(self, store: dict):
+        self.store = store
+        self.lock = threading.Lock()
+        self.listings = []
+        self.transactions = []
+
+    def entry(self, key: str) -> dict:
+        value = base64.b64encode(json.dumps(self.store[key]).encode()).decode()
+        return {"Key": key, "Value": value, "ModifyIndex": 1}
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        parsed = urlparse(uri)
+        prefix = unquote(parsed.path.split("/v1/kv/", 1)[1])
+        query = parse_qs(parsed.query)
+
+        if "keys" in query:
+            separator = query.get("separator", [None])[0]
+            keys = set()
+            for key in self.store:
+                if not key.startswith(prefix):
+                    continue
+                position = key.find(separator, len(prefix)) if separator else -1
+                keys.add(key if position == -1 else key[:position + 1])
+            with self.lock:
+                self.listings.append(prefix)
+            if not keys:
+                return HttpResponse(404, b'', {})
+            return HttpResponse(200, json.dumps(sorted(keys)).encode(), {})
+
+        if prefix not in self.store:
+            return HttpResponse(404, b'', {})
+        return HttpResponse(200, json.dumps([self.entry(prefix)]).encode(), {})
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        with self.lock:
+            self.transactions.append(len(data))
+        keys = [op["KV"]["Key"] for op in data]
+        missing = [i for i, key in enumerate(keys) if key not in self.store]
+        if missing:
+            errors = [{"OpIndex": i, "What": "key not found"} for i in missing]
+            return HttpResponse(409, json.dumps({"Errors": errors}).encode(), {})
+        results = [{"KV": self.entry(key)} for key in keys]
+        return HttpResponse(200, json.dumps({"Results": results}).encode(), {})
+
+
+class KVWalkTests(unittest.TestCase):
+
+    def setUp(self):
+        self.store = {"app/": {}}
+        for env in ("dev", "prod"):
+            for i in range(50):
+                self.store["app/{}/service-{}/config".format(env, i)] = {"env": env, "i": i}
+        self.store["app/readme"] = {"text": "hello"}
+        self.transport = TreeTransport(self.store)
+        self.client = ConsulClient(EndpointConfig(transport=self.transport))
+
+    def test_get_keys_with_separator(self):
+        response, keys = self.client.kv.get_keys("app/", separator="/")
+
+        self.assertTrue(response.successful)
+        self.assertEqual(["app/", "app/dev/", "app/prod/", "app/readme"], keys)
+
+    def test_walk_fetches_all_values_in_batches(self):
+        response, entries = self.client.kv.walk("app/", batch_size=16, max_workers=3)
+        self.assertTrue(response.successful)
+
+        found = {e.key: e.value for e in entries}
+
+        self.assertEqual(self.store, found)
+        self.assertEqual(len(self.store), sum(self.transport.transactions))
+        self.assertTrue(all(size <= 16 for size in self.transport.transactions))
+        self.assertIn("app/dev/service-7/", self.transport.listings)
+
+    def test_deleted_keys_are_skipped(self):
+        response, keys = self.client.kv.get_keys("app/dev/service-1/")
+        del self.store["app/dev/service-1/config"]
+
+        response, entries = self.client.kv.get_many(keys + ["app/readme"])
+
+        self.assertTrue(response.successful)
+        self.assertEqual(["app/readme"], [e.key for e in entries])
+
+    def test_walk_missing_path(self):
+        response, entries = self.client.kv.walk("other/")
+
+        self.assertFalse(response.successful)
+        self.assertIsNone(entries)
+
+
+if __name__ == '__main__':
+    unittest.main()
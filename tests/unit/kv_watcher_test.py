@@ -0,0 +1,128 @@
+import base64
+import unittest
+from datetime import timedelta
+from threading import Event
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_watcher import KVWatcherTask, KVPrefixWatcherTask
+from counselor.watcher import next_blocking_index
+from fixtures import ScriptedTransport, TestListener, kv_entry, kv_list_response, kv_response
+
+
+class KVWatcherTaskTests(unittest.TestCase):
+
+    def create_task(self, transport: ScriptedTransport, listener: TestListener) -> KVWatcherTask:
+        client = ConsulClient(EndpointConfig(transport=transport))
+        return KVWatcherTask(listener, client, timedelta(seconds=1), Event(), blocking_wait=timedelta(seconds=30))
+
+    def test_blocking_query_uses_last_index(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 2}, 12, 12)])
+        listener = TestListener()
+        task = self.create_task(transport, listener)
+
+        task.check()
+        task.check()
+        task.check()
+
+        self.assertNotIn("index", parse_qs(urlparse(transport.uris[0]).query))
+        self.assertEqual(["10"], parse_qs(urlparse(transport.uris[1]).query)["index"])
+        self.assertEqual(["30s"], parse_qs(urlparse(transport.uris[1]).query)["wait"])
+        self.assertEqual([None, timedelta(seconds=30), timedelta(seconds=30)], transport.waits)
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+        self.assertEqual(12, task.index)
+        self.assertEqual(0, task.get_wait_seconds())
+
+    def test_index_going_backwards_is_reset(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_response({"a": 2}, 5, 5),
+                                       kv_response({"a": 2}, 5, 5)])
+        listener = TestListener()
+        task = self.create_task(transport, listener)
+
+        task.check()
+        task.check()
+        self.assertEqual(0, task.index)
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+
+        task.check()
+        self.assertNotIn("index", parse_qs(urlparse(transport.uris[2]).query))
+        self.assertEqual(5, task.index)
+        self.assertEqual(2, len(listener.configs))
+
+    def test_malformed_value_fails_the_check(self):
+        broken = kv_entry("project/dev/feature/service/config", {}, 11)
+        broken["Value"] = base64.b64encode(b"not json").decode()
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10),
+                                       kv_list_response([broken], 11),
+                                       kv_response({"a": 2}, 12, 12)])
+        listener = TestListener()
+        task = self.create_task(transport, listener)
+
+        task.check()
+        task.check()
+        self.assertTrue(task.last_check_failed)
+        self.assertEqual(10, task.index)
+
+        task.check()
+        self.assertFalse(task.last_check_failed)
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+
+    def test_next_blocking_index(self):
+        self.assertEqual(0, next_blocking_index(10, 3))
+        self.assertEqual(1, next_blocking_index(0, 0))
+        self.assertEqual(12, next_blocking_index(10, 12))
+        self.assertEqual(0, next_blocking_index(10, None))
+
+
+class KVPrefixWatcherTaskTests(unittest.TestCase):
+
+    def test_only_changed_listeners_are_notified(self):
+        transport = ScriptedTransport([
+            kv_list_response([kv_entry("project/dev/a/config", {"a": 1}, 3),
+                              kv_entry("project/dev/b/config", {"b": 1}, 4)], 4),
+            kv_list_response([kv_entry("project/dev/a/config", {"a": 1}, 3),
+                              kv_entry("project/dev/b/config", {"b": 2}, 7)], 7)])
+        listener_a = TestListener("project/dev/a/config")
+        listener_b = TestListener("/project/dev/b/config")
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVPrefixWatcherTask("project/dev/", [listener_a, listener_b], client, timedelta(seconds=1), Event(),
+                                   blocking_wait=timedelta(seconds=10))
+
+        task.check()
+        task.check()
+
+        self.assertEqual(2, len(transport.uris))
+        self.assertIn("recurse", parse_qs(urlparse(transport.uris[0]).query))
+        self.assertEqual(["4"], parse_qs(urlparse(transport.uris[1]).query)["index"])
+        self.assertEqual([{"a": 1}], listener_a.configs)
+        self.assertEqual([{"b": 1}, {"b": 2}], listener_b.configs)
+
+    def test_malformed_value_only_skips_its_listener(self):
+        broken = kv_entry("project/dev/b/config", {}, 4)
+        broken["Value"] = "not base64"
+        transport = ScriptedTransport([kv_list_response([kv_entry("project/dev/a/config", {"a": 1}, 3), broken], 4)])
+        listener_a = TestListener("project/dev/a/config")
+        listener_b = TestListener("project/dev/b/config")
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVPrefixWatcherTask("project/dev/", [listener_a, listener_b], client, timedelta(seconds=1), Event(),
+                                   blocking_wait=timedelta(seconds=10))
+
+        task.check()
+
+        self.assertTrue(task.last_check_failed)
+        self.assertEqual([{"a": 1}], listener_a.configs)
+        self.assertEqual([], listener_b.configs)
+
+    def test_listener_outside_prefix(self):
+        client = ConsulClient(EndpointConfig(transport=ScriptedTransport([])))
+        with self.assertRaises(ValueError):
+            KVPrefixWatcherTask("project/dev/", [TestListener("other/dev/a/config")], client, timedelta(seconds=1),
+                                Event())
+
+
+if __name__ == '__main__':
+    unittest.main()
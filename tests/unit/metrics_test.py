@@ -0,0 +1,91 @@
+import unittest
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.metrics import MetricsRegistry
+from fixtures import kv_response
+
+
+class KVTransport:
+    def __init__(self):
+        self.fail = False
+
+    def get(self, uri, wait=None) -> HttpResponse:
+        if self.fail:
+            raise ConnectionError("agent down")
+        if uri.endswith("missing"):
+            return HttpResponse(404, b'', {})
+        return kv_response({"a": 1}, 10, 10)
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        return HttpResponse(200, b'true', {})
+
+
+class MetricsRegistryTests(unittest.TestCase):
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry()
+        counter = registry.counter("requests_total", "Requests", ("path",))
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+        counter.inc(("a\"b",))
+        counter.inc(("a\"b",), 2)
+        histogram.observe((), 0.05)
+        histogram.observe((), 0.5)
+        histogram.observe((), 5)
+
+        self.assertIs(counter, registry.counter("requests_total", "Requests", ("path",)))
+        self.assertEqual("\n".join([
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{le="0.1"} 1',
+            'latency_seconds_bucket{le="1"} 2',
+            'latency_seconds_bucket{le="+Inf"} 3',
+            'latency_seconds_sum 5.55',
+            'latency_seconds_count 3',
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{path="a\\"b"} 3',
+        ]) + "\n", registry.render_prometheus())
+
+    def test_conflicting_registration(self):
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests", ("path",))
+
+        with self.assertRaises(ValueError):
+            registry.histogram("requests_total", "Requests", ("path",))
+        with self.assertRaises(ValueError):
+            registry.counter("requests_total", "Requests").inc(("a", "b"))
+
+
+class HttpMetricsTests(unittest.TestCase):
+
+    def test_requests_are_recorded(self):
+        registry = MetricsRegistry()
+        transport = KVTransport()
+        client = ConsulClient(EndpointConfig(transport=transport, metrics=registry))
+
+        client.kv.get("project/config", cached=False)
+        client.kv.get("project/missing", cached=False)
+        client.kv.set("project/config", "plain")
+        transport.fail = True
+        with self.assertRaises(ConnectionError):
+            client.kv.get("project/config", cached=False)
+
+        http_metrics = client.kv._endpoint_config.http_metrics
+        self.assertEqual(3, http_metrics.request_seconds.get_count(("kv", "GET")))
+        self.assertEqual(1, http_metrics.responses.get(("kv", "GET", "200")))
+        self.assertEqual(1, http_metrics.responses.get(("kv", "GET", "404")))
+        self.assertEqual(1, http_metrics.errors.get(("kv", "GET")))
+        self.assertEqual(len("plain"), http_metrics.sent_bytes.get(("kv", "PUT")))
+        self.assertEqual(len(kv_response({"a": 1}, 10, 10).payload), http_metrics.received_bytes.get(("kv", "GET")))
+        self.assertEqual(1, http_metrics.decode_seconds.get_count(("kv", "ConsulKVDecoder")))
+        self.assertIn('counselor_http_responses_total{endpoint="kv",method="PUT",status="200"} 1',
+                      registry.render_prometheus())
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(EndpointConfig(transport=KVTransport()).http_metrics)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import threading
+import time
+import unittest
+from datetime import timedelta
+from threading import Event
+
+from counselor.scheduler import Scheduler
+from counselor.trigger import Trigger
+from counselor.watcher import Task
+
+
+class CountingTask(Task):
+    def __init__(self, name: str, interval: timedelta, stop_event: Event):
+        super().__init__(name=name, interval=interval, stop_event=stop_event)
+        self.counter = 0
+
+    def check(self):
+        self.counter += 1
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def test_tasks_share_the_worker_pool(self):
+        stop_event = Event()
+        scheduler = Scheduler(workers=2, jitter=0.2)
+        trigger = Trigger(scheduler=scheduler)
+
+        tasks = [CountingTask("task-{}".format(i), timedelta(milliseconds=10), stop_event) for i in range(200)]
+        for t in tasks:
+            trigger.add_task(t)
+
+        threads_before = threading.active_count()
+        trigger.run_nonblocking()
+        time.sleep(0.3)
+
+        self.assertEqual(threads_before + 3, threading.active_count())
+        self.assertEqual(200, trigger.get_number_of_active_tasks())
+
+        trigger.stop_tasks()
+
+        self.assertEqual(threads_before, threading.active_count())
+        self.assertEqual(0, trigger.get_number_of_active_tasks())
+        for t in tasks:
+            self.assertGreater(t.counter, 1)
+
+    def test_stopped_tasks_are_removed(self):
+        scheduler = Scheduler(workers=1, jitter=0)
+        stopped_task = CountingTask("stopped", timedelta(milliseconds=10), Event())
+        active_task = CountingTask("active", timedelta(milliseconds=10), Event())
+        scheduler.add_task(stopped_task)
+        scheduler.add_task(active_task)
+
+        stopped_task.stop()
+        scheduler.start()
+        time.sleep(0.1)
+        scheduler.stop()
+
+        self.assertEqual(0, stopped_task.counter)
+        self.assertGreater(active_task.counter, 0)
+
+    def test_invalid_jitter(self):
+        with self.assertRaises(ValueError):
+            Scheduler(jitter=1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
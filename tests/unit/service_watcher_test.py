@@ -0,0 +1,52 @@
+import unittest
+from datetime import timedelta
+from threading import Event
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.service_watcher import ServiceWatcherTask
+from fixtures import ServiceTransport, TestServiceListener
+
+
+class ServiceWatcherTaskTests(unittest.TestCase):
+
+    def test_local_hash_without_content_hash(self):
+        transport = ServiceTransport({"ID": "test-service", "Tags": ["a"], "Meta": {"version": "1"}, "Port": 80})
+        listener = TestServiceListener()
+        task = ServiceWatcherTask(listener, ConsulClient(EndpointConfig(transport=transport)), timedelta(seconds=1),
+                                  Event())
+
+        task.check()
+        task.check()
+        self.assertEqual(1, listener.initialized)
+        self.assertEqual(0, listener.updated)
+
+        transport.service["Meta"] = {"version": "2"}
+        task.check()
+        task.check()
+        self.assertEqual(1, listener.initialized)
+        self.assertEqual(1, listener.updated)
+
+    def test_blocking_query_with_content_hash(self):
+        transport = ServiceTransport({"ID": "test-service", "Port": 80}, content_hash="abc")
+        listener = TestServiceListener()
+        task = ServiceWatcherTask(listener, ConsulClient(EndpointConfig(transport=transport)), timedelta(seconds=1),
+                                  Event(), blocking_wait=timedelta(seconds=30))
+        self.assertEqual(1, task.get_wait_seconds())
+
+        task.check()
+        task.check()
+        transport.content_hash = "def"
+        task.check()
+
+        self.assertEqual({}, parse_qs(urlparse(transport.uris[0]).query))
+        self.assertEqual({"hash": ["abc"], "wait": ["30s"]}, parse_qs(urlparse(transport.uris[1]).query))
+        self.assertEqual(1, listener.initialized)
+        self.assertEqual(1, listener.updated)
+        self.assertEqual("def", task.last_content_hash)
+        self.assertEqual(0, task.get_wait_seconds())
+
+
+if __name__ == '__main__':
+    unittest.main()
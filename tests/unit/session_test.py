@@ -0,0 +1,276 @@
+import time
+import unittest
+from datetime import timedelta
+from threading import Event, Thread
+from urllib.parse import urlparse, parse_qs
+
+from counselor.client import ConsulClient
+from counselor.endpoint.common import Response
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.lock import ConsulLock, LeaderElectionTask, LeaderListener
+from counselor.session_renewer import SessionRenewer
+from counselor.testing.fake_consul import FakeConsul
+
+
+class RecordingTransport:
+    def __init__(self):
+        self.puts = []
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        self.puts.append((uri, data))
+        return HttpResponse(200, b'false', {})
+
+
+class TestLeaderListener(LeaderListener):
+    def __init__(self):
+        self.events = []
+
+    def on_elected(self):
+        self.events.append("elected")
+
+    def on_demoted(self):
+        self.events.append("demoted")
+
+
+class SessionEndpointTests(unittest.TestCase):
+
+    def setUp(self):
+        self.consul = FakeConsul().start()
+        self.client = ConsulClient(self.consul.endpoint_config())
+
+    def tearDown(self):
+        self.consul.stop()
+
+    def test_session_lifecycle(self):
+        response, session_id = self.client.session.create("worker", ttl=timedelta(seconds=30),
+                                                          lock_delay=timedelta(seconds=0))
+        self.assertTrue(response.successful)
+
+        response, session = self.client.session.info(session_id)
+        self.assertEqual("worker", session.name)
+        self.assertEqual("30s", session.ttl)
+        self.assertEqual("0ms", session.lock_delay)
+
+        response, session = self.client.session.renew(session_id)
+        self.assertTrue(response.successful)
+        self.assertEqual(session_id, session.id)
+        self.assertEqual([session_id], [s.id for s in self.client.session.list()[1]])
+
+        self.assertTrue(self.client.session.destroy(session_id).successful)
+        self.assertIsNone(self.client.session.info(session_id)[1])
+        self.assertEqual(404, self.client.session.renew(session_id)[0].kind)
+
+    def test_acquire_and_release_lock(self):
+        _, first = self.client.session.create(lock_delay=timedelta(seconds=0))
+        _, second = self.client.session.create(lock_delay=timedelta(seconds=0))
+        kv = self.client.kv
+
+        self.assertTrue(kv.acquire_lock("project/leader", first, {"owner": "first"}).successful)
+        response = kv.acquire_lock("project/leader", second)
+        self.assertFalse(response.successful)
+        self.assertEqual(Response.ErrorTypes.LockConflict, response.kind)
+
+        _, entry = kv.get("project/leader", cached=False)
+        self.assertEqual(first, entry.session)
+        self.assertEqual({"owner": "first"}, entry.value)
+
+        self.assertFalse(kv.release_lock("project/leader", second).successful)
+        self.assertTrue(kv.release_lock("project/leader", first).successful)
+        self.assertIsNone(kv.get("project/leader", cached=False)[1].session)
+
+    def test_expired_session_releases_its_lock(self):
+        _, session_id = self.client.session.create(ttl=timedelta(seconds=1), lock_delay=timedelta(seconds=0))
+        self.client.kv.acquire_lock("project/leader", session_id)
+
+        response, entry = self.client.kv.get("project/leader", cached=False)
+        self.assertEqual(session_id, entry.session)
+
+        _, entry = self.client.kv.get("project/leader", index=response.index, wait=timedelta(seconds=5),
+                                      cached=False)
+        self.assertIsNone(entry.session)
+        self.assertIsNone(self.client.session.info(session_id)[1])
+
+    def test_lock_parameters_are_sent_as_query(self):
+        transport = RecordingTransport()
+        kv = ConsulClient(EndpointConfig(transport=transport)).kv
+
+        response = kv.acquire_lock("/project/leader", "abc")
+        kv.release_lock("project/leader", "abc", "value")
+
+        self.assertEqual(Response.ErrorTypes.LockConflict, response.kind)
+        uri, data = transport.puts[0]
+        self.assertTrue(urlparse(uri).path.endswith("/kv/project/leader"))
+        self.assertEqual(["abc"], parse_qs(urlparse(uri).query)["acquire"])
+        self.assertIsNone(data)
+        uri, data = transport.puts[1]
+        self.assertEqual(["abc"], parse_qs(urlparse(uri).query)["release"])
+        self.assertEqual("value", data)
+
+
+class SessionRenewerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.consul = FakeConsul().start()
+        self.client = ConsulClient(self.consul.endpoint_config())
+
+    def tearDown(self):
+        self.consul.stop()
+
+    def test_due_sessions_are_renewed_in_one_pass(self):
+        renewer = SessionRenewer(self.client.session, batch_window=timedelta(seconds=1))
+        ids = [self.client.session.create(ttl=timedelta(seconds=10))[1] for _ in range(3)]
+        for session_id in ids:
+            renewer.add(session_id, timedelta(seconds=10))
+
+        self.assertEqual(0, renewer.renew_due())
+        self.assertEqual(3, renewer.renew_due(time.monotonic() + 4.5))
+        renewer.stop()
+
+    def test_lost_session_is_reported(self):
+        lost = []
+        renewer = SessionRenewer(self.client.session)
+        _, session_id = self.client.session.create(ttl=timedelta(seconds=10))
+        renewer.add(session_id, timedelta(seconds=10), on_lost=lost.append)
+        self.client.session.destroy(session_id)
+
+        renewer.renew_due(time.monotonic() + 10)
+
+        self.assertEqual([session_id], lost)
+        self.assertEqual([], renewer.get_session_ids())
+        renewer.stop()
+
+    def test_background_renewal_keeps_the_session(self):
+        renewer = SessionRenewer(self.client.session, batch_window=timedelta(0))
+        _, session_id = self.client.session.create(ttl=timedelta(seconds=1))
+        renewer.add(session_id, timedelta(seconds=1))
+
+        time.sleep(1.5)
+
+        self.assertIsNotNone(self.client.session.info(session_id)[1])
+        renewer.stop()
+
+
+class ConsulLockTests(unittest.TestCase):
+
+    def setUp(self):
+        self.consul = FakeConsul().start()
+        self.client = ConsulClient(self.consul.endpoint_config())
+        self.renewer = SessionRenewer(self.client.session)
+
+    def tearDown(self):
+        self.renewer.stop()
+        self.consul.stop()
+
+    def create_lock(self, lock_delay=timedelta(0)) -> ConsulLock:
+        return ConsulLock(self.client, "project/lock", lock_delay=lock_delay, renewer=self.renewer,
+                          blocking_wait=timedelta(seconds=10), retry_interval=timedelta(milliseconds=100))
+
+    def test_waiting_contender_takes_over_without_polling(self):
+        first = self.create_lock()
+        second = self.create_lock()
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire(timeout=timedelta(milliseconds=200)))
+
+        acquired_at = []
+        contender = Thread(target=lambda: second.acquire() and acquired_at.append(time.monotonic()))
+        contender.start()
+        time.sleep(0.5)
+        requests = self.consul.requests
+
+        released_at = time.monotonic()
+        self.assertTrue(first.release())
+        contender.join(5)
+
+        self.assertTrue(second.is_held())
+        self.assertLess(acquired_at[0] - released_at, 1)
+        self.assertLessEqual(self.consul.requests - requests, 3)
+
+        second.close()
+        first.close()
+        self.assertEqual([], self.client.session.list()[1])
+
+    def test_lock_delay_of_an_invalidated_session(self):
+        first = self.create_lock(lock_delay=timedelta(seconds=1))
+        second = self.create_lock()
+        first.acquire()
+        self.client.session.destroy(first.session_id)
+
+        started_at = time.monotonic()
+        self.assertTrue(second.acquire(timeout=timedelta(seconds=5)))
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.9)
+
+        self.renewer.renew_due(time.monotonic() + 60)
+        self.assertFalse(first.is_held())
+        second.close()
+
+    def test_failed_release_keeps_the_lock(self):
+        lock = self.create_lock()
+        self.assertTrue(lock.acquire())
+        release_lock = self.client.kv.release_lock
+        self.client.kv.release_lock = lambda *args: Response.create_error_result(kind=500, message="no leader")
+
+        self.assertFalse(lock.release())
+        self.assertTrue(lock.is_held())
+
+        self.client.kv.release_lock = release_lock
+        self.assertTrue(lock.release())
+        self.assertFalse(lock.is_held())
+        self.assertIsNone(self.client.kv.get("project/lock", cached=False)[1].session)
+        lock.close()
+
+    def test_release_of_a_lost_lock(self):
+        lock = self.create_lock()
+        self.assertTrue(lock.acquire())
+        self.client.session.destroy(lock.session_id)
+
+        self.assertFalse(lock.release())
+        self.assertFalse(lock.is_held())
+        lock.close()
+
+    def test_acquire_with_an_invalidated_session_creates_a_new_one(self):
+        lock = self.create_lock()
+        self.assertTrue(lock.acquire())
+        self.assertTrue(lock.release())
+        invalidated = lock.session_id
+        self.client.session.destroy(invalidated)
+
+        self.assertTrue(lock.acquire(timeout=timedelta(seconds=5)))
+        self.assertNotEqual(invalidated, lock.session_id)
+        self.assertEqual([lock.session_id], self.renewer.get_session_ids())
+        lock.close()
+
+
+class LeaderElectionTaskTests(unittest.TestCase):
+
+    def test_handover(self):
+        with FakeConsul() as consul:
+            client = ConsulClient(consul.endpoint_config())
+            renewer = SessionRenewer(client.session)
+            listeners = [TestLeaderListener(), TestLeaderListener()]
+            tasks = [LeaderElectionTask("project/leader", listener, client, timedelta(seconds=1), Event(),
+                                        blocking_wait=timedelta(seconds=1), lock_delay=timedelta(0), renewer=renewer)
+                     for listener in listeners]
+
+            tasks[0].check()
+            tasks[1].check()
+            self.assertTrue(tasks[0].is_leader())
+            self.assertFalse(tasks[1].is_leader())
+
+            tasks[0].stop()
+            tasks[1].check()
+
+            self.assertEqual(["elected", "demoted"], listeners[0].events)
+            self.assertEqual(["elected"], listeners[1].events)
+            self.assertEqual(tasks[1].lock.session_id, client.kv.get("project/leader", cached=False)[1].session)
+
+            client.session.destroy(tasks[1].lock.session_id)
+            tasks[1].check()
+            self.assertEqual(["elected", "demoted"], listeners[1].events)
+
+            tasks[1].stop()
+            renewer.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,190 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import timedelta
+from threading import Event
+
+from counselor.client import ConsulClient
+from counselor.debounce import DebouncedConfigUpdateListener
+from counselor.dispatcher import ListenerDispatcher
+from counselor.endpoint.http_endpoint import EndpointConfig
+from counselor.kv_watcher import KVWatcherTask, KVPrefixWatcherTask
+from counselor.snapshot import ConfigSnapshotStore
+from fixtures import ScriptedTransport, TestListener, kv_entry, kv_list_response, kv_response
+
+
+class UnreachableTransport:
+    def __init__(self):
+        self.requests = 0
+
+    def get(self, uri, wait=None):
+        self.requests += 1
+        raise ConnectionError("Consul is not reachable")
+
+
+class ConfigSnapshotStoreTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.directory.name, "snapshot.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries_survive_a_restart(self):
+        store = ConfigSnapshotStore(self.file_path)
+        self.assertIsNone(store.get("project/config"))
+
+        self.assertTrue(store.put("/project/config", 7, {"a": 1}))
+
+        entry = ConfigSnapshotStore(self.file_path).get("project/config")
+        self.assertEqual(7, entry.modify_index)
+        self.assertEqual({"a": 1}, entry.config)
+        self.assertEqual([os.path.basename(self.file_path)], os.listdir(self.directory.name))
+
+    def test_stored_config_is_a_copy(self):
+        store = ConfigSnapshotStore(self.file_path)
+        config = {"a": {"b": 1}}
+        store.put("project/config", 1, config)
+
+        config["a"]["b"] = 2
+        store.get("project/config").config["a"]["b"] = 3
+
+        self.assertEqual({"a": {"b": 1}}, store.get("project/config").config)
+
+    def test_broken_file_is_ignored(self):
+        with open(self.file_path, "w") as f:
+            f.write("{broken")
+
+        store = ConfigSnapshotStore(self.file_path)
+        self.assertIsNone(store.get("project/config"))
+
+        store.put("project/config", 1, {"a": 1})
+        with open(self.file_path) as f:
+            self.assertEqual(1, json.load(f)["entries"]["project/config"]["modify_index"])
+
+    def test_failed_write_keeps_the_old_file(self):
+        store = ConfigSnapshotStore(self.file_path)
+        store.put("project/config", 1, {"a": 1})
+
+        self.assertFalse(store.put("project/other", 2, {"b": object()}))
+
+        self.assertEqual(1, ConfigSnapshotStore(self.file_path).get("project/config").modify_index)
+        self.assertEqual([os.path.basename(self.file_path)], os.listdir(self.directory.name))
+
+    def test_failed_write_does_not_break_later_writes(self):
+        store = ConfigSnapshotStore(self.file_path)
+        self.assertFalse(store.put("project/other", 2, {"b": object()}))
+
+        self.assertIsNone(store.get("project/other"))
+        self.assertTrue(store.put("project/config", 1, {"a": 1}))
+        self.assertEqual(1, ConfigSnapshotStore(self.file_path).get("project/config").modify_index)
+
+
+class RejectingListener(TestListener):
+    def on_update(self, new_config: dict) -> bool:
+        return new_config.get("valid", True) and super().on_update(new_config)
+
+
+class WarmStartTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = ConfigSnapshotStore(os.path.join(self.directory.name, "snapshot.json"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_task(self, transport, listener: TestListener) -> KVWatcherTask:
+        client = ConsulClient(EndpointConfig(transport=transport))
+        return KVWatcherTask(listener, client, timedelta(seconds=1), Event(), snapshot_store=self.store)
+
+    def test_listener_is_initialized_without_consul(self):
+        self.store.put("project/dev/feature/service/config", 10, {"a": 1})
+        transport = UnreachableTransport()
+        listener = TestListener()
+        task = self.create_task(transport, listener)
+
+        self.assertTrue(task.warm_start())
+        self.assertFalse(task.warm_start())
+        task.check()
+
+        self.assertEqual([{"a": 1}], listener.configs)
+        self.assertEqual(1, transport.requests)
+
+    def test_live_fetch_reconciles_the_snapshot(self):
+        self.store.put("project/dev/feature/service/config", 10, {"a": 1})
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10), kv_response({"a": 2}, 12, 12)])
+        listener = TestListener()
+        task = self.create_task(transport, listener)
+
+        task.check()
+        self.assertEqual([{"a": 1}], listener.configs)
+
+        task.check()
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+        self.assertEqual(12, self.store.get("project/dev/feature/service/config").modify_index)
+
+    def test_snapshot_is_written_without_warm_start(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10)])
+        self.create_task(transport, TestListener()).check()
+
+        entry = self.store.get("project/dev/feature/service/config")
+        self.assertEqual(10, entry.modify_index)
+        self.assertEqual({"a": 1}, entry.config)
+
+    def test_rejected_config_is_not_stored_with_dispatcher(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10), kv_response({"valid": False}, 12, 12)])
+        dispatcher = ListenerDispatcher(workers=1)
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVWatcherTask(RejectingListener(), client, timedelta(seconds=1), Event(), dispatcher=dispatcher,
+                             snapshot_store=self.store)
+
+        task.check()
+        deadline = time.monotonic() + 2
+        while task.applied_modify_index != 10 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        task.check()
+        dispatcher.stop()
+
+        entry = ConfigSnapshotStore(self.store.file_path).get("project/dev/feature/service/config")
+        self.assertEqual(10, entry.modify_index)
+        self.assertEqual({"a": 1}, entry.config)
+
+    def test_debounced_config_is_stored_once_it_was_delivered(self):
+        transport = ScriptedTransport([kv_response({"a": 1}, 10, 10), kv_response({"a": 2}, 12, 12)])
+        listener = TestListener()
+        debounced = DebouncedConfigUpdateListener(listener, quiet_period=timedelta(seconds=10),
+                                                  max_delay=timedelta(seconds=10))
+        task = self.create_task(transport, debounced)
+
+        task.check()
+        task.check()
+        self.assertEqual(10, self.store.get("project/dev/feature/service/config").modify_index)
+
+        debounced.stop()
+        self.assertEqual([{"a": 1}, {"a": 2}], listener.configs)
+        self.assertEqual(12, self.store.get("project/dev/feature/service/config").modify_index)
+
+    def test_prefix_watcher(self):
+        self.store.put("project/dev/a", 3, {"a": 1})
+        transport = ScriptedTransport([kv_list_response([kv_entry("project/dev/a", {"a": 1}, 3),
+                                                         kv_entry("project/dev/b", {"b": 1}, 4)], 4)])
+        listener_a = TestListener("project/dev/a")
+        listener_b = TestListener("project/dev/b")
+        client = ConsulClient(EndpointConfig(transport=transport))
+        task = KVPrefixWatcherTask("project/dev", [listener_a, listener_b], client, timedelta(seconds=1), Event(),
+                                   snapshot_store=self.store)
+
+        self.assertEqual(1, task.warm_start())
+        task.check()
+
+        self.assertEqual([{"a": 1}], listener_a.configs)
+        self.assertEqual([{"b": 1}], listener_b.configs)
+        self.assertEqual(4, ConfigSnapshotStore(self.store.file_path).get("project/dev/b").modify_index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import base64
+import json
+import unittest
+
+from counselor.client import ConsulClient
+from counselor.discovery import ServiceDiscovery
+from counselor.endpoint.decoder import JsonArrayStreamDecoder
+from counselor.endpoint.http_client import HttpStreamResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+def split(payload: bytes, size: int):
+    return [payload[i:i + size] for i in range(0, len(payload), size)]
+
+
+class StreamTransport:
+    """Return the payload in small chunks and remember whether the response was closed."""
+
+    def __init__(self, payload: bytes, status_code=200, chunk_size=7):
+        self.payload = payload
+        self.status_code = status_code
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def get_stream(self, uri) -> HttpStreamResponse:
+        return HttpStreamResponse(self.status_code, {}, iter(split(self.payload, self.chunk_size)), self.close)
+
+    def close(self):
+        self.closed = True
+
+
+class JsonArrayStreamDecoderTests(unittest.TestCase):
+
+    def test_items_are_yielded_for_any_chunk_size(self):
+        items = [{"a": 1, "text": "ä, ] }"}, [1, 2], "x", 12345, 1.5, True, None, {}]
+        payload = json.dumps(items).encode()
+
+        for size in (1, 2, 3, 5, 64, len(payload)):
+            decoder = JsonArrayStreamDecoder()
+            self.assertEqual(items, list(decoder.decode_stream(split(payload, size))), size)
+
+    def test_empty_array(self):
+        self.assertEqual([], list(JsonArrayStreamDecoder().decode_stream([b' [ ', b'] '])))
+
+    def test_invalid_payloads(self):
+        for payload in (b'{"a": 1}', b'[1, 2', b'[1 2]', b'[1]]', b'[{"a": }]'):
+            decoder = JsonArrayStreamDecoder()
+            with self.assertRaises(ValueError, msg=payload):
+                list(decoder.decode_stream(split(payload, 2)))
+            self.assertFalse(decoder.successful)
+
+    def test_buffer_only_holds_the_current_item(self):
+        decoder = JsonArrayStreamDecoder()
+        decoder.feed(b'[{"a": 1}, {"b": 2}, {"c"')
+        self.assertEqual('{"c"', decoder._buffer)
+
+
+class KVStreamTests(unittest.TestCase):
+
+    def test_recursive_stream(self):
+        entries = [{"Key": "p/{}".format(i), "ModifyIndex": i,
+                    "Value": base64.b64encode(json.dumps({"i": i}).encode()).decode()} for i in range(20)]
+        transport = StreamTransport(json.dumps(entries).encode())
+        service_discovery = ServiceDiscovery(ConsulClient(EndpointConfig(transport=transport)))
+
+        response, configs = service_discovery.iter_config_recursively("p")
+
+        self.assertTrue(response.successful)
+        self.assertFalse(transport.closed)
+        self.assertEqual([{"i": i} for i in range(20)], list(configs))
+        self.assertTrue(transport.closed)
+
+    def test_failed_stream(self):
+        transport = StreamTransport(b'not found', status_code=404)
+        client = ConsulClient(EndpointConfig(transport=transport))
+
+        response, kv_iterator = client.kv.get_recursive_stream("p")
+
+        self.assertFalse(response.successful)
+        self.assertEqual(b'not found', response.message)
+        self.assertIsNone(kv_iterator)
+        self.assertTrue(transport.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import base64
+import json
+import unittest
+
+from counselor.client import ConsulClient
+from counselor.endpoint.entity import KVOperation
+from counselor.endpoint.http_client import HttpResponse
+from counselor.endpoint.http_endpoint import EndpointConfig
+
+
+class TxnTransport:
+    """Answer transactions like Consul does and fail every operation on a key that starts with 'conflict'."""
+
+    def __init__(self):
+        self.transactions = []
+
+    def put(self, uri, data=None, headers=None) -> HttpResponse:
+        self.transactions.append((uri, data))
+
+        errors = []
+        results = []
+        for i, op in enumerate(data):
+            kv = op["KV"]
+            if kv["Key"].startswith("conflict"):
+                errors.append({"OpIndex": i, "What": "current modify index 5 does not match 1"})
+            elif not kv["Verb"].startswith("delete"):
+                results.append({"KV": {"Key": kv["Key"], "Value": None, "ModifyIndex": 10 + i}})
+
+        if errors:
+            return HttpResponse(409, json.dumps({"Results": None, "Errors": errors}).encode(), {})
+        return HttpResponse(200, json.dumps({"Results": results, "Errors": None}).encode(), {})
+
+
+class TxnTests(unittest.TestCase):
+
+    def test_operations_are_split_into_transactions(self):
+        transport = TxnTransport()
+        client = ConsulClient(EndpointConfig(transport=transport))
+        operations = [KVOperation.new_set("key/{}".format(i), {"i": i}) for i in range(150)]
+
+        response, results = client.kv.write_batch(operations)
+
+        self.assertTrue(response.successful)
+        self.assertEqual([64, 64, 22], [len(data) for _, data in transport.transactions])
+        self.assertTrue(transport.transactions[0][0].endswith("/v1/txn"))
+        self.assertEqual(150, len(results))
+        self.assertTrue(all(r.successful for r in results))
+        self.assertEqual(11, results[1].kv.modify_index)
+
+        encoded_value = transport.transactions[0][1][3]["KV"]["Value"]
+        self.assertEqual({"i": 3}, json.loads(base64.b64decode(encoded_value)))
+
+    def test_results_per_operation(self):
+        client = ConsulClient(EndpointConfig(transport=TxnTransport()))
+        operations = [KVOperation.new_delete("a"),
+                      KVOperation.new_cas("b", {"b": 1}, 3),
+                      KVOperation.new_set("c", "plain"),
+                      KVOperation.new_cas("conflict", {}, 1),
+                      KVOperation.new_delete_tree("d")]
+
+        response, results = client.kv.write_batch(operations, max_operations=3)
+
+        self.assertFalse(response.successful)
+        self.assertEqual(409, response.kind)
+        self.assertEqual([True, True, True, False, False], [r.successful for r in results])
+        self.assertIsNone(results[0].kv)
+        self.assertEqual(11, results[1].kv.modify_index)
+        self.assertIn("does not match", results[3].error)
+        self.assertEqual("Transaction was rolled back", results[4].error)
+
+    def test_cas_needs_index(self):
+        client = ConsulClient(EndpointConfig(transport=TxnTransport()))
+        with self.assertRaises(ValueError):
+            client.txn.execute([KVOperation(KVOperation.CAS, "a", {})])
+
+    def test_invalid_operation_is_rejected_before_the_first_chunk(self):
+        transport = TxnTransport()
+        client = ConsulClient(EndpointConfig(transport=transport))
+        operations = [KVOperation.new_set("key/{}".format(i), {"i": i}) for i in range(70)]
+        operations.append(KVOperation(KVOperation.CAS, "key/invalid", {}))
+
+        with self.assertRaises(ValueError):
+            client.kv.write_batch(operations)
+
+        self.assertEqual([], transport.transactions)
+
+
+if __name__ == '__main__':
+    unittest.main()